@@ -1,6 +1,6 @@
 # app.py
 
-from dash import Dash, html
+from dash import Dash, html, dcc, Input, Output, State, no_update
 import dash
 import dash_bootstrap_components as dbc
 from flask_caching import Cache
@@ -17,29 +17,67 @@ cache = Cache(app.server, config={
 })
 app.server.config["APP_CACHE"] = cache
 
+# Jeu de données (projet) actif de chaque requête : choix de session (cookie) ou ?d=<nom>
+from services.datasets import (
+    DATASET_COOKIE, DATASET_COOKIE_MAX_AGE, DATASET_PARAM, current_dataset, get_dataset, list_datasets,
+    register_dataset_selection
+)
+register_dataset_selection(server)
+
+# Routes HTTP des images (originales, dérivés, rendus) avec cache navigateur
+from services.image_server import register_image_routes
+register_image_routes(server)
+
 # 🔽 Génération dynamique des liens vers toutes les pages
 nav_links = [
     dbc.NavItem(dbc.NavLink(page["name"], href=page["path"]))
     for page in dash.page_registry.values()
 ]
 
-app.layout = html.Div([
-    dbc.Navbar(
-        dbc.Container([
-            dbc.NavbarBrand("🚗 Appli d'annotation pour modèle", className="navbar-brand"),
-            dbc.Nav(nav_links, className="ms-auto"),
-        ]), color="primary", dark=True
-    ),
-    dbc.Container([dash.page_container], fluid=True)
-])
+def serve_layout():
+    # Fonction : le sélecteur reflète le jeu de données de la session à chaque chargement
+    return html.Div([
+        dcc.Location(id="dataset-reload", refresh=True),
+        dbc.Navbar(
+            dbc.Container([
+                dbc.NavbarBrand("🚗 Appli d'annotation pour modèle", className="navbar-brand"),
+                dcc.Dropdown(
+                    id="dataset-select",
+                    options=list_datasets(),
+                    value=current_dataset().name,
+                    clearable=False,
+                    style={"width": "220px"},
+                ),
+                dbc.Nav(nav_links, className="ms-auto"),
+            ]), color="primary", dark=True
+        ),
+        dbc.Container([dash.page_container], fluid=True)
+    ])
+
+app.layout = serve_layout
+
+@app.callback(
+    Output("dataset-reload", "href"),
+    Input("dataset-select", "value"),
+    State("dataset-reload", "pathname"),
+    prevent_initial_call=True
+)
+def _select_dataset(name, pathname):
+    """Mémorise le jeu choisi pour la session puis recharge la page dans ce jeu."""
+    if not name or get_dataset(name) is None or name == current_dataset().name:
+        return no_update
+    dash.callback_context.response.set_cookie(
+        DATASET_COOKIE, name, max_age=DATASET_COOKIE_MAX_AGE, samesite="Lax")
+    return f"{pathname or '/'}?{DATASET_PARAM}={name}"
 
 # Raccorde les callbacks
 from pages import annotate as pg_annotate, review as pg_review, stats as pg_stats
-from pages import leFutur as pg_lefutur
+from pages import leFutur as pg_lefutur  # léger : la pile ML est importée à la demande
 pg_annotate.register_callbacks(app)
 pg_review.register_callbacks(app)
 pg_stats.register_callbacks(app)
-pg_lefutur.register_callbacks(app)
+if pg_lefutur.ML_ENABLED:
+    pg_lefutur.register_callbacks(app)
 
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,107 @@
+/* Callbacks côté navigateur de la page Annoter : interactions purement UI,
+   le serveur ne reçoit plus que les sauvegardes. */
+
+function isRect(obj) {
+    var type = String(obj.type || "").toLowerCase();
+    return type.indexOf("rect") !== -1 || obj.tool === "rectangle" || obj.shape === "rectangle";
+}
+
+/* Composant Dash HTML (équivalent de html.<type>(children, **props)) */
+function h(type, props, children) {
+    props = Object.assign({}, props || {});
+    if (children !== undefined) {
+        props.children = children;
+    }
+    return {namespace: "dash_html_components", type: type, props: props};
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    annotate: {
+        nav: function(next_n, prev_n, idx, count) {
+            var triggered = dash_clientside.callback_context.triggered;
+            var trigger = triggered && triggered.length ? triggered[0].prop_id.split(".")[0] : null;
+            idx = idx || 0;
+            if (!count) {
+                return 0;
+            }
+            if (trigger === "next-image") {
+                idx = Math.min(idx + 1, count - 1);
+            } else if (trigger === "prev-image") {
+                idx = Math.max(idx - 1, 0);
+            }
+            return idx;
+        },
+
+        clear_canvas: function(n_clicks) {
+            return '{"objects": []}';
+        },
+
+        show_rectangles: function(n_clicks, json_data) {
+            if (typeof json_data === "string") {
+                return json_data;
+            }
+            return json_data ? JSON.stringify(json_data) : '{"objects": []}';
+        },
+
+        debug_canvas: function(json_data) {
+            if (!json_data) {
+                return "Canvas vide";
+            }
+            if (typeof json_data === "string") {
+                try {
+                    json_data = JSON.parse(json_data);
+                } catch (e) {
+                    return "Erreur parsing JSON: " + json_data.slice(0, 50) + "...";
+                }
+            }
+
+            var objects = json_data.objects || [];
+            if (!objects.length) {
+                return "Aucun objet sur le canvas • Dessinez un rectangle sur l'image";
+            }
+
+            var debugInfo = [];
+            var rectangles = [];
+            objects.forEach(function(obj, i) {
+                debugInfo.push("Objet " + (i + 1) + ": type='" + (obj.type || "unknown") +
+                               "', tool='" + (obj.tool || "unknown") + "'");
+                if (isRect(obj)) {
+                    rectangles.push(obj);
+                }
+            });
+
+            var result = [
+                h("Strong", {}, objects.length + " objet(s) total, " + rectangles.length + " rectangle(s)")
+            ];
+            if (rectangles.length) {
+                result.push(h("Div", {className: "mt-2 text-success"}, "✅ Rectangles détectés:"));
+                result.push(h("Ul", {}, rectangles.map(function(rect, i) {
+                    var coords = ["left", "top", "width", "height"].filter(function(c) {
+                        return c in rect;
+                    }).map(function(c) {
+                        return c + "=" + Math.round(rect[c]);
+                    });
+                    return h("Li", {}, "Rectangle " + (i + 1) + ": " + coords.join(", "));
+                })));
+            } else {
+                result.push(h("Div", {className: "text-info"}, "ℹ️ Objets détectés mais aucun rectangle reconnu"));
+                result.push(h("Details", {}, [
+                    h("Summary", {}, "Voir détails objets"),
+                    h("Ul", {}, debugInfo.map(function(info) {
+                        return h("Li", {}, h("Code", {}, info));
+                    }))
+                ]));
+            }
+            return h("Div", {}, result);
+        },
+
+        canvas_color: function(annotator_data, colors) {
+            colors = colors || {};
+            var fallback = colors["default"] || "#FF0000";
+            if (annotator_data && annotator_data.name) {
+                return colors[annotator_data.name.toLowerCase()] || fallback;
+            }
+            return "#FF0000";
+        }
+    }
+});
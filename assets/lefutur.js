@@ -0,0 +1,62 @@
+/* Page Le Futur : les détections (JSON) sont dessinées par Plotly par-dessus l'image
+   envoyée, que le navigateur possède déjà. Seules les photos avec une orientation EXIF
+   sont réencodées par le serveur (background), redressées comme pour l'inférence. */
+
+function lefuturLabel(x, y, text, color, yanchor) {
+    return {
+        x: x, y: y, xref: "x", yref: "y", text: text, showarrow: false,
+        xanchor: "left", yanchor: yanchor, font: {color: color, size: 13},
+        bgcolor: "rgba(255,255,255,0.6)"
+    };
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    lefutur: {
+        overlay_figure: function(result, contents, background) {
+            var hidden = {display: "none"};
+            if (!result || !contents || !result.image_size) {
+                return [{data: [], layout: {}}, hidden];
+            }
+            var w = result.image_size[0], h = result.image_size[1];
+            var shapes = [], annotations = [];
+            (result.detections || []).forEach(function(d, i) {
+                var x1 = d.box[0], y1 = d.box[1], x2 = d.box[2], y2 = d.box[3];
+                shapes.push({type: "rect", xref: "x", yref: "y", x0: x1, y0: y1, x1: x2, y1: y2,
+                             line: {color: "red", width: 3}});
+                annotations.push(lefuturLabel(x1, y1, d.label + " " + d.score.toFixed(2), "red", "bottom"));
+
+                var pi = (result.plate_infos || [])[i];
+                if (pi && pi.plate_box) {
+                    // Boîte de plaque relative à la voiture
+                    var px1 = x1 + pi.plate_box[0], py1 = y1 + pi.plate_box[1];
+                    var px2 = x1 + pi.plate_box[2], py2 = y1 + pi.plate_box[3];
+                    shapes.push({type: "rect", xref: "x", yref: "y", x0: px1, y0: py1, x1: px2, y1: py2,
+                                 line: {color: "yellow", width: 2}});
+                    annotations.push(lefuturLabel(px1, py1, "Plaque: " + (pi.plate_text || "?"), "#b8860b", "bottom"));
+                }
+                var bi = (result.brand_infos || [])[i];
+                if (bi && bi.brand) {
+                    annotations.push(lefuturLabel(x1, y2, "Marque: " + bi.brand + " (" +
+                        bi.confidence.toFixed(2) + ") [" + (bi.source || "") + "]", "blue", "top"));
+                }
+            });
+
+            var figure = {
+                data: [],
+                layout: {
+                    images: [{source: background || contents, xref: "x", yref: "y", x: 0, y: 0, sizex: w, sizey: h,
+                              sizing: "stretch", layer: "below"}],
+                    shapes: shapes,
+                    annotations: annotations,
+                    xaxis: {range: [0, w], visible: false, showgrid: false},
+                    // Axe y inversé : coordonnées image (origine en haut à gauche)
+                    yaxis: {range: [h, 0], visible: false, showgrid: false, scaleanchor: "x"},
+                    margin: {l: 0, r: 0, t: 0, b: 0},
+                    plot_bgcolor: "white",
+                    dragmode: "pan"
+                }
+            };
+            return [figure, {display: "block", height: "75vh"}];
+        }
+    }
+});
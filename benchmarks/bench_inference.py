@@ -0,0 +1,185 @@
+"""
+Benchmark des étapes de "Le Futur" sur images synthétiques, sans réseau.
+
+    python -m benchmarks.bench_inference --runs 20 --size 1920x1080 --json bench_inference.json
+    python -m benchmarks.bench_inference --baseline bench_inference.json --tolerance 0.25
+
+Par défaut, les modèles sont remplacés par des substituts réduits à poids aléatoires
+(benchmarks/standin_models.py) ; ``--real-models`` utilise les vrais (téléchargement ou cache HF).
+Chaque étape est mesurée isolément sur des entrées fixes : décodage (parse_contents),
+détection, YOLO plaque, prétraitement plaque (CLAHE + Otsu), OCR, marque, dessin,
+encodage PNG, puis le pipeline complet. Rapport : p50/p95 et mémoire (RSS) par étape.
+Avec ``--baseline``, le code de sortie vaut 1 si un p95 régresse au-delà de la tolérance.
+"""
+import io
+import os
+import sys
+import json
+import time
+import base64
+import random
+import argparse
+import resource
+
+# Mesures sans cache de résultats ; la page est importée sans s'enregistrer dans Dash
+os.environ["TURVOI_INFERENCE_CACHE_SIZE"] = "0"
+os.environ["TURVOI_ENABLE_ML"] = "0"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+def synthetic_image(width: int, height: int, seed: int = 0) -> Image.Image:
+    """Fond bruité avec quelques formes de type voiture/plaque (contenu compressible réaliste)."""
+    rng = random.Random(seed)
+    img = Image.effect_noise((width, height), 40).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    for _ in range(6):
+        x, y = rng.randrange(width // 2), rng.randrange(height // 2)
+        w, h = rng.randrange(width // 6, width // 2), rng.randrange(height // 6, height // 2)
+        draw.rectangle([x, y, x + w, y + h], fill=tuple(rng.randrange(256) for _ in range(3)))
+        draw.rectangle([x + w // 3, y + h * 3 // 4, x + w * 2 // 3, y + h * 5 // 6], fill=(235, 235, 235))
+    return img
+
+def to_data_url(img: Image.Image) -> str:
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=90)
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+def synthetic_detections(width: int, height: int, count: int):
+    """Boîtes fixes (indépendantes du détecteur) pour les étapes en aval."""
+    detections, plate_infos, brand_infos = [], [], []
+    for i in range(count):
+        x1 = width * (0.05 + 0.9 * i / count)
+        x2 = x1 + width * 0.8 / count
+        box = [x1, height * 0.3, x2, height * 0.85]
+        cw, ch = box[2] - box[0], box[3] - box[1]
+        detections.append({"box": box, "label": "car", "score": 0.9})
+        plate_infos.append({"plate_box": [int(cw * 0.3), int(ch * 0.7), int(cw * 0.7), int(ch * 0.85)],
+                            "plate_text": "AB-123-CD"})
+        brand_infos.append({"brand": "Renault", "confidence": 0.8, "source": "CarViT"})
+    return detections, plate_infos, brand_infos
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float("nan")
+
+def peak_rss_mb() -> float:
+    # ru_maxrss : Ko sous Linux, octets sous macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def measure(fn, runs: int, warmup: int = 1):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "p50_ms": timings[len(timings) // 2] * 1000,
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+        "mean_ms": sum(timings) / len(timings) * 1000,
+        "rss_mb": current_rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def build_stages(inference, lefutur, width: int, height: int, cars: int):
+    import numpy as np
+
+    img = synthetic_image(width, height)
+    data_url = to_data_url(img)
+    detections, plate_infos, brand_infos = synthetic_detections(width, height, cars)
+    crops = inference.crop_detections(img, detections)
+    plate_crops = [c.crop(tuple(p["plate_box"])) for c, p in zip(crops, plate_infos)]
+    plates = [inference.preprocess_plate(p) for p in plate_crops]
+
+    def encode_png():
+        buffer = io.BytesIO()
+        lefutur.draw_boxes(img.copy(), detections, plate_infos, brand_infos).save(buffer, format="PNG")
+        base64.b64encode(buffer.getvalue())
+
+    return {
+        "decode": lambda: lefutur.parse_contents(data_url),
+        "detect": lambda: inference.run_inference_cars([img], 0.05, cached=False),
+        "plate_detect": lambda: inference.models.get("plate").predict(
+            source=[np.array(c) for c in crops], verbose=False),
+        "plate_preprocess": lambda: [inference.preprocess_plate(p) for p in plate_crops],
+        "ocr": lambda: inference.read_plates_trocr_batch(plates),
+        "brand": lambda: inference.identify_car_brands(crops),
+        "draw": lambda: lefutur.draw_boxes(img.copy(), detections, plate_infos, brand_infos),
+        "encode_png": encode_png,
+        "pipeline": lambda: inference.analyze_images([img], score_threshold=0.05, multi_car=True),
+    }
+
+def compare_to_baseline(results, baseline_path: str, tolerance: float) -> list:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["stages"]
+    regressions = []
+    for stage, stats in results.items():
+        ref = baseline.get(stage)
+        if ref and stats["p95_ms"] > ref["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{stage}: p95 {stats['p95_ms']:.1f} ms > {ref['p95_ms']:.1f} ms (+{tolerance:.0%})")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--size", default="1920x1080", help="taille des images synthétiques (LxH)")
+    parser.add_argument("--cars", type=int, default=2, help="voitures par image pour les étapes en aval")
+    parser.add_argument("--stages", nargs="+", help="sous-ensemble d'étapes à mesurer")
+    parser.add_argument("--real-models", action="store_true")
+    parser.add_argument("--threads", type=int, default=1, help="threads torch (1 : mesures stables en CI)")
+    parser.add_argument("--json", dest="json_path")
+    parser.add_argument("--baseline", help="résultats JSON de référence")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    import torch
+    from services import inference
+    from pages import leFutur as lefutur
+    torch.set_num_threads(args.threads)
+    if not args.real_models:
+        from benchmarks import standin_models
+        standin_models.install(inference)
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    start = time.perf_counter()
+    inference.models.warmup(background=False)
+    load_s = time.perf_counter() - start
+    stages = build_stages(inference, lefutur, width, height, args.cars)
+    selected = args.stages or list(stages)
+
+    results = {}
+    print(f"{'étape':<18}{'p50':>10}{'p95':>10}{'RSS':>10}{'pic RSS':>10}")
+    for name in selected:
+        stats = measure(stages[name], args.runs)
+        results[name] = stats
+        print(f"{name:<18}{stats['p50_ms']:>8.1f}ms{stats['p95_ms']:>8.1f}ms"
+              f"{stats['rss_mb']:>8.0f}Mo{stats['peak_rss_mb']:>8.0f}Mo")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "size": [width, height], "cars": args.cars, "runs": args.runs, "threads": args.threads,
+                "models": "real" if args.real_models else "stand-in", "load_s": load_s,
+                # Les substituts tournent toujours en PyTorch
+                "backend": inference.INFERENCE_BACKEND if args.real_models else "torch", "stages": results,
+            }, f, indent=2)
+    if args.baseline:
+        regressions = compare_to_baseline(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"RÉGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
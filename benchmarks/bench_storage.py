@@ -0,0 +1,177 @@
+"""
+Benchmark de la couche de stockage (annotations JSON et CSV) sur un jeu généré par
+benchmarks/generate_dataset.py.
+
+    python -m benchmarks.generate_dataset --preset 100k --out /tmp/turvoi-100k
+    python -m benchmarks.bench_storage --dataset /tmp/turvoi-100k --json storage-100k.json
+
+Le jeu est copié dans un dossier temporaire (les écritures ne le modifient pas), qui
+devient le dossier courant : les chemins relatifs "data/..." des services y pointent.
+Pour chaque opération : débit, latences p50/p95/p99, pic d'allocation Python
+(tracemalloc, passe séparée) et RSS ; sortie JSON pour le suivi des tendances.
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import platform
+import subprocess
+import tracemalloc
+from contextlib import redirect_stdout
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# Opérations lourdes (parcours complet) : moins d'itérations par défaut
+HEAVY_OPERATIONS = {"get_annotator_stats", "to_coco", "iaa_summary"}
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float("nan")
+
+def percentile(sorted_values, q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+def build_operations(rng: random.Random):
+    """Opérations mesurées ; chacune tire ses paramètres au hasard dans le jeu courant."""
+    from services import json_annotations as ja
+    from services.annotation_io import load_annotations as load_csv, IMAGES_DIR as CSV_IMAGES_DIR
+    from services.export_coco import to_coco
+    from services.stats import iaa_summary
+
+    snapshot = ja.get_all_annotations()
+    images = sorted({a["image"] for a in snapshot})
+    originals = [a["id"] for a in snapshot if not a.get("is_modification")]
+    annotators = ["remi", "leslie", "yvab", "user1"]
+
+    def rects():
+        return [{"x": rng.randint(0, 800), "y": rng.randint(0, 600), "width": rng.randint(40, 300),
+                 "height": rng.randint(30, 200)} for _ in range(rng.randint(1, 4))]
+
+    def update():
+        annotation_id = rng.choice(originals)
+        current = ja.get_annotation_by_id(annotation_id)
+        ja.update_annotation(annotation_id, current["rectangles"] + rects()[:1], rng.choice(annotators), 1)
+
+    return {
+        "add_annotation": lambda: ja.add_annotation(rng.choice(images), rng.choice(annotators), rects()),
+        "update_annotation": update,
+        "get_annotations_for_image": lambda: ja.get_annotations_for_image(rng.choice(images)),
+        "get_final_annotations_for_image": lambda: ja.get_final_annotations_for_image(rng.choice(images)),
+        "get_annotator_stats": ja.get_annotator_stats,
+        "to_coco": lambda: to_coco(load_csv(), CSV_IMAGES_DIR),
+        "iaa_summary": iaa_summary,
+    }
+
+def run_operation(fn, iterations: int, warmup: int = 1) -> dict:
+    sink = io.StringIO()  # certaines fonctions journalisent chaque appel
+    with redirect_stdout(sink):
+        for _ in range(warmup):
+            fn()
+        rss_before = rss_mb()
+        timings = []
+        start_total = time.perf_counter()
+        for _ in range(iterations):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        total = time.perf_counter() - start_total
+        rss_after = rss_mb()
+
+        # Passe séparée sous tracemalloc (qui ralentit les mesures de temps)
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        sink.truncate(0)
+
+    timings.sort()
+    return {
+        "iterations": iterations,
+        "ops_per_s": iterations / total if total else None,
+        "mean_ms": sum(timings) / len(timings) * 1000,
+        "p50_ms": percentile(timings, 0.50) * 1000,
+        "p95_ms": percentile(timings, 0.95) * 1000,
+        "p99_ms": percentile(timings, 0.99) * 1000,
+        "max_ms": timings[-1] * 1000,
+        "peak_alloc_mb": peak / (1024 * 1024),
+        "rss_mb": rss_after,
+        "rss_delta_mb": rss_after - rss_before,
+    }
+
+def dataset_summary(data_dir: str) -> dict:
+    with open(os.path.join(data_dir, "annotations.json"), encoding="utf-8") as f:
+        annotations = json.load(f)["annotations"]
+    return {
+        "annotations": len(annotations),
+        "modifications": sum(1 for a in annotations if a.get("is_modification")),
+        "boxes": sum(len(a["rectangles"]) for a in annotations),
+        "images": len({a["image"] for a in annotations}),
+        "json_mb": os.path.getsize(os.path.join(data_dir, "annotations.json")) / (1024 * 1024),
+        "csv_mb": os.path.getsize(os.path.join(data_dir, "annotations.csv")) / (1024 * 1024),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", required=True, help="dossier produit par generate_dataset (contient data/)")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--heavy-iterations", type=int, default=3)
+    parser.add_argument("--operations", nargs="+", help="sous-ensemble d'opérations")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args(argv)
+
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+    summary = dataset_summary(os.path.join(args.dataset, "data"))
+    workdir = tempfile.mkdtemp(prefix="turvoi-bench-")
+    try:
+        shutil.copytree(os.path.join(args.dataset, "data"), os.path.join(workdir, "data"), symlinks=True)
+        os.chdir(workdir)
+        rng = random.Random(args.seed)
+        operations = build_operations(rng)
+        selected = args.operations or list(operations)
+
+        print(f"Jeu : {summary['annotations']} annotations, {summary['boxes']} boîtes, "
+              f"{summary['images']} images ({summary['json_mb']:.1f} Mo JSON)")
+        print(f"{'opération':<34}{'ops/s':>9}{'p50':>10}{'p95':>10}{'p99':>10}{'pic alloc':>11}")
+        results = {}
+        for name in selected:
+            iterations = args.heavy_iterations if name in HEAVY_OPERATIONS else args.iterations
+            stats = run_operation(operations[name], iterations)
+            results[name] = stats
+            print(f"{name:<34}{stats['ops_per_s']:>9.1f}{stats['p50_ms']:>8.1f}ms{stats['p95_ms']:>8.1f}ms"
+                  f"{stats['p99_ms']:>8.1f}ms{stats['peak_alloc_mb']:>9.1f}Mo")
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "dataset": summary,
+                "results": results,
+            }, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Comparaison des moteurs d'inférence de "Le Futur" (latence CPU et écart de résultats).
+
+    python -m benchmarks.compare_backends --backends torch torch-int8 onnx onnx-int8 --limit 20
+
+Le premier moteur sert de référence pour la précision : rappel des voitures (IoU >= 0.5),
+IoU moyenne des boîtes appariées, accord sur la marque et sur le texte des plaques.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+# Le cache de résultats fausserait les mesures
+os.environ["TURVOI_INFERENCE_CACHE_SIZE"] = "0"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image  # noqa: E402
+from services.json_annotations import IMAGES_DIR  # noqa: E402
+from utils.geometry import iou, greedy_match_iou  # noqa: E402
+
+def load_images(images_dir, limit):
+    names = sorted(f for f in os.listdir(images_dir) if f.lower().endswith((".jpg", ".jpeg", ".png")))[:limit]
+    return names, [Image.open(os.path.join(images_dir, n)).convert("RGB") for n in names]
+
+def use_backend(inference, backend):
+    """Bascule le module d'inférence sur ``backend`` (nouveau registre, CPU uniquement)."""
+    import torch
+    inference.INFERENCE_BACKEND = inference.resolve_backend(backend)
+    inference.device = torch.device("cpu")
+    inference.models = inference.create_registry()
+    return inference.INFERENCE_BACKEND
+
+def run_backend(inference, images, repeat):
+    """Charge les modèles puis mesure chaque étape image par image."""
+    start = time.perf_counter()
+    inference.models.warmup(background=False)
+    load_s = time.perf_counter() - start
+    # Première passe non mesurée (allocation, optimisation des graphes)
+    inference.analyze_images(images[:1])
+
+    timings = {"cars": [], "plates": [], "brands": [], "total": []}
+    outputs = []
+    for pil in images:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            detections = inference.run_inference_cars([pil], 0.6)[0]
+            t1 = time.perf_counter()
+            crops = inference.crop_detections(pil, detections)
+            plate_infos = inference.detect_plates_yolo(crops)
+            t2 = time.perf_counter()
+            brand_infos = inference.identify_car_brands(crops)
+            t3 = time.perf_counter()
+            timings["cars"].append(t1 - t0)
+            timings["plates"].append(t2 - t1)
+            timings["brands"].append(t3 - t2)
+            timings["total"].append(t3 - t0)
+        outputs.append({"detections": detections, "plate_infos": plate_infos, "brand_infos": brand_infos})
+    return load_s, timings, outputs
+
+def compare_outputs(reference, candidate):
+    """Écart d'un moteur par rapport à la référence, sur l'ensemble des images."""
+    matched, total_ref, ious = 0, 0, []
+    brand_same, plate_same, pairs = 0, 0, 0
+    for ref, cand in zip(reference, candidate):
+        ref_boxes = [d["box"] for d in ref["detections"]]
+        cand_boxes = [d["box"] for d in cand["detections"]]
+        total_ref += len(ref_boxes)
+        mean_iou = greedy_match_iou(ref_boxes, cand_boxes)
+        if mean_iou is not None:
+            ious.append(mean_iou)
+        used = set()
+        for i, rb in enumerate(ref_boxes):
+            best, best_j = 0.0, None
+            for j, cb in enumerate(cand_boxes):
+                v = iou(rb, cb)
+                if j not in used and v > best:
+                    best, best_j = v, j
+            if best_j is None or best < 0.5:
+                continue
+            used.add(best_j)
+            matched += 1
+            pairs += 1
+            rb_info, cb_info = ref["brand_infos"][i], cand["brand_infos"][best_j]
+            brand_same += int((rb_info or {}).get("brand") == (cb_info or {}).get("brand"))
+            rp_info, cp_info = ref["plate_infos"][i], cand["plate_infos"][best_j]
+            plate_same += int((rp_info or {}).get("plate_text") == (cp_info or {}).get("plate_text"))
+    return {
+        "car_recall": matched / total_ref if total_ref else None,
+        "mean_iou": statistics.mean(ious) if ious else None,
+        "brand_agreement": brand_same / pairs if pairs else None,
+        "plate_agreement": plate_same / pairs if pairs else None,
+    }
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "mean_ms": statistics.mean(values) * 1000,
+        "p50_ms": values[len(values) // 2] * 1000,
+        "p95_ms": values[min(len(values) - 1, int(len(values) * 0.95))] * 1000,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["torch", "torch-int8", "onnx", "onnx-int8"])
+    parser.add_argument("--images-dir", default=IMAGES_DIR)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=1, help="passes mesurées par image")
+    parser.add_argument("--threads", type=int, default=0, help="threads torch (0 : défaut)")
+    parser.add_argument("--json", dest="json_path", help="écrit aussi les résultats dans ce fichier")
+    args = parser.parse_args(argv)
+
+    import torch
+    from services import inference
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    names, images = load_images(args.images_dir, args.limit)
+    print(f"{len(images)} images, moteurs : {', '.join(args.backends)}")
+
+    results, reference = [], None
+    for backend in args.backends:
+        effective = use_backend(inference, backend)
+        if effective != backend:
+            print(f"'{backend}' indisponible, ignoré")
+            continue
+        load_s, timings, outputs = run_backend(inference, images, args.repeat)
+        row = {"backend": backend, "load_s": load_s,
+               "latency": {stage: summarize(v) for stage, v in timings.items()}}
+        if reference is None:
+            reference = outputs
+        else:
+            row["accuracy"] = compare_outputs(reference, outputs)
+        results.append(row)
+
+    base = results[0]["latency"]["total"]["mean_ms"] if results else None
+    # Référence : premier moteur réellement mesuré (les moteurs indisponibles sont ignorés)
+    reference_backend = results[0]["backend"] if results else "-"
+    print(f"\n{'moteur':<12}{'chargement':>11}{'voitures':>10}{'plaques':>10}{'marques':>10}"
+          f"{'total p50':>11}{'p95':>9}{'gain':>7}  précision vs {reference_backend}")
+    for row in results:
+        lat = row["latency"]
+        acc = row.get("accuracy")
+        acc_txt = "-" if acc is None else ", ".join(
+            f"{k}={v:.2f}" for k, v in acc.items() if v is not None
+        )
+        print(f"{row['backend']:<12}{row['load_s']:>10.1f}s{lat['cars']['mean_ms']:>8.0f}ms"
+              f"{lat['plates']['mean_ms']:>8.0f}ms{lat['brands']['mean_ms']:>8.0f}ms"
+              f"{lat['total']['p50_ms']:>9.0f}ms{lat['total']['p95_ms']:>7.0f}ms"
+              f"{base / lat['total']['mean_ms']:>6.1f}x  {acc_txt}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"images": names, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
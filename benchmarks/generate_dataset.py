@@ -0,0 +1,152 @@
+"""
+Génère un jeu d'annotations synthétique réaliste pour les benchmarks de stockage :
+data/annotations.json (originales, modifications, historiques, versions) et
+data/annotations.csv (format de annotation_io, JSON dash-canvas), au même schéma que l'application.
+
+    python -m benchmarks.generate_dataset --preset 100k --out /tmp/turvoi-100k
+    python -m benchmarks.generate_dataset --boxes 5000 --out /tmp/turvoi-5k --images-on-disk
+
+Préréglages : 1k, 100k et 1m boîtes.
+"""
+import os
+import json
+import random
+import argparse
+from datetime import datetime, timedelta
+
+PRESETS = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+ANNOTATORS = ["remi", "leslie", "yvab", "demo", "user1", "user2", "user3", "admin", "model"]
+COLORS = {"remi": "#FF0000", "leslie": "#00FF00", "yvab": "#0000FF", "demo": "#FF8000",
+          "user1": "#00FFFF", "user2": "#FFFF00", "user3": "#FF00FF", "admin": "#000000", "model": "#808080"}
+IMAGE_SIZE = (1280, 960)
+# Rectangles en pixels de l'image originale (cf. json_annotations.COORD_SPACE)
+COORD_SPACE = "original"
+# Moyennes observées : ~3 voitures par image, ~1,5 annotateur par image
+MEAN_BOXES_PER_ANNOTATION = 3
+MEAN_ANNOTATIONS_PER_IMAGE = 1.5
+
+def _rectangle(rng: random.Random, color: str, jitter_from: dict = None) -> dict:
+    if jitter_from:
+        # Même voiture vue par un autre annotateur : boîte proche
+        x = max(0, jitter_from["x"] + rng.randint(-12, 12))
+        y = max(0, jitter_from["y"] + rng.randint(-12, 12))
+        w = max(10, jitter_from["width"] + rng.randint(-15, 15))
+        h = max(10, jitter_from["height"] + rng.randint(-15, 15))
+    else:
+        w, h = rng.randint(60, 500), rng.randint(40, 350)
+        x, y = rng.randint(0, IMAGE_SIZE[0] - w), rng.randint(0, IMAGE_SIZE[1] - h)
+    return {"x": x, "y": y, "width": w, "height": h, "color": color}
+
+def generate(total_boxes: int, seed: int = 0, modification_rate: float = 0.15, history_rate: float = 0.2):
+    """Retourne (données JSON, lignes CSV, noms d'images)."""
+    rng = random.Random(seed)
+    n_images = max(1, round(total_boxes / (MEAN_BOXES_PER_ANNOTATION * MEAN_ANNOTATIONS_PER_IMAGE)))
+    images = [f"car{i:07d}.jpg" for i in range(n_images)]
+    start = datetime(2025, 1, 1)
+    annotations, csv_rows = [], []
+    next_id, boxes = 1, 0
+
+    def stamp():
+        return (start + timedelta(seconds=rng.randint(0, 300 * 24 * 3600))).isoformat()
+
+    while boxes < total_boxes:
+        image = rng.choice(images)
+        cars = [_rectangle(rng, "#000000") for _ in range(max(1, round(rng.gauss(MEAN_BOXES_PER_ANNOTATION, 1.2))))]
+        for annotator in rng.sample(ANNOTATORS, 1 if rng.random() < 0.5 else 2):
+            color = COLORS[annotator]
+            rects = [_rectangle(rng, color, c) for c in cars]
+            if annotator == "model":
+                for r in rects:
+                    r["score"] = round(rng.uniform(0.5, 0.99), 3)
+            ann = {"id": next_id, "image": image, "annotator": annotator, "timestamp": stamp(),
+                   "version": 1, "coord_space": COORD_SPACE, "rectangles": rects}
+            next_id += 1
+            boxes += len(rects)
+            if rng.random() < history_rate:
+                # Ajouts successifs depuis la page Review
+                ann["modification_history"] = []
+                for _ in range(rng.randint(1, 3)):
+                    modifier = rng.choice(ANNOTATORS[:-1])
+                    added = [_rectangle(rng, COLORS[modifier])]
+                    ann["rectangles"].extend(added)
+                    boxes += 1
+                    ann["modification_history"].append({
+                        "modifier_name": modifier, "timestamp": stamp(), "rectangles_added": 1,
+                        "total_rectangles_after": len(ann["rectangles"]), "action": "ajout"})
+                ann["last_updated"] = ann["modification_history"][-1]["timestamp"]
+                ann["version"] = 1 + len(ann["modification_history"])
+            annotations.append(ann)
+            csv_rows.append({
+                "id": ann["id"], "image": image, "annotator": annotator, "timestamp": ann["timestamp"],
+                "boxes_json": json.dumps({"objects": [
+                    {"type": "rect", "x": r["x"], "y": r["y"], "left": r["x"], "top": r["y"],
+                     "width": r["width"], "height": r["height"], "stroke": r["color"]} for r in rects
+                ]}),
+            })
+
+            if rng.random() < modification_rate:
+                # Correction complète (entrée de modification) par un autre annotateur
+                modifier = rng.choice([a for a in ANNOTATORS[:-1] if a != annotator])
+                mod_rects = [_rectangle(rng, COLORS[modifier], r) for r in rects]
+                annotations.append({
+                    "id": next_id, "image": image, "annotator": modifier, "timestamp": stamp(),
+                    "version": 1, "coord_space": COORD_SPACE, "rectangles": mod_rects, "is_modification": True,
+                    "modifies_annotation_id": ann["id"]})
+                ann["version"] += 1
+                next_id += 1
+                boxes += len(mod_rects)
+
+    data = {
+        "metadata": {"version": "1.0", "created": start.isoformat(), "last_updated": datetime.now().isoformat(),
+                     "next_id": next_id},
+        "annotations": annotations,
+    }
+    return data, csv_rows, images
+
+def write_dataset(out_dir: str, data: dict, csv_rows: list, images: list, images_on_disk: bool = False):
+    import csv
+
+    data_dir = os.path.join(out_dir, "data")
+    images_dir = os.path.join(data_dir, "cars_detection")
+    os.makedirs(images_dir, exist_ok=True)
+    with open(os.path.join(data_dir, "annotations.json"), "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    with open(os.path.join(data_dir, "annotations.csv"), "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["id", "image", "annotator", "timestamp", "boxes_json"])
+        writer.writeheader()
+        writer.writerows(csv_rows)
+    if images_on_disk:
+        # Petites images réelles (listing, tailles lues par l'export COCO)
+        from PIL import Image
+        placeholder = os.path.join(images_dir, images[0])
+        Image.new("RGB", IMAGE_SIZE, (90, 90, 90)).save(placeholder, quality=30)
+        for name in images[1:]:
+            path = os.path.join(images_dir, name)
+            if not os.path.exists(path):
+                os.link(placeholder, path)
+    return data_dir
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    size = parser.add_mutually_exclusive_group(required=True)
+    size.add_argument("--preset", choices=sorted(PRESETS))
+    size.add_argument("--boxes", type=int)
+    parser.add_argument("--out", required=True, help="dossier de sortie (contiendra data/)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--modification-rate", type=float, default=0.15)
+    parser.add_argument("--history-rate", type=float, default=0.2)
+    parser.add_argument("--images-on-disk", action="store_true",
+                        help="crée aussi les fichiers images (liens durs vers une seule image)")
+    args = parser.parse_args(argv)
+
+    total = PRESETS[args.preset] if args.preset else args.boxes
+    data, csv_rows, images = generate(total, args.seed, args.modification_rate, args.history_rate)
+    data_dir = write_dataset(args.out, data, csv_rows, images, args.images_on_disk)
+    n_mods = sum(1 for a in data["annotations"] if a.get("is_modification"))
+    n_boxes = sum(len(a["rectangles"]) for a in data["annotations"])
+    n_images = len({a["image"] for a in data["annotations"]})
+    print(f"{data_dir} : {n_images} images annotées, {len(data['annotations'])} annotations "
+          f"({n_mods} modifications), {n_boxes} boîtes")
+
+if __name__ == "__main__":
+    main()
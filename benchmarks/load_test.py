@@ -0,0 +1,417 @@
+"""
+Test de charge multi-annotateurs contre les vrais callbacks Dash (/_dash-update-component).
+
+    python -m benchmarks.generate_dataset --boxes 20000 --out /tmp/turvoi-20k --images-on-disk
+    python -m benchmarks.load_test --dataset /tmp/turvoi-20k --annotators 8 --reviewers 4 --stats-tabs 2
+    gunicorn -w 4 app:server   # lancé depuis /tmp/turvoi-20k (PYTHONPATH=<dépôt>)
+    python -m benchmarks.load_test --dataset /tmp/turvoi-20k --url http://127.0.0.1:8000 --duration 60
+
+Sans ``--url``, l'application est chargée dans ce processus (client de test Flask) sur une
+copie temporaire du jeu ; avec ``--url``, un serveur déjà lancé sur le jeu est sollicité
+(pour dimensionner le nombre de workers). Les requêtes sont construites comme celles du
+navigateur, à partir de /_dash-dependencies.
+
+Utilisateurs simulés :
+- annotateurs : chargement de la liste, navigation (le callback de navigation ``nav``
+  s'exécute dans le navigateur, on rejoue donc ``_set_image`` qu'il déclenche) et
+  enregistrements (``_save``) ;
+- relecteurs : tableau, sélection d'une ligne parmi les ``--hot-rows`` premières (contention
+  voulue) puis ajout de rectangles (``save_additions_and_refresh_table``) ;
+- onglets Stats : ``update_stats`` à la période de l'Interval de la page.
+
+Rapport : latences p50/p95/p99 par callback, taux d'erreur, conflits de version et
+mises à jour perdues (écritures confirmées à l'utilisateur mais absentes du fichier final).
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# L'application est importée sans la page ML
+os.environ.setdefault("TURVOI_ENABLE_ML", "0")
+
+UPDATE_PATH = "/_dash-update-component"
+DEPENDENCIES_PATH = "/_dash-dependencies"
+STATS_INTERVAL = 3.0  # période de dcc.Interval("refresh-stats")
+REVIEW_PAGE_SIZE = 10
+
+# Premier output de chaque callback serveur sollicité
+CALLBACKS = {
+    "_load_images": "image-count.data",
+    "_set_image": "canvas.image_content",
+    "_save": "annotate-save-status.children",
+    "update_table": "annotations-table.data",
+    "handle_row_selection": "modification-section.style",
+    "save_additions_and_refresh_table": "review-save-status.children",
+    "update_stats": "graph-per-image.figure",
+}
+
+class TestClientTransport:
+    """Application chargée dans le processus ; un client de test Flask par thread."""
+
+    def __init__(self):
+        from app import server
+        self.server = server
+        self._local = threading.local()
+
+    def _client(self):
+        if not hasattr(self._local, "client"):
+            self._local.client = self.server.test_client()
+        return self._local.client
+
+    def get(self, path):
+        response = self._client().get(path)
+        return response.status_code, response.get_json(silent=True)
+
+    def post(self, path, body):
+        response = self._client().post(path, json=body)
+        return response.status_code, response.get_json(silent=True)
+
+class HttpTransport:
+    """Serveur déjà lancé (Flask, gunicorn...)."""
+
+    def __init__(self, url: str, timeout: float = 60):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.url + path, data=data,
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                payload = response.read()
+                return response.status, json.loads(payload) if payload else None
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+    def get(self, path):
+        return self._request(path)
+
+    def post(self, path, body):
+        return self._request(path, body)
+
+def _split_output(output: str):
+    """Même découpage que dash-renderer : "..a.p...b.q.." -> liste, "a.p" -> dict."""
+    if output.startswith(".."):
+        return [_split_output(part) for part in output[2:-2].split("...")]
+    component_id, prop = output.rsplit(".", 1)
+    return {"id": component_id, "property": prop.split("@")[0]}
+
+def _text(component) -> str:
+    """Texte d'un composant Dash sérialisé (html.Span(...) -> "...")."""
+    if component is None:
+        return ""
+    if isinstance(component, str):
+        return component
+    if isinstance(component, (int, float)):
+        return str(component)
+    if isinstance(component, list):
+        return " ".join(_text(c) for c in component)
+    if isinstance(component, dict):
+        return _text(component.get("props", {}).get("children"))
+    return ""
+
+class DashClient:
+    """Construit et envoie les requêtes de callbacks comme le navigateur."""
+
+    def __init__(self, transport, recorder):
+        self.transport = transport
+        self.recorder = recorder
+        status, dependencies = transport.get(DEPENDENCIES_PATH)
+        if status != 200 or not dependencies:
+            raise RuntimeError(f"{DEPENDENCIES_PATH} : HTTP {status}")
+        self.callbacks = {}
+        for name, first_output in CALLBACKS.items():
+            for dependency in dependencies:
+                output = dependency["output"]
+                first = output[2:].split("...")[0] if output.startswith("..") else output
+                if first.split("@")[0] == first_output and not dependency.get("clientside_function"):
+                    self.callbacks[name] = dependency
+                    break
+            else:
+                raise RuntimeError(f"Callback {name} ({first_output}) introuvable")
+
+    def call(self, name: str, inputs: dict, state: dict = None, changed: str = None):
+        """Appelle un callback ; retourne {(id, propriété): valeur} ou None en cas d'erreur."""
+        dependency = self.callbacks[name]
+        state = state or {}
+        body = {
+            "output": dependency["output"],
+            "outputs": _split_output(dependency["output"]),
+            "inputs": [dict(i, value=inputs.get(f"{i['id']}.{i['property']}")) for i in dependency["inputs"]],
+            "state": [dict(s, value=state.get(f"{s['id']}.{s['property']}")) for s in dependency["state"]],
+            "changedPropIds": [changed or next(iter(inputs))],
+        }
+        start = time.perf_counter()
+        try:
+            status, payload = self.transport.post(UPDATE_PATH, body)
+        except Exception as e:  # connexion refusée, délai dépassé...
+            self.recorder.record(name, time.perf_counter() - start, error=f"{type(e).__name__}: {e}")
+            return None
+        elapsed = time.perf_counter() - start
+        if status == 204:  # PreventUpdate / aucune sortie modifiée
+            self.recorder.record(name, elapsed)
+            return {}
+        if status != 200 or payload is None:
+            self.recorder.record(name, elapsed, error=f"HTTP {status}")
+            return None
+        self.recorder.record(name, elapsed)
+        return {(component_id, prop): value
+                for component_id, props in payload.get("response", {}).items()
+                for prop, value in props.items()}
+
+class Recorder:
+    """Latences et erreurs par callback, partagées entre threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_samples = {}
+        self.counters = defaultdict(int)
+
+    def record(self, name: str, elapsed: float, error: str = None):
+        with self.lock:
+            self.timings[name].append(elapsed)
+            if error:
+                self.errors[name] += 1
+                self.error_samples.setdefault(name, error)
+
+    def count(self, key: str, n: int = 1):
+        with self.lock:
+            self.counters[key] += n
+
+    def report(self, duration: float) -> dict:
+        report = {}
+        for name, timings in sorted(self.timings.items()):
+            timings = sorted(timings)
+            n = len(timings)
+            report[name] = {
+                "calls": n,
+                "calls_per_s": n / duration if duration else None,
+                "errors": self.errors[name],
+                "error_rate": self.errors[name] / n,
+                "p50_ms": timings[n // 2] * 1000,
+                "p95_ms": timings[min(n - 1, int(n * 0.95))] * 1000,
+                "p99_ms": timings[min(n - 1, int(n * 0.99))] * 1000,
+                "max_ms": timings[-1] * 1000,
+            }
+        return report
+
+def canvas_json(rng: random.Random, count: int) -> str:
+    """JSON DashCanvas tel qu'envoyé par le composant (coordonnées du canvas)."""
+    objects = []
+    for _ in range(count):
+        w, h = rng.randint(30, 200), rng.randint(20, 150)
+        objects.append({"type": "rect", "left": rng.randint(0, 500 - w), "top": rng.randint(0, 350 - h),
+                        "width": w, "height": h, "scaleX": 1, "scaleY": 1})
+    return json.dumps({"version": "4.6.0", "objects": objects})
+
+def think(rng: random.Random, mean: float, deadline: float):
+    if mean > 0:
+        time.sleep(max(0.0, min(rng.expovariate(1 / mean), deadline - time.time())))
+
+def annotator_session(client: DashClient, recorder: Recorder, ledger: dict, name: str, seed: int,
+                      deadline: float, think_time: float, save_ratio: float):
+    rng = random.Random(seed)
+    who = {"name": name}
+    response = client.call("_load_images", {"annotator-store.data": who})
+    image_count = (response or {}).get(("image-count", "data")) or 0
+    if not image_count:
+        return
+
+    def show(idx):
+        response = client.call("_set_image", {"image-count.data": image_count, "current-index.data": idx},
+                               changed="current-index.data")
+        return (response or {}).get(("current-image", "data"))
+
+    idx = rng.randrange(image_count)
+    image = show(idx)
+    while time.time() < deadline:
+        think(rng, think_time, deadline)
+        if rng.random() < save_ratio and image:
+            count = rng.randint(1, 4)
+            response = client.call("_save", {"save-annotation.n_clicks": 1}, {
+                "canvas.json_data": canvas_json(rng, count), "current-image.data": image,
+                "annotator-store.data": who})
+            message = _text((response or {}).get(("annotate-save-status", "children")))
+            match = re.search(r"#(\d+)", message)
+            if match and "✅" in message:
+                recorder.count("annotate_saves")
+                with ledger["lock"]:
+                    ledger["created"][int(match.group(1))] = (image, count)
+            elif response is not None:
+                recorder.count("annotate_rejected")
+        else:
+            # Équivalent serveur de la navigation clientside (assets/annotate.js)
+            idx = max(0, min(image_count - 1, idx + rng.choice((1, 1, 1, -1))))
+            image = show(idx) or image
+
+def reviewer_session(client: DashClient, recorder: Recorder, ledger: dict, name: str, seed: int,
+                     deadline: float, think_time: float, hot_rows: int):
+    rng = random.Random(seed)
+    while time.time() < deadline:
+        response = client.call("update_table", {
+            "filter-annotator.value": None, "filter-image.value": None, "table-refresh-trigger.data": 0,
+            "annotations-table.page_current": 0, "annotations-table.page_size": REVIEW_PAGE_SIZE,
+            "annotations-table.sort_by": []}, changed="table-refresh-trigger.data")
+        rows = (response or {}).get(("annotations-table", "data")) or []
+        if not rows:
+            think(rng, think_time, deadline)
+            continue
+        selected = [rng.randrange(min(hot_rows, len(rows)))]
+        response = client.call("handle_row_selection", {"annotations-table.selected_rows": selected},
+                               {"annotations-table.data": rows})
+        version = (response or {}).get(("selected-annotation-version", "data"))
+        think(rng, think_time, deadline)
+        if time.time() >= deadline:
+            break
+
+        count = rng.randint(1, 2)
+        response = client.call("save_additions_and_refresh_table", {"save-additions.n_clicks": 1}, {
+            "modification-canvas.json_data": canvas_json(rng, count), "annotations-table.selected_rows": selected,
+            "annotations-table.data": rows, "modifier-name.value": name,
+            "selected-annotation-version.data": version})
+        message = _text((response or {}).get(("review-save-status", "children")))
+        if "✅" in message:
+            recorder.count("review_saves")
+            with ledger["lock"]:
+                ledger["added"][rows[selected[0]]["id"]] += count
+        elif "Conflit" in message:
+            recorder.count("version_conflicts")
+        elif response is not None:
+            recorder.count("review_rejected")
+
+def stats_tab(client: DashClient, deadline: float, interval: float):
+    n, displayed_version = 0, None
+    while time.time() < deadline:
+        n += 1
+        start = time.time()
+        response = client.call("update_stats", {"refresh-stats.n_intervals": n},
+                               {"stats-version.data": displayed_version})
+        displayed_version = (response or {}).get(("stats-version", "data"), displayed_version)
+        time.sleep(max(0.0, min(interval - (time.time() - start), deadline - time.time())))
+
+def read_store(data_dir: str) -> dict:
+    with open(os.path.join(data_dir, "annotations.json"), encoding="utf-8") as f:
+        return {a["id"]: a for a in json.load(f)["annotations"]}
+
+def lost_updates(before: dict, after: dict, ledger: dict) -> dict:
+    """Écritures confirmées à l'utilisateur mais absentes ou incomplètes dans le fichier final."""
+    lost_creations = sum(1 for annotation_id, (image, count) in ledger["created"].items()
+                         if annotation_id not in after or after[annotation_id]["image"] != image
+                         or len(after[annotation_id]["rectangles"]) != count)
+    lost_rectangles, unexpected_rectangles = 0, 0
+    for annotation_id, added in ledger["added"].items():
+        if annotation_id not in before or annotation_id not in after:
+            lost_rectangles += added
+            continue
+        delta = len(after[annotation_id]["rectangles"]) - len(before[annotation_id]["rectangles"])
+        lost_rectangles += max(0, added - delta)
+        unexpected_rectangles += max(0, delta - added)
+    return {"lost_creations": lost_creations, "lost_review_rectangles": lost_rectangles,
+            "unconfirmed_review_rectangles": unexpected_rectangles}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", required=True, help="dossier produit par generate_dataset --images-on-disk")
+    parser.add_argument("--url", help="serveur déjà lancé sur --dataset (sinon client de test Flask)")
+    parser.add_argument("--annotators", type=int, default=4)
+    parser.add_argument("--reviewers", type=int, default=2)
+    parser.add_argument("--stats-tabs", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=30, help="durée en secondes")
+    parser.add_argument("--think-time", type=float, default=0.5, help="pause moyenne entre actions (s)")
+    parser.add_argument("--save-ratio", type=float, default=0.3, help="part des actions d'annotation qui enregistrent")
+    parser.add_argument("--hot-rows", type=int, default=5, help="lignes du tableau se partageant les relecteurs")
+    parser.add_argument("--stats-interval", type=float, default=STATS_INTERVAL)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args(argv)
+
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+    workdir = None
+    if args.url:
+        data_dir = os.path.join(os.path.abspath(args.dataset), "data")
+        transport = HttpTransport(args.url)
+    else:
+        workdir = tempfile.mkdtemp(prefix="turvoi-load-")
+        shutil.copytree(os.path.join(args.dataset, "data"), os.path.join(workdir, "data"), symlinks=True)
+        os.chdir(workdir)
+        data_dir = os.path.join(workdir, "data")
+        transport = TestClientTransport()
+
+    try:
+        recorder = Recorder()
+        client = DashClient(transport, recorder)
+        ledger = {"lock": threading.Lock(), "created": {}, "added": defaultdict(int)}
+        before = read_store(data_dir)
+
+        start = time.time()
+        deadline = start + args.duration
+        threads = []
+        for i in range(args.annotators):
+            threads.append(threading.Thread(target=annotator_session, args=(
+                client, recorder, ledger, f"load{i}", args.seed * 1000 + i, deadline, args.think_time, args.save_ratio)))
+        for i in range(args.reviewers):
+            threads.append(threading.Thread(target=reviewer_session, args=(
+                client, recorder, ledger, f"review{i}", args.seed * 1000 + 500 + i, deadline, args.think_time,
+                args.hot_rows)))
+        for _ in range(args.stats_tabs):
+            threads.append(threading.Thread(target=stats_tab, args=(client, deadline, args.stats_interval)))
+        print(f"{args.annotators} annotateurs, {args.reviewers} relecteurs, {args.stats_tabs} onglets Stats "
+              f"pendant {args.duration:.0f} s ({args.url or 'client de test Flask'})")
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+
+        report = recorder.report(elapsed)
+        consistency = lost_updates(before, read_store(data_dir), ledger)
+    finally:
+        if workdir:
+            os.chdir(REPO_DIR)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'callback':<36}{'appels':>8}{'/s':>7}{'err.':>7}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, stats in report.items():
+        print(f"{name:<36}{stats['calls']:>8}{stats['calls_per_s']:>7.1f}{stats['error_rate']:>7.1%}"
+              f"{stats['p50_ms']:>8.0f}ms{stats['p95_ms']:>8.0f}ms{stats['p99_ms']:>8.0f}ms")
+    for name, sample in recorder.error_samples.items():
+        print(f"  erreur {name} : {sample}")
+    counters = dict(recorder.counters)
+    print(f"Enregistrements : {counters.get('annotate_saves', 0)} annotations, {counters.get('review_saves', 0)} ajouts "
+          f"en révision, {counters.get('version_conflicts', 0)} conflits de version")
+    print(f"Mises à jour perdues : {consistency['lost_creations']} annotations, "
+          f"{consistency['lost_review_rectangles']} rectangles de révision "
+          f"({consistency['unconfirmed_review_rectangles']} rectangles écrits sans confirmation)")
+
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "target": args.url or "test_client",
+                "users": {"annotators": args.annotators, "reviewers": args.reviewers, "stats_tabs": args.stats_tabs},
+                "duration_s": elapsed,
+                "callbacks": report,
+                "counters": counters,
+                "consistency": consistency,
+            }, f, indent=2)
+    lost = consistency["lost_creations"] + consistency["lost_review_rectangles"]
+    sys.exit(1 if lost else 0)
+
+if __name__ == "__main__":
+    main()
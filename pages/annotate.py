@@ -1,35 +1,116 @@
 import os
-import base64
 import json
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import dash
-from dash import html, dcc, Input, Output, State
+from dash import html, dcc, Input, Output, State, ClientsideFunction
 import dash_bootstrap_components as dbc
 from dash_canvas import DashCanvas
 from services.json_annotations import (
-    list_images, 
-    IMAGES_DIR, 
+    get_catalog, 
+    images_dir, 
+    ANNOTATOR_COLORS,
     add_annotation, 
     get_annotator_color,
-    get_annotations_for_image
+    get_annotations_for_image,
+    data_signature
 )
+from services.previews import canvas_to_original_factor, get_preview_path
+from services.image_server import preview_url
+from utils.geometry import scale_rect
 
 # Page d'annotation
 dash.register_page(__name__, path="/annotate", name="Annoter")
 
+# Taille du canvas : l'image affichée est un dérivé à cette taille, les rectangles
+# sont stockés en pixels de l'image originale
+CANVAS_WIDTH, CANVAS_HEIGHT = 800, 600
+PREVIEW_SCALE = 1
+
+# Préchargement des images voisines (±PREFETCH_RADIUS) pendant que l'annotateur travaille
+PREFETCH_RADIUS = 2
+CANVAS_JSON_CACHE_SIZE = 64
+_canvas_json_cache = OrderedDict()
+_canvas_json_lock = threading.Lock()
+_prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="annotate-prefetch")
+
+def build_canvas_json(img_name):
+    """
+    JSON DashCanvas des annotations existantes d'une image, mis en cache (LRU)
+    tant que les données et l'image n'ont pas changé.
+    """
+    path = os.path.join(images_dir(), img_name)
+    key = (img_name, data_signature(), os.stat(path).st_mtime_ns)
+    with _canvas_json_lock:
+        if key in _canvas_json_cache:
+            _canvas_json_cache.move_to_end(key)
+            return _canvas_json_cache[key]
+
+    # Charger les annotations existantes pour cette image
+    existing_annotations = get_annotations_for_image(img_name)
+    to_canvas = 1.0 / canvas_to_original_factor(path, CANVAS_WIDTH)
+    
+    # Convertir les rectangles (pixels originaux) en format DashCanvas
+    canvas_objects = []
+    for ann in existing_annotations:
+        for rect in ann["rectangles"]:
+            rect = scale_rect(rect, to_canvas)
+            # Format DashCanvas pour les rectangles
+            canvas_objects.append({
+                "type": "rect",
+                "left": rect["x"],
+                "top": rect["y"], 
+                "width": rect["width"],
+                "height": rect["height"],
+                "fill": rect["color"] + "80",  # Semi-transparent
+                "stroke": rect["color"],
+                "strokeWidth": 2,
+                "selectable": True
+            })
+    
+    # Créer le JSON pour DashCanvas
+    canvas_json = json.dumps({
+        "version": "4.6.0",
+        "objects": canvas_objects
+    })
+    with _canvas_json_lock:
+        _canvas_json_cache[key] = canvas_json
+        while len(_canvas_json_cache) > CANVAS_JSON_CACHE_SIZE:
+            _canvas_json_cache.popitem(last=False)
+    return canvas_json
+
+def _warm_neighbours(catalog, idx):
+    """Génère les dérivés et le JSON canvas des images voisines (thread d'arrière-plan)."""
+    for offset in range(1, PREFETCH_RADIUS + 1):
+        for j in (idx + offset, idx - offset):
+            name = catalog.name_at(j)
+            if name is not None:
+                try:
+                    get_preview_path(os.path.join(images_dir(), name), (CANVAS_WIDTH, CANVAS_HEIGHT), PREVIEW_SCALE)
+                    build_canvas_json(name)
+                except Exception as e:
+                    print(f"Préchargement impossible pour {name}: {e}")
+
 # Layout : canvas + panneau de contrôle
 layout = dbc.Container([
-    dcc.Store(id="image-list"),
+    # Nombre d'images du catalogue (la liste reste côté serveur) et image affichée
+    dcc.Store(id="image-count"),
     dcc.Store(id="current-index", data=0),
+    dcc.Store(id="current-image"),
     dcc.Store(id="annotator-store", storage_type="local"),
     dcc.Store(id="global-store"),  # Ajout du composant manquant
+    # Table des couleurs pour les callbacks côté navigateur (assets/annotate.js)
+    dcc.Store(id="annotator-colors", data=ANNOTATOR_COLORS),
 
     dbc.Row([
         dbc.Col(dbc.Card([
             html.Div(id="image-title", className="muted"),
             DashCanvas(
                 id="canvas",
-                width=800,
-                height=600,
+                width=CANVAS_WIDTH,
+                height=CANVAS_HEIGHT,
                 tool="rectangle",
                 hide_buttons=["zoom", "pan", "line", "pencil", "select"],
                 lineWidth=3,
@@ -51,7 +132,9 @@ layout = dbc.Container([
                 html.Br(),
                 html.Span("Mode: Rectangle activé • Dessinez directement sur l'image", className="text-success small")
             ], className="mb-2"),
-            html.Div(id="canvas-debug", className="small text-muted")
+            html.Div(id="canvas-debug", className="small text-muted"),
+            # Images voisines chargées en avance dans le cache du navigateur
+            html.Div(id="image-prefetch", style={"display": "none"})
         ], className="card"), md=8),
 
         dbc.Col(dbc.Card([
@@ -94,28 +177,28 @@ def register_callbacks(app):
             ])
         return "Veuillez entrer votre nom"
 
-    @app.callback(Output("image-list", "data"), Input("annotator-store", "data"))
+    @app.callback(Output("image-count", "data"), Input("annotator-store", "data"))
     def _load_images(_):
-        return list_images()
+        return len(get_catalog())
 
     # Callback pour pré-sélectionner une image depuis le Store global
     @app.callback(
         Output("current-index", "data", allow_duplicate=True),
         Output("global-store", "data", allow_duplicate=True),
         Input("global-store", "data"),
-        Input("image-list", "data"),
+        Input("image-count", "data"),
         prevent_initial_call=True
     )
-    def _preselect_image_from_store(store_data, images):
+    def _preselect_image_from_store(store_data, count):
         print(f"DEBUG: Store data received: {store_data}")
-        print(f"DEBUG: Images available: {images}")
+        print(f"DEBUG: Images available: {count}")
         
-        if not store_data or not images:
+        if not store_data or not count:
             return 0, store_data
         
         preselected_image = store_data.get("preselected_image")
-        if preselected_image and preselected_image in images:
-            index = images.index(preselected_image)
+        index = get_catalog().index_of(preselected_image) if preselected_image else None
+        if index is not None:
             print(f"DEBUG: Pre-selecting image {preselected_image} at index {index}")
             # Nettoyer le store après usage
             cleaned_store = {k: v for k, v in store_data.items() if k != "preselected_image"}
@@ -129,82 +212,58 @@ def register_callbacks(app):
         Output("canvas", "tool"),  # Force le retour en mode rectangle
         Output("image-title", "children"),
         Output("image-info", "children"),
-        Input("image-list", "data"),
+        Output("image-prefetch", "children"),
+        Output("current-image", "data"),
+        Input("image-count", "data"),
         Input("current-index", "data"),
         prevent_initial_call=True
     )
-    def _set_image(imgs, idx):
-        if not imgs:
-            return None, '{"objects": []}', "rectangle", "Aucune image trouvée dans data/cars_detection/", ""
-        
-        idx = max(0, min(idx or 0, len(imgs) - 1))
-        img_name = imgs[idx]
-        path = os.path.join(IMAGES_DIR, img_name)
-        
-        # Charger l'image
-        with open(path, "rb") as f:
-            b64 = base64.b64encode(f.read()).decode("utf-8")
-        img_data_url = f"data:image/jpeg;base64,{b64}"
-        info = f"Image {idx+1}/{len(imgs)} — {img_name}"
+    def _set_image(count, idx):
+        catalog = get_catalog()
+        if not len(catalog):
+            return None, '{"objects": []}', "rectangle", f"Aucune image trouvée dans {images_dir()}", "", [], None
         
-        # Charger les annotations existantes pour cette image
-        existing_annotations = get_annotations_for_image(img_name)
+        # Le catalogue fait foi : il a pu changer depuis le chargement de la page
+        idx = max(0, min(idx or 0, len(catalog) - 1))
+        img_name = catalog.name_at(idx)
         
-        # Convertir les rectangles en format DashCanvas
-        canvas_objects = []
-        for ann in existing_annotations:
-            for rect in ann["rectangles"]:
-                # Format DashCanvas pour les rectangles
-                canvas_objects.append({
-                    "type": "rect",
-                    "left": rect["x"],
-                    "top": rect["y"], 
-                    "width": rect["width"],
-                    "height": rect["height"],
-                    "fill": rect["color"] + "80",  # Semi-transparent
-                    "stroke": rect["color"],
-                    "strokeWidth": 2,
-                    "selectable": True
-                })
+        # URL du dérivé adapté au canvas, servi par la route /media/previews
+        img_data_url = preview_url(img_name, (CANVAS_WIDTH, CANVAS_HEIGHT), PREVIEW_SCALE)
+        info = f"Image {idx+1}/{len(catalog)} — {img_name}"
         
-        # Créer le JSON pour DashCanvas
-        canvas_json = {
-            "version": "4.6.0",
-            "objects": canvas_objects
-        }
+        canvas_json = build_canvas_json(img_name)
         
-        print(f"DEBUG: Loaded {len(canvas_objects)} existing rectangles for {img_name}")
+        # Préparer les voisines côté serveur, et côté navigateur pour l'image suivante/précédente
+        # Le thread de préchargement travaille dans le jeu de données de la requête
+        _prefetch_executor.submit(contextvars.copy_context().run, _warm_neighbours, catalog, idx)
+        prefetch = [
+            html.Img(src=preview_url(catalog.name_at(j), (CANVAS_WIDTH, CANVAS_HEIGHT), PREVIEW_SCALE))
+            for j in (idx + 1, idx - 1) if 0 <= j < len(catalog)
+        ]
         
-        return img_data_url, json.dumps(canvas_json), "rectangle", img_name, info
+        return img_data_url, canvas_json, "rectangle", img_name, info, prefetch, img_name
 
-    @app.callback(Output("current-index", "data"),
-                  Input("next-image", "n_clicks"), Input("prev-image", "n_clicks"),
-                  State("current-index", "data"), State("image-list", "data"))
-    def _nav(next_n, prev_n, idx, imgs):
-        trigger = dash.callback_context.triggered[0]["prop_id"].split(".")[0] if dash.callback_context.triggered else None
-        idx = idx or 0
-        if not imgs:
-            return 0
-        if trigger == "next-image":
-            idx = min(idx + 1, len(imgs) - 1)
-        elif trigger == "prev-image":
-            idx = max(idx - 1, 0)
-        return idx
+    # Navigation : callback côté navigateur (assets/annotate.js)
+    app.clientside_callback(
+        ClientsideFunction(namespace="annotate", function_name="nav"),
+        Output("current-index", "data"),
+        Input("next-image", "n_clicks"), Input("prev-image", "n_clicks"),
+        State("current-index", "data"), State("image-count", "data")
+    )
 
     @app.callback(Output("annotate-save-status", "children"),  # Renommé ici
                   Input("save-annotation", "n_clicks"),
                   State("canvas", "json_data"),
-                  State("image-list", "data"),
-                  State("current-index", "data"),
+                  State("current-image", "data"),
                   State("annotator-store", "data"),
                   prevent_initial_call=True)
-    def _save(_, json_data, imgs, idx, who):
-        if not imgs:
+    def _save(_, json_data, img, who):
+        # Nom de l'image affichée (et non sa position, qui peut changer avec le catalogue)
+        if not img:
             return html.Span("Pas d'image à enregistrer", className="text-danger")
         annotator = (who or {}).get("name")
         if not annotator:
             return html.Span("Veuillez saisir votre nom d'annotateur", className="text-danger")
-        img = imgs[idx or 0]
         
         if isinstance(json_data, str):
             try:
@@ -220,11 +279,16 @@ def register_callbacks(app):
                     rect = {
                         "x": obj.get("left", 0),
                         "y": obj.get("top", 0),
-                        "width": obj.get("width", 0),
-                        "height": obj.get("height", 0)
+                        "width": obj.get("width", 0) * obj.get("scaleX", 1),
+                        "height": obj.get("height", 0) * obj.get("scaleY", 1)
                     }
                     rectangles.append(rect)
         
+        # Coordonnées canvas -> pixels de l'image originale
+        if rectangles:
+            to_original = canvas_to_original_factor(os.path.join(images_dir(), img), CANVAS_WIDTH)
+            rectangles = [scale_rect(rect, to_original) for rect in rectangles]
+        
         if rectangles:
             annotation_id = add_annotation(img, annotator, rectangles)
             color = get_annotator_color(annotator)
@@ -235,90 +299,33 @@ def register_callbacks(app):
         else:
             return html.Span("⚠️ Aucun rectangle à sauvegarder", className="text-warning")
     
-    @app.callback(
+    # Interactions purement UI : exécutées dans le navigateur (assets/annotate.js)
+    app.clientside_callback(
+        ClientsideFunction(namespace="annotate", function_name="clear_canvas"),
         Output("canvas", "json_data", allow_duplicate=True),
         Input("clear-canvas", "n_clicks"),
-        State("canvas", "image_content"),
-        prevent_initial_call=True,
-        allow_duplicate_outputs=True
+        prevent_initial_call=True
     )
-    def _clear_canvas(_, current_image):
-        if current_image:
-            # Réinitialiser avec l'image actuelle mais sans objets
-            return '{"objects": []}'
-        return '{"objects": []}'
     
-    @app.callback(
+    app.clientside_callback(
+        ClientsideFunction(namespace="annotate", function_name="show_rectangles"),
         Output("canvas", "json_data", allow_duplicate=True),
         Input("show-rectangles", "n_clicks"),
         State("canvas", "json_data"),
-        prevent_initial_call=True,
-        allow_duplicate_outputs=True
+        prevent_initial_call=True
     )
-    def _show_rectangles(_, json_data):
-        if isinstance(json_data, str):
-            return json_data
-        return json.dumps(json_data) if json_data else '{"objects": []}'
     
-    @app.callback(
+    app.clientside_callback(
+        ClientsideFunction(namespace="annotate", function_name="debug_canvas"),
         Output("canvas-debug", "children"),
         Input("canvas", "json_data"),
         prevent_initial_call=True
     )
-    def _debug_canvas(json_data):
-        if not json_data:
-            return "Canvas vide"
-        
-        if isinstance(json_data, str):
-            try:
-                json_data = json.loads(json_data)
-            except:
-                return f"Erreur parsing JSON: {json_data[:50]}..."
-        
-        objects = json_data.get("objects", [])
-        if not objects:
-            return "Aucun objet sur le canvas • Dessinez un rectangle sur l'image"
-        
-        debug_info = []
-        rectangles = []
-        
-        for i, obj in enumerate(objects, 1):
-            obj_type = obj.get("type", "unknown")
-            obj_tool = obj.get("tool", "unknown")
-            debug_info.append(f"Objet {i}: type='{obj_type}', tool='{obj_tool}'")
-            
-            if "rect" in str(obj_type).lower() or obj.get("tool") == "rectangle" or obj.get("shape") == "rectangle":
-                rectangles.append(obj)
-        
-        result = [
-            html.Strong(f"{len(objects)} objet(s) total, {len(rectangles)} rectangle(s)"),
-        ]
-        
-        if rectangles:
-            result.append(html.Div("✅ Rectangles détectés:", className="mt-2 text-success"))
-            rect_info = []
-            for i, rect in enumerate(rectangles, 1):
-                coords = []
-                for coord in ["left", "top", "width", "height"]:
-                    if coord in rect:
-                        coords.append(f"{coord}={rect[coord]:.0f}")
-                rect_info.append(f"Rectangle {i}: {', '.join(coords)}")
-            result.append(html.Ul([html.Li(info) for info in rect_info]))
-        else:
-            result.append(html.Div("ℹ️ Objets détectés mais aucun rectangle reconnu", className="text-info"))
-            result.append(html.Details([
-                html.Summary("Voir détails objets"),
-                html.Ul([html.Li(html.Code(info)) for info in debug_info])
-            ]))
-        
-        return html.Div(result)
     
-    @app.callback(
+    app.clientside_callback(
+        ClientsideFunction(namespace="annotate", function_name="canvas_color"),
         Output("canvas", "lineColor"),
         Input("annotator-store", "data"),
+        State("annotator-colors", "data"),
         prevent_initial_call=True
     )
-    def _update_canvas_color(annotator_data):
-        if annotator_data and annotator_data.get("name"):
-            return get_annotator_color(annotator_data["name"])
-        return "#FF0000"
\ No newline at end of file
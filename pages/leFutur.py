@@ -1,125 +1,64 @@
 import io
+import os
+import sys
+import time
 import base64
-import re
-import torch
-import numpy as np
-import cv2
-from PIL import Image, ImageDraw, ImageFont
-from dash import html, dcc, Output, Input, State, register_page
+import threading
+import importlib.util
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+from dash import html, dcc, Output, Input, State, register_page, ctx, no_update, ClientsideFunction
 import dash_bootstrap_components as dbc
-from huggingface_hub import hf_hub_download
-from ultralytics import YOLO
-import torchvision.transforms as T
-from torchvision.models.detection import fasterrcnn_resnet50_fpn
-from transformers import TrOCRProcessor, VisionEncoderDecoderModel, AutoFeatureExtractor, AutoModelForImageClassification
-
-# Register this file as a Dash page
-register_page(__name__, path="/le-futur", name="Le Futur")
+from services.model_registry import STATUS_UNLOADED, STATUS_READY, STATUS_LOADING, STATUS_ERROR
+from services.inference_worker import (
+    INFERENCE_WORKERS, InferenceBusyError, get_service, get_job_result, get_models_status
+)
 
 # --- Configuration ---
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-
-# --- Modèle Faster R-CNN pour la détection de voitures ---
-model_car = fasterrcnn_resnet50_fpn(pretrained=True).to(device)
-model_car.eval()
-COCO_CATEGORY_NAMES = ['__background__','person','bicycle','car','motorcycle','airplane',
-                       'bus','train','truck','boat']
-CAR_CLASS_IDS = {3}  # ID pour "car" dans COCO
-transform = T.Compose([T.ToTensor()])
-
-# --- YOLOv8 pour détection de plaques ---
-model_path_plate = hf_hub_download(repo_id="MKgoud/License-Plate-Recognizer", filename="LP-detection.pt")
-model_plate = YOLO(model_path_plate)
-
-# --- TrOCR pour lecture de plaques ---
-processor_trocr = TrOCRProcessor.from_pretrained("microsoft/trocr-base-handwritten")
-trocr_model = VisionEncoderDecoderModel.from_pretrained("microsoft/trocr-base-handwritten").to(device)
-trocr_model.eval()
-
-# --- Classification marque : modèle CarViT uniquement ---
-feature_extractor_brand = AutoFeatureExtractor.from_pretrained("abdusah/CarViT")
-model_brand = AutoModelForImageClassification.from_pretrained("abdusah/CarViT").to(device)
-model_brand.eval()
-
-# --- Regex multi‐pays pour plaques ---
-PLATE_REGEXES = {
-    "FR": r"[A-Z]{2}-\d{3}-[A-Z]{2}",
-    "DE": r"[A-Z]{1,3}-[A-Z]{1,2}\d{1,4}",
-    "US": r"[A-Z0-9]{1,7}"
-}
-
-def detect_country_from_text(text):
-    text = text.replace(" ", "").replace("-", "")
-    if len(text) == 7:
-        return "US"
-    elif len(text) == 6:
-        return "FR"
-    elif len(text) <= 8:
-        return "DE"
-    return "US"
-
-# --- Fonctions de détection et lecture ---
-def run_inference_car(pil_image, score_threshold=0.5):
-    img = transform(pil_image).to(device)
-    with torch.no_grad():
-        preds = model_car([img])[0]
-    results = []
-    for box, label, score in zip(preds['boxes'].cpu(), preds['labels'].cpu(), preds['scores'].cpu()):
-        if score < score_threshold or int(label) not in CAR_CLASS_IDS:
-            continue
-        results.append({'box': box.numpy().tolist(), 'label': COCO_CATEGORY_NAMES[int(label)], 'score': float(score)})
-    return results
-
-def deskew_plate(plate_pil):
-    plate_np = np.array(plate_pil.convert("L"))
-    coords = np.column_stack(np.where(plate_np > 0))
-    if coords.shape[0] == 0:
-        return plate_np
-    angle = cv2.minAreaRect(coords)[-1]
-    angle = -(90 + angle) if angle < -45 else -angle
-    (h, w) = plate_np.shape
-    center = (w // 2, h // 2)
-    M = cv2.getRotationMatrix2D(center, angle, 1.0)
-    return cv2.warpAffine(plate_np, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
-
-def read_plate_trocr_adaptive(plate_pil):
-    if plate_pil.mode != "RGB": plate_pil = plate_pil.convert("RGB")
-    pixel_values = processor_trocr(images=plate_pil, return_tensors="pt").pixel_values.to(device)
-    with torch.no_grad():
-        generated_ids = trocr_model.generate(pixel_values)
-    plate_text = processor_trocr.batch_decode(generated_ids, skip_special_tokens=True)[0]
-    plate_text = re.sub(r"[^A-Z0-9]", "", plate_text.upper())
-    country = detect_country_from_text(plate_text)
-    regex = PLATE_REGEXES.get(country, PLATE_REGEXES["US"])
-    return plate_text if re.match(regex, plate_text) else None
-
-def detect_plate_yolo(car_pil):
-    img_np = np.array(car_pil)
-    results = model_plate.predict(source=img_np, verbose=False)[0]
-    if len(results.boxes) == 0:
-        return None
-    x1, y1, x2, y2 = map(int, results.boxes.xyxy[0].cpu().numpy())
-    plate_crop = car_pil.crop((x1, y1, x2, y2))
-    gray = cv2.cvtColor(np.array(plate_crop), cv2.COLOR_RGB2GRAY)
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-    gray = clahe.apply(gray)
-    _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    plate_pil_thresh = Image.fromarray(thresh).convert("RGB")
-    plate_text = read_plate_trocr_adaptive(plate_pil_thresh)
-    return {'plate_box':[x1, y1, x2, y2], 'plate_text':plate_text}
-
-def identify_car_brand(car_pil):
-    if car_pil.mode != "RGB":
-        car_pil = car_pil.convert("RGB")
-    inputs = feature_extractor_brand(images=car_pil, return_tensors="pt").to(device)
-    with torch.no_grad():
-        outputs = model_brand(**inputs)
-    probs = torch.nn.functional.softmax(outputs.logits, dim=-1)
-    pred_id = int(probs.argmax(-1)[0].cpu().numpy())
-    conf = float(probs[0, pred_id].cpu().numpy())
-    label = model_brand.config.id2label[pred_id]
-    brand = label.split()[0] if label else "Unknown"
-    return {"brand": brand, "confidence": conf, "source": "CarViT"}
+# La pile ML (services/inference.py) n'est importée qu'au premier usage de la page.
+# TURVOI_ENABLE_ML : "auto" (défaut, activée si torch & co sont installés), "1" ou "0".
+ML_PACKAGES = ("torch", "torchvision", "transformers", "ultralytics", "cv2", "huggingface_hub")
+ML_SETTING = os.environ.get("TURVOI_ENABLE_ML", "auto").lower()
+if ML_SETTING == "auto":
+    # find_spec ne fait que localiser les paquets, sans les importer
+    ML_ENABLED = all(importlib.util.find_spec(pkg) is not None for pkg in ML_PACKAGES)
+else:
+    ML_ENABLED = ML_SETTING in ("1", "true", "yes")
+# Préchauffage des modèles en arrière-plan dès le démarrage
+MODEL_WARMUP = os.environ.get("TURVOI_MODEL_WARMUP", "0") == "1"
+# Avec TURVOI_INFERENCE_WORKERS=0, l'inférence tourne dans le callback (mode développement)
+USE_WORKERS = INFERENCE_WORKERS > 0
+SCORE_THRESHOLD = 0.6
+# Orientation EXIF (photos de téléphone) : appliquée par ImageOps.exif_transpose avant
+# l'inférence ; le calque reçoit alors l'image redressée, pas l'image brute, pour que
+# détections et fond soient dans le même repère quel que soit le navigateur.
+EXIF_ORIENTATION_TAG = 0x0112
+BACKGROUND_MAX_SIDE = 2048
+
+# Register this file as a Dash page (seulement si la pile ML est disponible)
+if ML_ENABLED:
+    register_page(__name__, path="/le-futur", name="Le Futur")
+
+def _inference():
+    """Import différé de la pile ML."""
+    from services import inference
+    return inference
+
+def warmup_models():
+    """Importe la pile ML puis charge les modèles, dans un thread d'arrière-plan."""
+    if USE_WORKERS:
+        # Les modèles vivent dans les processus d'inférence
+        get_service().warmup()
+        return
+
+    def _run():
+        try:
+            _inference().models.warmup(background=False)
+        except Exception as e:
+            print(f"Préchauffage des modèles impossible: {e}")
+    threading.Thread(target=_run, name="lefutur-warmup", daemon=True).start()
+
+if ML_ENABLED and MODEL_WARMUP:
+    warmup_models()
 
 def draw_boxes(pil_image, detections, plate_infos=None, brand_infos=None):
     draw = ImageDraw.Draw(pil_image)
@@ -150,42 +89,121 @@ def draw_boxes(pil_image, detections, plate_infos=None, brand_infos=None):
     return pil_image
 
 # --- Page layout (no Dash app instantiation here) ---
+MODEL_LABELS = {"car": "Voitures", "plate": "Plaques", "trocr": "OCR", "brand": "Marques"}
+STATUS_COLORS = {STATUS_READY: "success", STATUS_LOADING: "warning", STATUS_ERROR: "danger"}
+
+def models_status_badges():
+    """Badges d'état des modèles (chargés à la demande, déchargés après inactivité)."""
+    # Tant que la pile ML n'est pas importée, aucun modèle n'est chargé
+    if USE_WORKERS:
+        statuses = get_models_status()
+    else:
+        inference = sys.modules.get("services.inference")
+        statuses = inference.models.status() if inference is not None else None
+    if statuses is None:
+        statuses = {name: {"status": STATUS_UNLOADED, "error": None} for name in MODEL_LABELS}
+    badges = []
+    for name, info in statuses.items():
+        badges.append(dbc.Badge(
+            f"{MODEL_LABELS.get(name, name)} : {info['status']}",
+            color=STATUS_COLORS.get(info["status"], "secondary"),
+            title=info["error"] or "",
+            className="me-2"
+        ))
+    return badges
+
 layout = dbc.Container([
     html.H1("Détecteur de Voitures, Plaques & Marques (CarViT) — Le Futur"),
+    html.Div([
+        html.Span(id="lefutur-models-status"),
+        dbc.Button("Préparer les modèles", id="lefutur-warmup", color="secondary", size="sm", className="ms-2"),
+        dcc.Interval(id="lefutur-models-poll", interval=2000, n_intervals=0),
+    ], className="mb-2"),
+    dbc.Switch(id='lefutur-multi-car', label="Toutes les voitures (sinon la plus probable uniquement)",
+               value=False, className="mb-2"),
     dcc.Upload(id='lefutur-upload-image',
                children=html.Div(['Glissez-déposez ou cliquez pour sélectionner une image']),
                style={'width':'100%','height':'80px','lineHeight':'80px','borderWidth':'1px','borderStyle':'dashed',
                       'borderRadius':'5px','textAlign':'center','margin':'10px'}, multiple=False),
+    html.Div(id='lefutur-job-status'),
+    dcc.Store(id='lefutur-job'),
+    dcc.Store(id='lefutur-result'),
+    dcc.Store(id='lefutur-background'),
+    dcc.Interval(id='lefutur-job-poll', interval=500, n_intervals=0, disabled=True),
+    # Détections dessinées dans le navigateur sur l'image envoyée (assets/lefutur.js)
+    dcc.Graph(id='lefutur-overlay', config={'displayModeBar': False}, style={'display': 'none'}),
+    dbc.Button("Télécharger l'image annotée (PNG)", id='lefutur-download-png', color="link", size="sm"),
+    dcc.Download(id='lefutur-download'),
     dbc.Row(dbc.Col(html.Div(id='lefutur-output-image'), width=12)),
 ], fluid=True)
 
 def parse_contents(contents):
     header, encoded = contents.split(",", 1)
-    return Image.open(io.BytesIO(base64.b64decode(encoded))).convert("RGB")
+    return ImageOps.exif_transpose(Image.open(io.BytesIO(base64.b64decode(encoded)))).convert("RGB")
 
-# Callback function (will be registered by register_callbacks)
-def update_output(contents, filename):
-    if contents is None:
-        return html.Div("Aucune image téléchargée.")
-    pil = parse_contents(contents)
-    detections = run_inference_car(pil, score_threshold=0.6)
-    if detections:
-        detections = [max(detections, key=lambda d: d['score'])]
-    plate_infos, brand_infos = [], []
-    for d in detections:
-        x1, y1, x2, y2 = map(int, d['box'])
-        x1, y1 = max(0, x1), max(0, y1)
-        x2, y2 = min(pil.width, x2), min(pil.height, y2)
-        car_crop = pil.crop((x1, y1, x2, y2))
-        plate_info = detect_plate_yolo(car_crop)
-        brand_info = identify_car_brand(car_crop)
-        plate_infos.append(plate_info)
-        brand_infos.append(brand_info)
-    pil_out = draw_boxes(pil.copy(), detections, plate_infos, brand_infos)
+def oriented_background(contents):
+    """
+    Fond du calque : None si la photo n'a pas d'orientation EXIF (le navigateur affiche
+    l'image envoyée telle quelle), sinon l'image redressée réencodée en JPEG.
+    """
+    header, encoded = contents.split(",", 1)
+    try:
+        with Image.open(io.BytesIO(base64.b64decode(encoded))) as img:
+            if img.getexif().get(EXIF_ORIENTATION_TAG, 1) == 1:
+                return None
+            img = ImageOps.exif_transpose(img).convert("RGB")
+    except (OSError, ValueError):
+        return None
+    img.thumbnail((BACKGROUND_MAX_SIDE, BACKGROUND_MAX_SIDE))
     buffer = io.BytesIO()
-    pil_out.save(buffer, format="PNG")
-    img_b64 = base64.b64encode(buffer.getvalue()).decode()
-    img_src = f"data:image/png;base64,{img_b64}"
+    img.save(buffer, format="JPEG", quality=85)
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+def decode_contents(contents):
+    header, encoded = contents.split(",", 1)
+    return base64.b64decode(encoded)
+
+# Callback functions (will be registered by register_callbacks)
+def submit_analysis(contents, filename, multi_car=False):
+    """
+    Dépose l'image dans la file d'inférence et active le suivi du job.
+    Retourne (message, job, suivi désactivé, résultat, fond du calque).
+    """
+    if contents is None:
+        return html.Div("Aucune image téléchargée."), None, True, None, None
+    multi_car = bool(multi_car)
+    background = oriented_background(contents)
+    if not USE_WORKERS:
+        inference = _inference()
+        result = inference.analyze_images([parse_contents(contents)], SCORE_THRESHOLD, multi_car)[0]
+        return None, None, True, {"filename": filename, **result}, background
+    try:
+        job_id = get_service().submit(decode_contents(contents), SCORE_THRESHOLD, multi_car)
+    except InferenceBusyError:
+        return dbc.Alert("Serveur d'inférence occupé, réessayez dans quelques secondes.",
+                         color="warning"), None, True, None, None
+    job = {"job_id": job_id, "submitted": time.time(), "filename": filename}
+    return dbc.Alert("Analyse en cours…", color="info"), job, False, None, background
+
+def poll_analysis(_n_intervals, job):
+    """Relève le résultat du job ; désactive le suivi une fois terminé."""
+    if not job:
+        return no_update, True, no_update
+    outcome = get_job_result(job["job_id"], job["submitted"])
+    if outcome is None:
+        return no_update, False, no_update
+    if outcome["status"] == "timeout":
+        return None, True, dbc.Alert("L'analyse a dépassé le délai imparti.", color="danger")
+    if outcome["status"] == "error":
+        return None, True, dbc.Alert(f"Erreur d'analyse : {outcome.get('error')}", color="danger")
+    return {"filename": job["filename"], **outcome["result"]}, True, None
+
+def render_result(result):
+    """Liste des détections ; l'image annotée est dessinée côté navigateur."""
+    if not result:
+        return None
+    detections = result["detections"]
+    plate_infos, brand_infos = result["plate_infos"], result["brand_infos"]
 
     lines = []
     for i, d in enumerate(detections):
@@ -201,15 +219,68 @@ def update_output(contents, filename):
         lines.append(html.Li(line))
 
     return [
-        html.H5(f"Fichier: {filename}"),
-        html.Img(src=img_src, style={'maxWidth':'100%'}),
+        html.H5(f"Fichier: {result['filename']}"),
         html.Ul(lines) if lines else html.P("Aucune voiture détectée.")
     ]
 
+def download_png(n_clicks, result, contents):
+    """Rendu PNG (draw_boxes) calculé uniquement à la demande."""
+    if not n_clicks or not result or contents is None:
+        return no_update
+    pil_out = draw_boxes(parse_contents(contents), result["detections"],
+                         result["plate_infos"], result["brand_infos"])
+    buffer = io.BytesIO()
+    pil_out.save(buffer, format="PNG")
+    name = os.path.splitext(result.get("filename") or "image")[0]
+    return dcc.send_bytes(buffer.getvalue(), f"{name}_annotee.png")
+
+def update_models_status(_n_intervals, n_clicks):
+    """Affiche l'état des modèles ; le bouton lance le préchauffage en arrière-plan."""
+    if ctx.triggered_id == "lefutur-warmup" and n_clicks:
+        warmup_models()
+    return models_status_badges()
+
 # Function to attach callbacks to the parent app
 def register_callbacks(app):
     app.callback(
-        Output('lefutur-output-image','children'),
+        Output('lefutur-models-status','children'),
+        Input('lefutur-models-poll','n_intervals'),
+        Input('lefutur-warmup','n_clicks')
+    )(update_models_status)
+    app.callback(
+        Output('lefutur-job-status','children'),
+        Output('lefutur-job','data'),
+        Output('lefutur-job-poll','disabled'),
+        Output('lefutur-result','data'),
+        Output('lefutur-background','data'),
         Input('lefutur-upload-image','contents'),
-        State('lefutur-upload-image','filename')
-    )(update_output)
\ No newline at end of file
+        State('lefutur-upload-image','filename'),
+        State('lefutur-multi-car','value')
+    )(submit_analysis)
+    app.callback(
+        Output('lefutur-result','data', allow_duplicate=True),
+        Output('lefutur-job-poll','disabled', allow_duplicate=True),
+        Output('lefutur-job-status','children', allow_duplicate=True),
+        Input('lefutur-job-poll','n_intervals'),
+        State('lefutur-job','data'),
+        prevent_initial_call=True
+    )(poll_analysis)
+    app.callback(
+        Output('lefutur-output-image','children'),
+        Input('lefutur-result','data')
+    )(render_result)
+    app.clientside_callback(
+        ClientsideFunction(namespace="lefutur", function_name="overlay_figure"),
+        Output('lefutur-overlay','figure'),
+        Output('lefutur-overlay','style'),
+        Input('lefutur-result','data'),
+        State('lefutur-upload-image','contents'),
+        State('lefutur-background','data')
+    )
+    app.callback(
+        Output('lefutur-download','data'),
+        Input('lefutur-download-png','n_clicks'),
+        State('lefutur-result','data'),
+        State('lefutur-upload-image','contents'),
+        prevent_initial_call=True
+    )(download_png)
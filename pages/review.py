@@ -1,79 +1,57 @@
 import json
-import base64
 import dash
 from dash import html, dcc, Input, Output, State, dash_table
 import dash_bootstrap_components as dbc
+from services.previews import canvas_to_original_factor
+from services.image_server import preview_url, render_url
+from utils.geometry import scale_rect
 from services.json_annotations import (
     get_all_annotations, 
     list_images,
     get_annotator_color,
     get_annotations_for_image,
+    get_annotation_by_id,
+    query_annotations,
+    search_distinct_values,
     add_annotation,
     update_annotation,
-    IMAGES_DIR
+    get_version,
+    VersionConflictError,
+    images_dir
 )
 from dash_canvas import DashCanvas
-from PIL import Image, ImageDraw
-import io
 import os
 
 # Page de révision avec fonctionnalités complètes
 dash.register_page(__name__, path="/review", name="Révision")
 
-def create_image_with_rectangles(image_path, rectangles, annotator_color):
-    """Crée une image composite avec les rectangles d'UNE annotation spécifique"""
-    try:
-        # Ouvrir l'image originale
-        img = Image.open(image_path)
-        img = img.convert("RGB")
-        
-        # Créer un objet de dessin
-        draw = ImageDraw.Draw(img)
-        
-        # Dessiner seulement les rectangles de cette annotation
-        for rect in rectangles:
-            x, y, w, h = rect["x"], rect["y"], rect["width"], rect["height"]
-            
-            # Convertir la couleur hex en RGB si nécessaire
-            if isinstance(annotator_color, str) and annotator_color.startswith('#'):
-                rgb_color = tuple(int(annotator_color[i:i+2], 16) for i in (1, 3, 5))
-            else:
-                rgb_color = (255, 0, 0)  # Rouge par défaut
-            
-            # Dessiner le rectangle (contour)
-            draw.rectangle([x, y, x + w, y + h], 
-                         outline=rgb_color, 
-                         width=3)
-            
-            # Dessiner un rectangle semi-transparent (remplissage)
-            overlay = Image.new('RGBA', img.size, (0, 0, 0, 0))
-            overlay_draw = ImageDraw.Draw(overlay)
-            fill_color = rgb_color + (50,)  # RGBA avec alpha=50
-            overlay_draw.rectangle([x, y, x + w, y + h], fill=fill_color)
-            
-            # Compositer avec l'image principale
-            img = Image.alpha_composite(img.convert('RGBA'), overlay).convert('RGB')
-        
-        # Convertir en base64
-        buffer = io.BytesIO()
-        img.save(buffer, format='JPEG', quality=95)
-        img_data = buffer.getvalue()
-        encoded = base64.b64encode(img_data).decode()
-        return f"data:image/jpeg;base64,{encoded}"
-        
-    except Exception as e:
-        print(f"Erreur création image avec rectangles: {e}")
-        return encode_image(image_path)  # Fallback vers image originale
+# Taille du canvas de modification (image affichée sous forme de dérivé)
+CANVAS_WIDTH, CANVAS_HEIGHT = 500, 350
+PREVIEW_SCALE = 1
 
-def encode_image(image_path):
-    """Encode une image en base64 pour l'affichage"""
-    try:
-        with open(image_path, "rb") as f:
-            encoded = base64.b64encode(f.read()).decode()
-        return f"data:image/jpeg;base64,{encoded}"
-    except Exception as e:
-        print(f"Erreur encodage image {image_path}: {e}")
-        return ""
+def create_image_with_rectangles(annotation):
+    """URL du rendu composite avec les rectangles d'UNE annotation spécifique.
+
+    Le rendu est produit et mis en cache disque par la route /media/renders ; l'URL
+    change avec last_updated, le navigateur peut donc la garder en cache.
+    """
+    return render_url(annotation, (CANVAS_WIDTH, CANVAS_HEIGHT), PREVIEW_SCALE)
+
+def encode_image(image_name):
+    """URL du dérivé de l'image pour l'affichage"""
+    return preview_url(image_name, (CANVAS_WIDTH, CANVAS_HEIGHT), PREVIEW_SCALE)
+
+# Taille de page du tableau et correspondance colonnes du tableau -> champs du store
+PAGE_SIZE = 12
+# Nombre maximum d'options renvoyées par recherche dans les filtres
+FILTER_OPTIONS_LIMIT = 50
+SORT_COLUMNS = {
+    "id": "id",
+    "image_name": "image",
+    "annotator": "annotator",
+    "rect_count": "rect_count",
+    "timestamp": "timestamp",
+}
 
 # Layout de la page
 layout = dbc.Container([
@@ -85,7 +63,8 @@ layout = dbc.Container([
             html.Label("Filtre par Annoteur:", className="form-label"),
             dcc.Dropdown(
                 id="filter-annotator",
-                placeholder="Tous les annoteurs",
+                placeholder="Tous les annoteurs (tapez pour rechercher)",
+                searchable=True,
                 clearable=True
             )
         ], md=6),
@@ -93,7 +72,8 @@ layout = dbc.Container([
             html.Label("Filtre par Image:", className="form-label"),
             dcc.Dropdown(
                 id="filter-image", 
-                placeholder="Toutes les images",
+                placeholder="Toutes les images (tapez pour rechercher)",
+                searchable=True,
                 clearable=True
             )
         ], md=6)
@@ -118,11 +98,18 @@ layout = dbc.Container([
                         style_table={"overflowX": "auto"},
                         style_cell={"textAlign": "left", "padding": "8px", "fontSize": "13px"},
                         style_header={"backgroundColor": "#f8f9fa", "fontWeight": "bold"},
-                        page_size=12,
+                        # Pagination et tri côté serveur (seule la page visible est envoyée)
+                        page_current=0,
+                        page_size=PAGE_SIZE,
+                        page_action="custom",
+                        sort_action="custom",
+                        sort_mode="single",
+                        sort_by=[],
                         row_selectable="single",
                         selected_rows=[],
                         data=[]  # Sera rempli par le callback
-                    )
+                    ),
+                    html.Div(id="annotations-total", className="text-muted small mt-2")
                 ])
             ]),
             
@@ -150,8 +137,8 @@ layout = dbc.Container([
                         # Canvas pour modification - Outils simplifiés
                         DashCanvas(
                             id="modification-canvas",
-                            width=500,
-                            height=350,
+                            width=CANVAS_WIDTH,
+                            height=CANVAS_HEIGHT,
                             tool="rectangle", 
                             hide_buttons=["zoom", "pan", "line", "pencil", "select", "download", "pen"],
                             lineWidth=3,
@@ -184,25 +171,38 @@ layout = dbc.Container([
     ], className="g-3"),  # Espacement entre colonnes
     
     # Store pour déclencher les actualisations du tableau
-    dcc.Store(id="table-refresh-trigger")
+    dcc.Store(id="table-refresh-trigger"),
+    # Version de l'annotation sélectionnée au moment de sa lecture (écriture conditionnelle)
+    dcc.Store(id="selected-annotation-version")
 ], fluid=True)
 
-def get_filtered_table_data(selected_annotator, selected_image):
-    """Génère les données filtrées du tableau"""
-    annotations = get_all_annotations()
-    
-    # Appliquer les filtres
-    filtered_annotations = annotations
-    if selected_annotator and selected_annotator != "Tous":
-        filtered_annotations = [ann for ann in filtered_annotations 
-                              if ann["annotator"] == selected_annotator]
-    if selected_image and selected_image != "Toutes":
-        filtered_annotations = [ann for ann in filtered_annotations 
-                              if ann["image"] == selected_image]
+def get_filtered_table_data(selected_annotator, selected_image, page_current=0, page_size=PAGE_SIZE, sort_by=None):
+    """Génère les lignes de la page demandée du tableau filtré et trié.
+
+    Returns:
+        (lignes de la page, nombre total d'annotations filtrées)
+    """
+    annotator = selected_annotator if selected_annotator and selected_annotator != "Tous" else None
+    image = selected_image if selected_image and selected_image != "Toutes" else None
+    sort_column, descending = None, False
+    if sort_by:
+        sort_column = SORT_COLUMNS.get(sort_by[0]["column_id"])
+        descending = sort_by[0].get("direction") == "desc"
+
+    page_current = page_current or 0
+    page_size = page_size or PAGE_SIZE
+    page_annotations, total = query_annotations(
+        annotator=annotator,
+        image=image,
+        sort_column=sort_column,
+        descending=descending,
+        offset=page_current * page_size,
+        limit=page_size,
+    )
     
-    # Préparer les données pour le tableau
+    # Préparer les données pour le tableau (page visible uniquement)
     table_data = []
-    for ann in filtered_annotations:
+    for ann in page_annotations:
         table_data.append({
             "id": ann["id"],
             "image_name": ann["image"],
@@ -211,40 +211,71 @@ def get_filtered_table_data(selected_annotator, selected_image):
             "timestamp": ann["timestamp"][:19].replace("T", " ")
         })
     
-    return table_data
+    return table_data, total
 
 def register_callbacks(app):
-    # Callback pour remplir les options des filtres
+    # Options des filtres chargées à la demande selon le texte saisi (préfixe)
+    def _search_options(field, search_value, value):
+        values = search_distinct_values(field, search_value or "", FILTER_OPTIONS_LIMIT)
+        # Conserver la valeur sélectionnée dans les options pour qu'elle reste affichée
+        if value and value not in values:
+            values.insert(0, value)
+        return [{"label": v, "value": v} for v in values]
+
     @app.callback(
         Output("filter-annotator", "options"),
+        Input("filter-annotator", "search_value"),
+        State("filter-annotator", "value")
+    )
+    def update_annotator_options(search_value, value):
+        return _search_options("annotator", search_value, value)
+
+    @app.callback(
         Output("filter-image", "options"),
-        Input("annotations-table", "id")  # Trigger au chargement
+        Input("filter-image", "search_value"),
+        State("filter-image", "value")
     )
-    def update_filter_options(_):
-        all_annotations = get_all_annotations()
-        
-        if not all_annotations:
-            return [], []
-        
-        # Options pour annoteurs
-        annotators = list(set(ann["annotator"] for ann in all_annotations))
-        annotator_options = [{"label": ann, "value": ann} for ann in sorted(annotators)]
-        
-        # Options pour images
-        images = list(set(ann["image"] for ann in all_annotations))
-        image_options = [{"label": img, "value": img} for img in sorted(images)]
-        
-        return annotator_options, image_options
+    def update_image_options(search_value, value):
+        return _search_options("image", search_value, value)
     
-    # Callback pour mettre à jour le tableau selon les filtres
+    # Retour à la première page quand les filtres changent
+    @app.callback(
+        Output("annotations-table", "page_current"),
+        [Input("filter-annotator", "value"),
+         Input("filter-image", "value")],
+        prevent_initial_call=True
+    )
+    def reset_page(selected_annotator, selected_image):
+        return 0
+
+    # La sélection porte sur la page affichée : on la vide quand la page change
     @app.callback(
-        Output("annotations-table", "data"),
+        Output("annotations-table", "selected_rows"),
+        [Input("annotations-table", "page_current"),
+         Input("annotations-table", "sort_by")],
+        prevent_initial_call=True
+    )
+    def reset_selection(page_current, sort_by):
+        return []
+
+    # Callback pour mettre à jour le tableau selon les filtres, la page et le tri
+    @app.callback(
+        [Output("annotations-table", "data"),
+         Output("annotations-table", "page_count"),
+         Output("annotations-total", "children")],
         [Input("filter-annotator", "value"),
          Input("filter-image", "value"),
-         Input("table-refresh-trigger", "data")]  # Écoute aussi les changements du store
+         Input("table-refresh-trigger", "data"),  # Écoute aussi les changements du store
+         Input("annotations-table", "page_current"),
+         Input("annotations-table", "page_size"),
+         Input("annotations-table", "sort_by")]
     )
-    def update_table(selected_annotator, selected_image, refresh_trigger):
-        return get_filtered_table_data(selected_annotator, selected_image)
+    def update_table(selected_annotator, selected_image, refresh_trigger, page_current, page_size, sort_by):
+        page_size = page_size or PAGE_SIZE
+        table_data, total = get_filtered_table_data(selected_annotator, selected_image,
+                                                    page_current, page_size, sort_by)
+        page_count = max(1, -(-total // page_size))
+        return table_data, page_count, f"{total} annotation(s)"
     
     # Callback pour afficher la modification quand on sélectionne une ligne
     @app.callback(
@@ -253,38 +284,32 @@ def register_callbacks(app):
          Output("modification-canvas", "json_data"),
          Output("modification-info", "children"),
          Output("history-section", "style"),
-         Output("modification-history", "children")],
+         Output("modification-history", "children"),
+         Output("selected-annotation-version", "data")],
         Input("annotations-table", "selected_rows"),
         State("annotations-table", "data")
     )
     def handle_row_selection(selected_rows, table_data):
         if not selected_rows or not table_data:
-            return {"display": "none"}, "", '{"version": "4.6.0", "objects": []}', "", {"display": "none"}, "Sélectionnez une annotation pour voir son historique"
+            return {"display": "none"}, "", '{"version": "4.6.0", "objects": []}', "", {"display": "none"}, "Sélectionnez une annotation pour voir son historique", None
         
         # Récupérer l'annotation sélectionnée
         selected_row = table_data[selected_rows[0]]
         annotation_id = selected_row["id"]
         
         # Récupérer l'annotation complète
-        all_annotations = get_all_annotations()
-        selected_annotation = next((ann for ann in all_annotations if ann["id"] == annotation_id), None)
+        selected_annotation = get_annotation_by_id(annotation_id)
         
         if not selected_annotation:
-            return {"display": "none"}, "", '{"version": "4.6.0", "objects": []}', "", {"display": "none"}, "Annotation introuvable"
+            return {"display": "none"}, "", '{"version": "4.6.0", "objects": []}', "", {"display": "none"}, "Annotation introuvable", None
         
         image_name = selected_annotation["image"]
-        image_path = os.path.join(IMAGES_DIR, image_name)
-        existing_rectangles = selected_annotation["rectangles"]
-        annotator_color = get_annotator_color(selected_annotation["annotator"])
+        image_path = os.path.join(images_dir(), image_name)
         
         # Canvas pour modification avec image composite
         if os.path.exists(image_path):
             # Créer une image avec seulement les rectangles de l'annotation sélectionnée
-            canvas_image_src = create_image_with_rectangles(
-                image_path, 
-                existing_rectangles, 
-                annotator_color
-            )
+            canvas_image_src = create_image_with_rectangles(selected_annotation)
         else:
             canvas_image_src = ""
         
@@ -341,25 +366,28 @@ def register_callbacks(app):
                 ], className="mb-2 p-2 border-start border-primary border-3")
             ]
         
-        return {"display": "block"}, canvas_image_src, json.dumps(canvas_json), info, {"display": "block"}, history_content
+        return ({"display": "block"}, canvas_image_src, json.dumps(canvas_json), info, {"display": "block"}, history_content,
+                get_version(selected_annotation))
     
     # Combine the callbacks for save-status and table-refresh-trigger
     @app.callback(
         [Output("review-save-status", "children"),
-         Output("table-refresh-trigger", "data")],
+         Output("table-refresh-trigger", "data"),
+         Output("selected-annotation-version", "data", allow_duplicate=True)],
         Input("save-additions", "n_clicks"),
         [State("modification-canvas", "json_data"),
          State("annotations-table", "selected_rows"),
          State("annotations-table", "data"),
-         State("modifier-name", "value")],
+         State("modifier-name", "value"),
+         State("selected-annotation-version", "data")],
         prevent_initial_call=True
     )
-    def save_additions_and_refresh_table(n_clicks, canvas_data, selected_rows, table_data, modifier_name):
+    def save_additions_and_refresh_table(n_clicks, canvas_data, selected_rows, table_data, modifier_name, expected_version):
         if not n_clicks or not selected_rows or not table_data:
-            return "", 0
+            return "", 0, dash.no_update
 
         if not modifier_name or not modifier_name.strip():
-            return html.Span("❌ Veuillez saisir votre nom", className="text-danger"), 0
+            return html.Span("❌ Veuillez saisir votre nom", className="text-danger"), 0, dash.no_update
 
         # Récupérer l'annotation sélectionnée
         selected_row = table_data[selected_rows[0]]
@@ -370,7 +398,7 @@ def register_callbacks(app):
             try:
                 canvas_data = json.loads(canvas_data)
             except json.JSONDecodeError:
-                return html.Span("❌ Erreur parsing canvas data", className="text-danger"), 0
+                return html.Span("❌ Erreur parsing canvas data", className="text-danger"), 0, dash.no_update
 
         # Extraire les nouveaux rectangles du canvas
         new_rectangles = []
@@ -380,36 +408,52 @@ def register_callbacks(app):
                     rect = {
                         "x": int(float(obj.get("left", 0))),
                         "y": int(float(obj.get("top", 0))),
-                        "width": int(float(obj.get("width", 0))),
-                        "height": int(float(obj.get("height", 0))),
+                        # Un rectangle redimensionné dans le canvas garde width/height et porte scaleX/scaleY
+                        "width": int(float(obj.get("width", 0)) * float(obj.get("scaleX", 1))),
+                        "height": int(float(obj.get("height", 0)) * float(obj.get("scaleY", 1))),
                         "color": get_annotator_color(modifier_name.strip())
                     }
                     new_rectangles.append(rect)
 
         if not new_rectangles:
-            return html.Span("❌ Aucun nouveau rectangle à sauvegarder", className="text-warning"), 0
+            return html.Span("❌ Aucun nouveau rectangle à sauvegarder", className="text-warning"), 0, dash.no_update
+
+        # Coordonnées canvas -> pixels de l'image originale
+        image_path = os.path.join(images_dir(), image_name)
+        if os.path.exists(image_path):
+            to_original = canvas_to_original_factor(image_path, CANVAS_WIDTH)
+            new_rectangles = [scale_rect(rect, to_original) for rect in new_rectangles]
 
         try:
             # Récupérer l'annotation existante complète depuis le JSON
             selected_annotation_id = selected_row["id"]
-            all_annotations = get_all_annotations()
-            selected_annotation = next((ann for ann in all_annotations if ann["id"] == selected_annotation_id), None)
+            selected_annotation = get_annotation_by_id(selected_annotation_id)
 
             if not selected_annotation:
-                return html.Span("❌ Annotation introuvable", className="text-danger"), 0
+                return html.Span("❌ Annotation introuvable", className="text-danger"), 0, dash.no_update
 
             # Combiner les rectangles existants avec les nouveaux
             existing_rectangles = selected_annotation["rectangles"]
             all_rectangles = existing_rectangles + new_rectangles
 
-            # Mettre à jour l'annotation existante avec l'historique
-            success = update_annotation(selected_annotation_id, all_rectangles, modifier_name.strip(), len(new_rectangles))
+            # Mettre à jour l'annotation existante avec l'historique, seulement si personne
+            # ne l'a modifiée depuis qu'elle a été ouverte
+            success = update_annotation(selected_annotation_id, all_rectangles, modifier_name.strip(), len(new_rectangles),
+                                        expected_version=expected_version)
 
             if success:
                 import time
-                return html.Span(f"✅ {len(new_rectangles)} rectangle(s) ajouté(s) ! Total: {len(all_rectangles)} rectangles",
-                                 className="text-success"), time.time()
+                # Notre écriture a incrémenté la version attendue
+                new_version = expected_version + 1 if expected_version is not None else dash.no_update
+                return (html.Span(f"✅ {len(new_rectangles)} rectangle(s) ajouté(s) ! Total: {len(all_rectangles)} rectangles",
+                                  className="text-success"), time.time(), new_version)
             else:
-                return html.Span("❌ Erreur lors de la mise à jour", className="text-danger"), 0
+                return html.Span("❌ Erreur lors de la mise à jour", className="text-danger"), 0, dash.no_update
+        except VersionConflictError as e:
+            import time
+            return (html.Span(f"⚠️ Conflit : l'annotation #{e.annotation_id} a été modifiée par quelqu'un d'autre "
+                              f"(version {e.current_version}). Resélectionnez-la pour voir la dernière version "
+                              f"avant d'ajouter vos rectangles.",
+                              className="text-warning"), time.time(), dash.no_update)
         except Exception as e:
-            return html.Span(f"❌ Erreur: {str(e)}", className="text-danger"), 0
\ No newline at end of file
+            return html.Span(f"❌ Erreur: {str(e)}", className="text-danger"), 0, dash.no_update
@@ -1,16 +1,21 @@
 import os
 import json
 import dash
-from dash import html, dcc, Output, Input
+from dash import html, dcc, Output, Input, State
 from dash.dcc import send_string
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import plotly.express as px
-from services.json_annotations import get_all_annotations, IMAGES_DIR
+from services.json_annotations import get_all_annotations, data_signature, get_catalog, images_dir
+from services.app_cache import cached_for_data_version
 from PIL import Image
 
 # Page stats : enregistrement de la page dans Dash
 dash.register_page(__name__, path="/stats", name="Stats")
 
+# Lignes affichées dans le tableau des images non annotées (le total est indiqué)
+UNANNOTATED_TABLE_LIMIT = 200
+
 # --- Helper robuste ---
 def safe_load(s):
     """Décodage récursif d'une chaîne JSON (retourne un dict ou {})."""
@@ -28,19 +33,31 @@ def count_objects(rectangles):
     """Compte les rectangles dans une liste."""
     return len(rectangles)
 
+# --- Comptes partagés par les graphiques et le tableau ---
+def _compute_counts():
+    """Rectangles par image et par annotateur, en un seul parcours des annotations."""
+    per_image, per_user = {}, {}
+    for ann in get_all_annotations():
+        n = len(ann["rectangles"])
+        per_image[ann["image"]] = per_image.get(ann["image"], 0) + n
+        per_user[ann["annotator"]] = per_user.get(ann["annotator"], 0) + n
+    return {"per_image": per_image, "per_user": per_user}
+
+def stats_counts():
+    """Comptes calculés une fois par version des données (cache partagé entre workers)."""
+    return cached_for_data_version("stats_counts", _compute_counts)
+
+def _images_version():
+    # Change à chaque ajout ou suppression d'image, identique dans tous les workers
+    return get_catalog().signature()
+
 # --- Graphique : nombre d’annotations par image ---
 def fig_per_image():
-    annotations = get_all_annotations()
-    if not annotations:
+    counts = stats_counts()["per_image"]
+    if not counts:
         print("DEBUG: Aucune annotation trouvée dans get_all_annotations()")  # Ajout d'un log
         return px.bar(title="Aucune annotation disponible")
 
-    # Compter les rectangles par image
-    counts = {}
-    for ann in annotations:
-        image = ann["image"]
-        counts[image] = counts.get(image, 0) + len(ann["rectangles"])
-
     counts_df = [{"image": img, "n_boxes": count} for img, count in counts.items()]
     counts_df = sorted(counts_df, key=lambda x: x["image"])
 
@@ -55,17 +72,11 @@ def fig_per_image():
 
 # --- Graphique : nombre d’annotations par utilisateur ---
 def fig_per_user():
-    annotations = get_all_annotations()
-    if not annotations:
+    counts = stats_counts()["per_user"]
+    if not counts:
         print("DEBUG: Aucune annotation trouvée dans get_all_annotations()")  # Ajout d'un log
         return px.bar(title="Aucune annotation disponible")
 
-    # Compter les rectangles par annotateur
-    counts = {}
-    for ann in annotations:
-        annotator = ann["annotator"]
-        counts[annotator] = counts.get(annotator, 0) + len(ann["rectangles"])
-
     counts_df = [{"annotator": user, "n_boxes": count} for user, count in counts.items()]
     counts_df = sorted(counts_df, key=lambda x: x["annotator"])
 
@@ -79,19 +90,18 @@ def fig_per_user():
 
 # --- Tableau HTML : images sans annotations ---
 def table_unannotated():
-    all_imgs = [f for f in os.listdir(IMAGES_DIR) if f.lower().endswith((".jpg", ".jpeg", ".png"))]
-    annotations = get_all_annotations()
-
-    annotated_images = {ann["image"] for ann in annotations}
-    missing = [img for img in all_imgs if img not in annotated_images]
+    annotated_images = stats_counts()["per_image"]
+    missing = [img for img in get_catalog().names() if img not in annotated_images]
 
-    print(f"DEBUG: Images non annotées: {missing}")  # Ajout d'un log
+    print(f"DEBUG: Images non annotées: {len(missing)}")  # Ajout d'un log
     if not missing:
         return html.Div("🎉 Toutes les images ont été annotées !", className="text-success")
 
-    rows = [html.Tr([html.Td(img)]) for img in missing]
+    rows = [html.Tr([html.Td(img)]) for img in missing[:UNANNOTATED_TABLE_LIMIT]]
+    if len(missing) > UNANNOTATED_TABLE_LIMIT:
+        rows.append(html.Tr([html.Td(f"… et {len(missing) - UNANNOTATED_TABLE_LIMIT} autres", className="text-muted")]))
     return html.Table(
-        [html.Thead(html.Tr([html.Th("Images non annotées")]))] +
+        [html.Thead(html.Tr([html.Th(f"Images non annotées ({len(missing)})")]))] +
         [html.Tbody(rows)],
         style={"width": "100%", "border": "1px solid #ccc", "textAlign": "center"}
     )
@@ -115,7 +125,7 @@ def generate_coco():
         # Construire les données COCO
         for img_id, (image_name, anns) in enumerate(grouped_annotations.items(), start=1):
             # Ajouter les métadonnées de l'image
-            path = os.path.join(IMAGES_DIR, image_name)
+            path = os.path.join(images_dir(), image_name)
             if not os.path.exists(path):
                 continue
             w, h = Image.open(path).size
@@ -151,6 +161,8 @@ def generate_coco():
 # --- Layout ---
 layout = dbc.Container([
     dcc.Interval(id="refresh-stats", interval=3000, n_intervals=0),
+    # Version des données affichées : le rafraîchissement périodique ne renvoie rien si elle n'a pas changé
+    dcc.Store(id="stats-version"),
 
     dbc.Row([
         dbc.Col(dbc.Card([
@@ -186,11 +198,16 @@ def register_callbacks(app):
         Output("graph-per-image", "figure"),
         Output("graph-per-user", "figure"),
         Output("table-unannotated", "children"),
-        Input("refresh-stats", "n_intervals")
+        Output("stats-version", "data"),
+        Input("refresh-stats", "n_intervals"),
+        State("stats-version", "data")
     )
-    def update_stats(_):
+    def update_stats(_, displayed_version):
+        version = f"{data_signature()}:{_images_version()}"
+        if version == displayed_version:
+            raise PreventUpdate
         print("DEBUG: Mise à jour des statistiques")  # Ajout d'un log
-        return fig_per_image(), fig_per_user(), table_unannotated()
+        return fig_per_image(), fig_per_user(), table_unannotated(), version
 
     @app.callback(
         Output("download-coco-json", "data"),
@@ -199,7 +216,8 @@ def register_callbacks(app):
     )
     def export_coco(n_clicks):
         try:
-            coco_data = generate_coco()
+            # L'export lit aussi la taille des images : clé liée au catalogue
+            coco_data = cached_for_data_version("coco_export", generate_coco, _images_version())
             return send_string(coco_data, "annotations_coco.json")
         except Exception as e:
             return send_string(f"Erreur export : {e}", "erreur.txt")
\ No newline at end of file
@@ -1,35 +1,37 @@
 import os, json
 import pandas as pd
 from datetime import datetime
+from .image_catalog import get_image_catalog
+from .datasets import DEFAULT, current_dataset
 
-# Dossiers (on respecte data/cars_detection/ existant)
-DATA_DIR = "data"
-IMAGES_DIR = os.path.join(DATA_DIR, "cars_detection")
-ANN_PATH = os.path.join(DATA_DIR, "annotations.csv")
+# Dossiers du jeu "default" (on respecte data/cars_detection/ existant) ;
+# les fonctions travaillent sur le jeu de données actif
+DATA_DIR = DEFAULT.data_dir
+IMAGES_DIR = DEFAULT.images_dir
+ANN_PATH = DEFAULT.annotations_csv
 
 # ajout de la colonne id en première position
 COLUMNS = ["id", "image", "annotator", "timestamp", "boxes_json"]
 
 def ensure_dirs():
-    os.makedirs(IMAGES_DIR, exist_ok=True)
-    os.makedirs(DATA_DIR, exist_ok=True)
+    dataset = current_dataset()
+    os.makedirs(dataset.images_dir, exist_ok=True)
+    os.makedirs(dataset.data_dir, exist_ok=True)
 
 def list_images():
-    """Liste triée des fichiers image dans data/cars_detection/."""
+    """Liste triée des images du jeu actif (catalogue incrémental, sous-dossiers compris)."""
     ensure_dirs()
-    imgs = [f for f in os.listdir(IMAGES_DIR) if f.lower().endswith((".jpg", ".jpeg", ".png"))]
-    imgs.sort()
-    return imgs
+    return list(get_image_catalog(current_dataset().images_dir).names())
 
 def init_csv():
     ensure_dirs()
-    if not os.path.exists(ANN_PATH):
+    if not os.path.exists(current_dataset().annotations_csv):
         # on initialise avec le bon en-tête
-        pd.DataFrame(columns=COLUMNS).to_csv(ANN_PATH, index=False)
+        pd.DataFrame(columns=COLUMNS).to_csv(current_dataset().annotations_csv, index=False)
 
 def _read_df():
     init_csv()
-    df = pd.read_csv(ANN_PATH)
+    df = pd.read_csv(current_dataset().annotations_csv)
     # suppression propre d'une éventuelle colonne level_0
     return df.drop(columns=["level_0"], errors="ignore")
 
@@ -46,7 +48,7 @@ def save_annotation(image: str, annotator: str, boxes_json: dict):
         "boxes_json": json.dumps(boxes_json or {})
     }
     df = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
-    df.to_csv(ANN_PATH, index=False)
+    df.to_csv(current_dataset().annotations_csv, index=False)
 
 def load_annotations(image: str = None, annotator: str = None):
     """Charge les annotations (filtrables)."""
@@ -60,4 +62,4 @@ def load_annotations(image: str = None, annotator: str = None):
 # nouvelle fonction pour écraser le CSV avec un DataFrame complet (incluant 'id')
 def save_annotations(df: pd.DataFrame):
     """Overwrite the CSV with the given DataFrame."""
-    df.to_csv(ANN_PATH, index=False)
+    df.to_csv(current_dataset().annotations_csv, index=False)
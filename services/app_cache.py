@@ -0,0 +1,27 @@
+from flask import current_app, has_app_context
+from services.json_annotations import data_signature
+
+# Cache applicatif partagé (Flask-Caching "FileSystemCache" configuré dans app.py, commun
+# à tous les workers). Les clés portent le jeton de version des données : une écriture,
+# dans n'importe quel worker, rend les anciennes entrées inaccessibles (elles sont ensuite
+# évincées par CACHE_THRESHOLD), sans invalidation explicite ni expiration.
+
+def _app_cache():
+    return current_app.config.get("APP_CACHE") if has_app_context() else None
+
+def cached_for_data_version(name: str, compute, extra_version: str = ""):
+    """
+    Valeur de ``compute()`` calculée une seule fois par version des données.
+    ``extra_version`` : autres entrées du calcul (ex. signature du catalogue d'images).
+    Hors contexte Flask (scripts, benchmarks), calcule directement.
+    """
+    cache = _app_cache()
+    if cache is None:
+        return compute()
+    # Jeton lu AVANT le calcul : au pire, des données plus récentes sous l'ancienne clé
+    key = f"{name}:{data_signature()}:{extra_version}"
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout=0)
+    return value
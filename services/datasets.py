@@ -0,0 +1,160 @@
+"""
+Jeux de données (projets) : chacun a son dossier d'images et son store d'annotations,
+de sorte que le volume traité par chaque opération (index, stats, export, révision) est
+celui du projet et non le total de tous les projets.
+
+- "default" : arborescence historique (data/cars_detection, data/annotations.json) ;
+- les autres : data/datasets/<nom>/ avec annotations.json et images/ ; un fichier
+  dataset.json optionnel ({"images_dir": "/chemin/vers/images"}) désigne un autre dossier
+  d'images.
+
+Le jeu actif est propre à chaque requête (contextvars) : il est choisi par session dans
+l'interface (cookie) ou par le paramètre ``?d=<nom>`` des URLs d'images. Les scripts
+utilisent ``use_dataset(nom)`` ou leur option ``--dataset``.
+
+    python -m services.datasets list
+    python -m services.datasets create parking-2025 --images /mnt/photos/parking
+"""
+import os
+import re
+import json
+import argparse
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+DATA_DIR = "data"
+DATASETS_DIR = os.environ.get("TURVOI_DATASETS_DIR", os.path.join(DATA_DIR, "datasets"))
+DEFAULT_DATASET = "default"
+DATASET_CONFIG = "dataset.json"
+# Choix de l'utilisateur (un an), et paramètre prioritaire des URLs d'images
+DATASET_COOKIE = "turvoi_dataset"
+DATASET_COOKIE_MAX_AGE = 365 * 24 * 3600
+DATASET_PARAM = "d"
+# Noms utilisables tels quels dans un chemin, une URL et un cookie
+_NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+class Dataset:
+    """Chemins d'un jeu de données."""
+
+    def __init__(self, name: str, data_dir: str, images_dir: str = None):
+        self.name = name
+        self.data_dir = data_dir
+        self.images_dir = images_dir or os.path.join(data_dir, "images")
+        self.annotations_json = os.path.join(data_dir, "annotations.json")
+        self.annotations_csv = os.path.join(data_dir, "annotations.csv")
+
+    def __repr__(self):
+        return f"Dataset({self.name!r}, images={self.images_dir!r})"
+
+DEFAULT = Dataset(DEFAULT_DATASET, DATA_DIR, os.path.join(DATA_DIR, "cars_detection"))
+
+_datasets: Dict[str, Dataset] = {}
+_datasets_lock = threading.Lock()
+_active = contextvars.ContextVar("turvoi_dataset", default=None)
+
+def is_valid_name(name: str) -> bool:
+    return bool(name) and bool(_NAME_PATTERN.match(name))
+
+def _dataset_dir(name: str) -> str:
+    return os.path.join(DATASETS_DIR, name)
+
+def _load_dataset(name: str) -> Optional[Dataset]:
+    data_dir = _dataset_dir(name)
+    if not os.path.isdir(data_dir):
+        return None
+    images_dir = None
+    config_path = os.path.join(data_dir, DATASET_CONFIG)
+    if os.path.exists(config_path):
+        with open(config_path, "r", encoding="utf-8") as f:
+            images_dir = json.load(f).get("images_dir")
+    return Dataset(name, data_dir, images_dir)
+
+def get_dataset(name: str) -> Optional[Dataset]:
+    """Jeu de données ``name`` (None s'il n'existe pas ou si le nom est invalide)."""
+    if name == DEFAULT_DATASET:
+        return DEFAULT
+    if not is_valid_name(name):
+        return None
+    with _datasets_lock:
+        dataset = _datasets.get(name)
+    if dataset is None:
+        dataset = _load_dataset(name)
+        if dataset is not None:
+            with _datasets_lock:
+                _datasets[name] = dataset
+    return dataset
+
+def list_datasets() -> List[str]:
+    """Noms des jeux disponibles, "default" en premier."""
+    names = []
+    if os.path.isdir(DATASETS_DIR):
+        names = sorted(entry.name for entry in os.scandir(DATASETS_DIR)
+                       if entry.is_dir() and is_valid_name(entry.name) and entry.name != DEFAULT_DATASET)
+    return [DEFAULT_DATASET] + names
+
+def create_dataset(name: str, images_dir: str = None) -> Dataset:
+    """Crée le dossier d'un nouveau jeu (images dans ``images_dir`` si fourni)."""
+    if not is_valid_name(name) or name == DEFAULT_DATASET:
+        raise ValueError(f"Nom de jeu de données invalide : {name!r}")
+    data_dir = _dataset_dir(name)
+    os.makedirs(data_dir, exist_ok=True)
+    if images_dir:
+        with open(os.path.join(data_dir, DATASET_CONFIG), "w", encoding="utf-8") as f:
+            json.dump({"images_dir": os.path.abspath(images_dir)}, f, indent=2)
+    else:
+        os.makedirs(os.path.join(data_dir, "images"), exist_ok=True)
+    with _datasets_lock:
+        _datasets.pop(name, None)
+    return get_dataset(name)
+
+def current_dataset() -> Dataset:
+    """Jeu de données actif de la requête (ou du script) en cours."""
+    return _active.get() or DEFAULT
+
+def set_current_dataset(name: Optional[str]) -> Dataset:
+    """Active ``name`` pour le contexte courant ; un nom inconnu revient à "default"."""
+    dataset = (get_dataset(name) if name else None) or DEFAULT
+    _active.set(dataset)
+    return dataset
+
+@contextmanager
+def use_dataset(name: str):
+    """Active un jeu de données le temps d'un bloc (scripts, tâches de fond)."""
+    dataset = get_dataset(name)
+    if dataset is None:
+        raise ValueError(f"Jeu de données inconnu : {name!r}")
+    token = _active.set(dataset)
+    try:
+        yield dataset
+    finally:
+        _active.reset(token)
+
+def register_dataset_selection(server):
+    """Chaque requête Flask (callbacks Dash, routes d'images) s'exécute dans le jeu choisi."""
+    from flask import request
+
+    @server.before_request
+    def _select_dataset():
+        set_current_dataset(request.args.get(DATASET_PARAM) or request.cookies.get(DATASET_COOKIE))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="liste les jeux de données")
+    create = commands.add_parser("create", help="crée un jeu de données")
+    create.add_argument("name")
+    create.add_argument("--images", help="dossier d'images existant (sinon <jeu>/images)")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for name in list_datasets():
+            dataset = get_dataset(name)
+            print(f"{name:<24}{dataset.images_dir}")
+    else:
+        dataset = create_dataset(args.name, args.images)
+        print(f"Jeu {dataset.name} créé : {dataset.data_dir} (images : {dataset.images_dir})")
+
+if __name__ == "__main__":
+    main()
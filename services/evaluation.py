@@ -0,0 +1,244 @@
+"""
+Évaluation du détecteur de "Le Futur" contre les annotations humaines (métriques COCO).
+
+    python -m services.evaluation                       # prédictions = annotations "model"
+    python -m services.evaluation --predictions preds.json
+    python -m services.evaluation --run-model           # détecteur (via le cache de résultats)
+    python -m services.evaluation --dataset parking-2025
+
+Vérité terrain : pour chaque image, la dernière annotation finale humaine
+(get_final_annotations_for_image ; une correction humaine d'une pré-annotation compte
+comme vérité terrain). Calcul vectorisé sur toutes les images à la fois : l'appariement
+glouton COCO est fait rang par rang, chaque rang traitant toutes les images ensemble.
+"""
+import os
+import json
+import argparse
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from services.json_annotations import (
+    MODEL_ANNOTATOR, images_dir, get_index, get_final_annotations_for_image
+)
+from services.datasets import DEFAULT_DATASET, use_dataset
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+RECALL_THRESHOLDS = np.linspace(0.0, 1.0, 101)
+MAX_DETECTIONS = (1, 10, 100)
+
+# Boîtes : tableaux (N, 4) en (x1, y1, x2, y2), pixels de l'image originale
+def rects_to_boxes(rectangles: List[Dict]) -> List[List[float]]:
+    return [[r["x"], r["y"], r["x"] + r["width"], r["y"] + r["height"]] for r in rectangles]
+
+def ground_truth_from_store(annotator: str = None) -> Dict[str, List[List[float]]]:
+    """Dernière annotation finale humaine de chaque image (ou celle de ``annotator``)."""
+    ground_truth = {}
+    for image in get_index().by_image:
+        finals = [a for a in get_final_annotations_for_image(image) if a["annotator"] != MODEL_ANNOTATOR]
+        if annotator:
+            finals = [a for a in finals if a["annotator"] == annotator]
+        if finals:
+            latest = max(finals, key=lambda a: a["timestamp"])
+            ground_truth[image] = rects_to_boxes(latest["rectangles"])
+    return ground_truth
+
+def predictions_from_store() -> Dict[str, List[Dict]]:
+    """Pré-annotations du détecteur (annotateur "model", scores dans les rectangles)."""
+    index = get_index()
+    predictions = {}
+    for pos in index.by_annotator.get(MODEL_ANNOTATOR, []):
+        ann = index.annotations[pos]
+        if ann.get("is_modification"):
+            continue
+        predictions.setdefault(ann["image"], []).extend(
+            {"box": box, "score": r.get("score", 1.0)}
+            for box, r in zip(rects_to_boxes(ann["rectangles"]), ann["rectangles"])
+        )
+    return predictions
+
+def load_predictions(path: str) -> Dict[str, List[Dict]]:
+    """Fichier JSON {image: [{"box": [x1, y1, x2, y2], "score": s}, ...]}."""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def predictions_from_model(images: List[str], score_threshold: float = 0.05, batch_size: int = 8) -> Dict[str, List[Dict]]:
+    """Fait tourner le détecteur (les résultats déjà calculés viennent du cache d'inférence)."""
+    from PIL import Image
+    from services import inference
+
+    predictions = {}
+    for start in range(0, len(images), batch_size):
+        names = images[start:start + batch_size]
+        pils = [Image.open(os.path.join(images_dir(), n)).convert("RGB") for n in names]
+        for name, detections in zip(names, inference.run_inference_cars(pils, score_threshold)):
+            predictions[name] = detections
+    return predictions
+
+def _flatten(per_image: Dict, images: List[str], with_scores: bool):
+    """Concatène les boîtes de toutes les images : (boîtes, indice d'image[, scores])."""
+    image_pos = {name: i for i, name in enumerate(images)}
+    boxes, owners, scores = [], [], []
+    for name, items in per_image.items():
+        i = image_pos.get(name)
+        if i is None:
+            continue
+        for item in items:
+            boxes.append(item["box"] if with_scores else item)
+            owners.append(i)
+            if with_scores:
+                scores.append(item["score"])
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    owners = np.asarray(owners, dtype=np.int64)
+    return boxes, owners, np.asarray(scores, dtype=np.float64)
+
+def _pairwise_iou(det_boxes, gt_boxes) -> np.ndarray:
+    """IoU ligne à ligne entre deux tableaux (M, 4) de même taille."""
+    ix1 = np.maximum(det_boxes[:, 0], gt_boxes[:, 0])
+    iy1 = np.maximum(det_boxes[:, 1], gt_boxes[:, 1])
+    ix2 = np.minimum(det_boxes[:, 2], gt_boxes[:, 2])
+    iy2 = np.minimum(det_boxes[:, 3], gt_boxes[:, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    area_d = (det_boxes[:, 2] - det_boxes[:, 0]) * (det_boxes[:, 3] - det_boxes[:, 1])
+    area_g = (gt_boxes[:, 2] - gt_boxes[:, 0]) * (gt_boxes[:, 3] - gt_boxes[:, 1])
+    union = area_d + area_g - inter
+    return np.where(union > 0, inter / np.where(union > 0, union, 1), 0.0)
+
+def match_detections(det_boxes, det_images, det_scores, gt_boxes, gt_images,
+                     iou_thresholds=IOU_THRESHOLDS, max_dets: int = max(MAX_DETECTIONS)):
+    """
+    Appariement glouton COCO (score décroissant, meilleure IoU libre) pour tous les seuils.
+    Retourne (tp booléen (T, D), rang de chaque détection dans son image, détections conservées).
+    """
+    # Tri par image puis score décroissant ; rang de chaque détection dans son image
+    order = np.lexsort((-det_scores, det_images))
+    det_boxes, det_images, det_scores = det_boxes[order], det_images[order], det_scores[order]
+    starts = np.searchsorted(det_images, det_images, side="left")
+    ranks = np.arange(len(det_images)) - starts
+    keep = ranks < max_dets
+    det_boxes, det_images, det_scores, ranks = det_boxes[keep], det_images[keep], det_scores[keep], ranks[keep]
+    n_det, n_thr = len(det_images), len(iou_thresholds)
+    tp = np.zeros((n_thr, n_det), dtype=bool)
+    if n_det == 0 or len(gt_images) == 0:
+        return tp, ranks, det_scores
+
+    # Toutes les paires (détection, vérité terrain) d'une même image
+    gt_order = np.argsort(gt_images, kind="stable")
+    gt_boxes, gt_images = gt_boxes[gt_order], gt_images[gt_order]
+    n_images = int(max(det_images.max(), gt_images.max())) + 1
+    gt_count = np.bincount(gt_images, minlength=n_images)
+    gt_start = np.concatenate(([0], np.cumsum(gt_count)[:-1]))
+    per_det = gt_count[det_images]
+    pair_det = np.repeat(np.arange(n_det), per_det)
+    offsets = np.arange(len(pair_det)) - np.repeat(np.cumsum(per_det) - per_det, per_det)
+    pair_gt = gt_start[det_images][pair_det] + offsets
+    pair_iou = _pairwise_iou(det_boxes[pair_det], gt_boxes[pair_gt])
+
+    gt_matched = np.zeros((n_thr, len(gt_images)), dtype=bool)
+    thresholds = np.asarray(iou_thresholds)[:, None]
+    pair_rank = ranks[pair_det]
+    # Les détections d'un même rang sont dans des images différentes : traitées ensemble
+    for rank in range(int(ranks.max()) + 1):
+        sel = np.nonzero(pair_rank == rank)[0]
+        if len(sel) == 0:
+            continue
+        dets, gts, ious = pair_det[sel], pair_gt[sel], pair_iou[sel]
+        candidate = np.where(gt_matched[:, gts] | (ious[None, :] < thresholds), -1.0, ious[None, :])
+        # Meilleure paire de chaque détection (segments contigus, paires triées par détection)
+        seg_starts = np.nonzero(np.r_[True, dets[1:] != dets[:-1]])[0]
+        best = np.maximum.reduceat(candidate, seg_starts, axis=1)
+        seg_of_pair = np.cumsum(np.r_[False, dets[1:] != dets[:-1]])
+        is_best = (candidate == best[:, seg_of_pair]) & (candidate >= 0)
+        # En cas d'égalité, la première vérité terrain de l'image l'emporte
+        position = np.where(is_best, np.arange(len(sel))[None, :], len(sel))
+        first = np.minimum.reduceat(position, seg_starts, axis=1)
+        t_idx, seg_idx = np.nonzero(first < len(sel))
+        chosen = first[t_idx, seg_idx]
+        gt_matched[t_idx, gts[chosen]] = True
+        tp[t_idx, dets[chosen]] = True
+    return tp, ranks, det_scores
+
+def _average_precision(tp_sorted: np.ndarray, n_gt: int) -> np.ndarray:
+    """AP interpolée sur 101 points de rappel, pour chaque seuil (lignes de ``tp_sorted``)."""
+    if n_gt == 0:
+        return np.full(tp_sorted.shape[0], np.nan)
+    tps = np.cumsum(tp_sorted, axis=1)
+    fps = np.cumsum(~tp_sorted, axis=1)
+    recall = tps / n_gt
+    precision = tps / np.maximum(tps + fps, np.finfo(np.float64).eps)
+    # Enveloppe décroissante de la précision
+    precision = np.flip(np.maximum.accumulate(np.flip(precision, axis=1), axis=1), axis=1)
+    ap = np.zeros(tp_sorted.shape[0])
+    for t in range(tp_sorted.shape[0]):
+        idx = np.searchsorted(recall[t], RECALL_THRESHOLDS, side="left")
+        valid = idx < recall.shape[1]
+        ap[t] = precision[t][idx[valid]].sum() / len(RECALL_THRESHOLDS)
+    return ap
+
+def _metric(value) -> Optional[float]:
+    """Valeur JSON d'une métrique : None quand elle n'est pas définie (NaN, sans vérité terrain)."""
+    value = float(value)
+    return None if np.isnan(value) else value
+
+def evaluate(ground_truth: Dict[str, List[List[float]]], predictions: Dict[str, List[Dict]],
+             iou_thresholds=IOU_THRESHOLDS) -> Dict:
+    """
+    Métriques COCO (une seule classe : voiture) sur les images de la vérité terrain.
+    Les prédictions sur des images sans vérité terrain sont ignorées.
+    """
+    images = sorted(ground_truth)
+    gt_boxes, gt_images, _ = _flatten(ground_truth, images, with_scores=False)
+    det_boxes, det_images, det_scores = _flatten(predictions, images, with_scores=True)
+    tp, ranks, det_scores = match_detections(det_boxes, det_images, det_scores, gt_boxes, gt_images,
+                                             iou_thresholds, max(MAX_DETECTIONS))
+    n_gt = len(gt_images)
+    order = np.argsort(-det_scores, kind="stable")
+    ap = _average_precision(tp[:, order], n_gt)
+
+    thresholds = list(np.round(iou_thresholds, 2))
+    result = {
+        "images": len(images),
+        "ground_truth_boxes": n_gt,
+        "detections": int(len(det_scores)),
+        "AP": float(np.nanmean(ap)) if n_gt else None,
+        "AP_per_iou": {f"{t:.2f}": _metric(v) for t, v in zip(thresholds, ap)},
+    }
+    for t in (0.5, 0.75):
+        if t in thresholds:
+            result[f"AP{int(t * 100)}"] = _metric(ap[thresholds.index(t)])
+    for m in MAX_DETECTIONS:
+        # Les rangs < m donnent le même appariement qu'une évaluation limitée à m détections
+        recall = tp[:, ranks < m].sum(axis=1) / n_gt if n_gt else np.full(len(thresholds), np.nan)
+        result[f"AR@{m}"] = float(np.nanmean(recall)) if n_gt else None
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--predictions", help="fichier JSON {image: [{box, score}]}")
+    source.add_argument("--run-model", action="store_true", help="calcule les prédictions avec le détecteur")
+    parser.add_argument("--annotator", help="vérité terrain d'un seul annotateur")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="jeu de données (services/datasets.py)")
+    parser.add_argument("--json", dest="json_path", help="écrit aussi les métriques dans ce fichier")
+    args = parser.parse_args(argv)
+
+    with use_dataset(args.dataset):
+        ground_truth = ground_truth_from_store(args.annotator)
+        if args.predictions:
+            predictions = load_predictions(args.predictions)
+        elif args.run_model:
+            predictions = predictions_from_model(sorted(ground_truth))
+        else:
+            predictions = predictions_from_store()
+    metrics = evaluate(ground_truth, predictions)
+
+    print(f"{metrics['images']} image(s), {metrics['ground_truth_boxes']} boîte(s) de référence, "
+          f"{metrics['detections']} détection(s)")
+    for key in ("AP", "AP50", "AP75", *(f"AR@{m}" for m in MAX_DETECTIONS)):
+        value = metrics.get(key)
+        print(f"  {key:<6} {value:.3f}" if value is not None else f"  {key:<6} -")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            # allow_nan=False : NaN n'est pas du JSON valide, les métriques indéfinies sont à None
+            json.dump(metrics, f, indent=2, allow_nan=False)
+
+if __name__ == "__main__":
+    main()
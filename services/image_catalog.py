@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+# Catalogue persistant des images d'un dossier (sous-dossiers compris, noms relatifs
+# "sous/dossier/image.jpg"). Rafraîchissement incrémental : seuls les dossiers dont le
+# mtime a changé sont relus, un rafraîchissement sans changement ne coûte qu'un stat par
+# dossier. Avec des centaines de milliers d'images, préférer des sous-dossiers (shards)
+# à un dossier plat : un ajout ne fait alors relire que son shard.
+# Limite : un fichier réécrit sur place (même nom) ne change pas le mtime de son dossier et
+# n'est donc pas vu ; remplacer une image par renommage (fichier temporaire + mv), ce qui
+# met à jour le mtime du dossier.
+CATALOG_DIR = os.environ.get("TURVOI_CATALOG_DIR", ".cache_catalog")
+# Intervalle minimal entre deux vérifications des dossiers (secondes) dans un processus
+CATALOG_REFRESH_INTERVAL = float(os.environ.get("TURVOI_CATALOG_REFRESH", "2"))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+class ImageCatalog:
+    """Liste triée des images avec correspondance nom <-> position en O(1).
+
+    La liste retournée par ``names()`` est partagée : ne pas la modifier.
+    """
+
+    def __init__(self, root: str, path: str = None):
+        self.root = root
+        self.path = path
+        self._lock = threading.Lock()
+        # Dossier relatif -> {"mtime", "files", "subdirs"} (noms relatifs à la racine)
+        self._dirs: Dict[str, Dict] = {}
+        self._names: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._signature = "0:0"
+        self._checked_at = 0.0
+        self._load()
+
+    # --- Persistance ---
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Catalogue d'images illisible ({self.path}), reconstruction : {e}")
+            return
+        if payload.get("root") == os.path.abspath(self.root):
+            self._dirs = payload.get("dirs", {})
+            self._rebuild()
+
+    def _save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"root": os.path.abspath(self.root), "dirs": self._dirs}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    # --- Rafraîchissement incrémental ---
+    def _scan_dir(self, rel: str, full: str, mtime: int) -> Dict:
+        files, subdirs = [], []
+        with os.scandir(full) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                name = f"{rel}/{entry.name}" if rel else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(name)
+                elif entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                    files.append(name)
+        return {"mtime": mtime, "files": files, "subdirs": subdirs}
+
+    def _rebuild(self):
+        names = sorted(name for entry in self._dirs.values() for name in entry["files"])
+        mtimes = [entry["mtime"] for entry in self._dirs.values()]
+        # Remplacement en un bloc : les lecteurs voient l'ancienne ou la nouvelle liste.
+        # La signature est calculée ici, sous le verrou de refresh(), et non à la lecture :
+        # parcourir _dirs pendant un rafraîchissement d'un autre thread n'est pas sûr.
+        self._names, self._positions = names, {name: i for i, name in enumerate(names)}
+        self._signature = f"{len(names)}:{max(mtimes, default=0)}"
+
+    def refresh(self, force: bool = False) -> bool:
+        """Relit les dossiers modifiés ; retourne True si le catalogue a changé."""
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._checked_at < CATALOG_REFRESH_INTERVAL:
+                return False
+            self._checked_at = now
+            changed, seen, stack = False, set(), [""]
+            while stack:
+                rel = stack.pop()
+                full = os.path.join(self.root, rel) if rel else self.root
+                try:
+                    # mtime lu AVANT le listing : un ajout pendant la lecture sera vu au prochain passage
+                    mtime = os.stat(full).st_mtime_ns
+                    entry = self._dirs.get(rel)
+                    if entry is None or entry["mtime"] != mtime:
+                        entry = self._scan_dir(rel, full, mtime)
+                        self._dirs[rel] = entry
+                        changed = True
+                except (FileNotFoundError, NotADirectoryError):
+                    continue
+                seen.add(rel)
+                stack.extend(entry["subdirs"])
+            for rel in set(self._dirs) - seen:
+                del self._dirs[rel]
+                changed = True
+            if changed:
+                self._rebuild()
+                self._save()
+            return changed
+
+    # --- Lecture ---
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def names(self) -> List[str]:
+        return self._names
+
+    def name_at(self, index: int) -> Optional[str]:
+        names = self._names
+        return names[index] if 0 <= index < len(names) else None
+
+    def index_of(self, name: str) -> Optional[int]:
+        return self._positions.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._positions
+
+    def signature(self) -> str:
+        """
+        Identique dans tous les processus tant que le contenu des dossiers ne change pas
+        (ajout, suppression ou renommage d'image). Une image réécrite sur place sans
+        renommage ne change pas la signature (voir la limite en tête de module).
+        """
+        return self._signature
+
+_catalogs: Dict[str, ImageCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+def catalog_path(root: str) -> str:
+    digest = hashlib.blake2b(os.path.abspath(root).encode(), digest_size=8).hexdigest()
+    return os.path.join(CATALOG_DIR, f"images_{digest}.json")
+
+def get_image_catalog(root: str) -> ImageCatalog:
+    """Catalogue (unique par processus) du dossier ``root``, rafraîchi si l'intervalle est écoulé."""
+    key = os.path.abspath(root)
+    with _catalogs_lock:
+        catalog = _catalogs.get(key)
+        if catalog is None:
+            catalog = _catalogs[key] = ImageCatalog(root, catalog_path(root))
+    catalog.refresh()
+    return catalog
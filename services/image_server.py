@@ -0,0 +1,106 @@
+import os
+from urllib.parse import quote
+from flask import abort, request, send_file
+from werkzeug.security import safe_join
+from services.json_annotations import images_dir, get_annotation_by_id, get_annotator_color
+from services.datasets import DATASET_PARAM, current_dataset
+from services.previews import get_preview_path, get_render_path
+
+# Routes Flask servant les images (originales, dérivés, rendus de relecture) par URL
+# plutôt qu'en base64 dans les réponses des callbacks Dash
+IMAGE_ROUTE = "/media/images"
+PREVIEW_ROUTE = "/media/previews"
+RENDER_ROUTE = "/media/renders"
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+# Seules les tailles des canvas de l'application (Annotate 800x600, Review 500x350) sont
+# servies : une URL forgée ne peut pas remplir le cache disque de dérivés arbitraires
+PREVIEW_BOXES = {(800, 600), (500, 350)}
+PREVIEW_SCALES = (1, 2)
+# Les URLs portent un paramètre de version (?v=...) : le navigateur peut les garder longtemps
+# si, et seulement si, ce paramètre est la version actuelle de la ressource.
+# Elles portent aussi le jeu de données (?d=...), qui prime sur le choix de session
+# (services/datasets.py) : une URL désigne toujours la même image.
+VERSIONED_MAX_AGE = 365 * 24 * 3600
+
+def _version(path: str) -> int:
+    # Version d'une image : son mtime
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+def _dataset_param() -> str:
+    return f"{DATASET_PARAM}={quote(current_dataset().name)}"
+
+def image_url(image_name: str) -> str:
+    """URL de l'image originale."""
+    path = os.path.join(images_dir(), image_name)
+    return f"{IMAGE_ROUTE}/{quote(image_name)}?{_dataset_param()}&v={_version(path)}"
+
+def preview_url(image_name: str, box, scale: int = 1) -> str:
+    """URL du dérivé de l'image adapté au canvas ``box``."""
+    path = os.path.join(images_dir(), image_name)
+    return f"{PREVIEW_ROUTE}/{box[0]}x{box[1]}/{scale}/{quote(image_name)}?{_dataset_param()}&v={_version(path)}"
+
+def _annotation_version(annotation: dict) -> str:
+    return annotation.get("last_updated", annotation["timestamp"])
+
+def render_url(annotation: dict, box, scale: int = 1) -> str:
+    """URL du rendu composite d'UNE annotation (change à chaque mise à jour de l'annotation)."""
+    version = _annotation_version(annotation)
+    return f"{RENDER_ROUTE}/{box[0]}x{box[1]}/{scale}/{annotation['id']}?{_dataset_param()}&v={quote(version)}"
+
+def _resolve_image(image_name: str) -> str:
+    path = safe_join(os.path.abspath(images_dir()), image_name)
+    if path is None or not path.lower().endswith(IMAGE_EXTENSIONS) or not os.path.isfile(path):
+        abort(404)
+    return path
+
+def _check_box(width: int, height: int, scale: int):
+    if scale not in PREVIEW_SCALES or (width, height) not in PREVIEW_BOXES:
+        abort(404)
+
+def _send(path: str, version):
+    """
+    Envoie un fichier avec ETag/Last-Modified, réponses 304 et requêtes Range (send_file conditionnel).
+    Le corps passe par wsgi.file_wrapper, donc sendfile() quand le serveur le propose.
+
+    Cache navigateur d'un an seulement si ``?v=`` est la version actuelle ``version`` ;
+    une URL périmée (ou sans version) reçoit le contenu actuel en no-cache.
+    """
+    max_age = VERSIONED_MAX_AGE if request.args.get("v") == str(version) else 0
+    return send_file(os.path.abspath(path), conditional=True, etag=True, max_age=max_age)
+
+def register_image_routes(server):
+    """Enregistre les routes d'images sur le serveur Flask de l'app Dash."""
+
+    @server.route(f"{IMAGE_ROUTE}/<path:image_name>")
+    def serve_image(image_name):
+        path = _resolve_image(image_name)
+        return _send(path, _version(path))
+
+    @server.route(f"{PREVIEW_ROUTE}/<int:width>x<int:height>/<int:scale>/<path:image_name>")
+    def serve_preview(width, height, scale, image_name):
+        _check_box(width, height, scale)
+        path = _resolve_image(image_name)
+        return _send(get_preview_path(path, (width, height), scale), _version(path))
+
+    @server.route(f"{RENDER_ROUTE}/<int:width>x<int:height>/<int:scale>/<int:annotation_id>")
+    def serve_render(width, height, scale, annotation_id):
+        _check_box(width, height, scale)
+        annotation = get_annotation_by_id(annotation_id)
+        if annotation is None:
+            abort(404)
+        image_path = _resolve_image(annotation["image"])
+        version = _annotation_version(annotation)
+        path = get_render_path(
+            image_path,
+            annotation["rectangles"],
+            get_annotator_color(annotation["annotator"]),
+            (width, height),
+            scale,
+            # Les ids ne sont uniques que dans un jeu de données
+            version=(current_dataset().name, annotation_id, version),
+        )
+        return _send(path, version)
@@ -0,0 +1,366 @@
+import os
+import re
+import torch
+import numpy as np
+import cv2
+from PIL import Image
+from huggingface_hub import hf_hub_download
+from ultralytics import YOLO
+import torchvision.transforms as T
+from torchvision.models.detection import fasterrcnn_resnet50_fpn
+from transformers import TrOCRProcessor, VisionEncoderDecoderModel, AutoFeatureExtractor, AutoModelForImageClassification
+from services.model_registry import ModelRegistry
+from services.inference_cache import get_cache
+from services.inference_backends import (
+    resolve_backend, optimize_car_model, optimize_brand_model, optimize_trocr_model
+)
+
+# Pile ML (torch, torchvision, transformers, ultralytics, cv2) : ce module n'est importé
+# qu'au premier usage par la page "Le Futur", jamais au démarrage de l'application.
+
+# --- Configuration ---
+# Moteur d'exécution : "torch" (défaut), "torch-int8", "onnx" ou "onnx-int8" (voir inference_backends)
+INFERENCE_BACKEND = resolve_backend(os.environ.get("TURVOI_INFERENCE_BACKEND", "torch"))
+# Les moteurs optimisés visent le CPU ; seul "torch" utilise le GPU s'il est présent
+device = torch.device("cuda" if torch.cuda.is_available() and INFERENCE_BACKEND == "torch" else "cpu")
+# Déchargement des modèles inutilisés depuis N secondes (0 : jamais)
+MODEL_IDLE_TTL = float(os.environ.get("TURVOI_MODEL_IDLE_TTL", "900"))
+
+COCO_CATEGORY_NAMES = ['__background__','person','bicycle','car','motorcycle','airplane',
+                       'bus','train','truck','boat']
+CAR_CLASS_IDS = {3}  # ID pour "car" dans COCO
+transform = T.Compose([T.ToTensor()])
+
+# --- Résolution d'entrée du détecteur ---
+# Même règle que le redimensionnement interne de torchvision (petit côté -> MIN_SIDE, grand
+# côté plafonné à MAX_SIDE), mais appliquée en PIL avant la conversion en tenseur : une
+# photo de 12 Mpx n'est jamais convertie en float pleine résolution.
+DETECTOR_MIN_SIDE = int(os.environ.get("TURVOI_DETECTOR_MIN_SIDE", "800"))
+DETECTOR_MAX_SIDE = int(os.environ.get("TURVOI_DETECTOR_MAX_SIDE", "1333"))
+# Letterbox (remplissage en bas/à droite) :
+#   "batch"  : chaque lot est complété à sa plus grande image ; le résultat d'une image dépend
+#              alors des autres images du lot, ce mode n'est donc jamais utilisé avec le cache
+#              de résultats (remplacé par "image") ;
+#   "image"  : chaque image est complétée à sa propre taille (arrondie au pas du FPN), les
+#              images de même taille sont traitées ensemble ;
+#   "square" : carré fixe MAX_SIDE x MAX_SIDE (formes constantes, utile pour ONNX).
+DETECTOR_LETTERBOX = os.environ.get("TURVOI_DETECTOR_LETTERBOX", "batch").lower()
+LETTERBOX_STRIDE = 32  # pas du FPN
+
+CAR_MODEL_ID = "fasterrcnn_resnet50_fpn"
+PLATE_MODEL_REPO, PLATE_MODEL_FILE = "MKgoud/License-Plate-Recognizer", "LP-detection.pt"
+TROCR_MODEL_ID = "microsoft/trocr-base-handwritten"
+BRAND_MODEL_ID = "abdusah/CarViT"
+# À incrémenter quand le post-traitement change : invalide le cache des résultats
+RESULTS_SCHEMA = 1
+
+def cache_config(stage, **params):
+    """Configuration d'une étape entrant dans la clé du cache de résultats."""
+    model_ids = {
+        "car": CAR_MODEL_ID,
+        "plate": f"{PLATE_MODEL_REPO}/{PLATE_MODEL_FILE}+{TROCR_MODEL_ID}",
+        "brand": BRAND_MODEL_ID,
+    }
+    if stage == "car":
+        params = dict(params, min_side=DETECTOR_MIN_SIDE, max_side=DETECTOR_MAX_SIDE,
+                      letterbox=cached_letterbox_mode())
+    extra = ",".join(f"{k}={v}" for k, v in sorted(params.items()))
+    return f"v{RESULTS_SCHEMA}|{INFERENCE_BACKEND}|{model_ids[stage]}|{extra}"
+
+def _image_side(processor, default):
+    """Côté des images attendu par un processor HF (int ou dict selon les versions)."""
+    size = getattr(processor, "size", None) or default
+    if isinstance(size, dict):
+        size = size.get("height") or size.get("shortest_edge") or default
+    return int(size)
+
+# --- Chargeurs des modèles (appelés au premier usage par le registre) ---
+def load_car_model():
+    """Faster R-CNN pour la détection de voitures."""
+    model_car = fasterrcnn_resnet50_fpn(pretrained=True).to(device)
+    model_car.eval()
+    # Les images arrivent déjà redimensionnées (letterbox_images) : pas de second resize interne
+    model_car.transform.resize = _keep_size
+    return optimize_car_model(model_car, INFERENCE_BACKEND, f"{CAR_MODEL_ID}+letterbox")
+
+def load_plate_model():
+    """YOLOv8 pour la détection de plaques."""
+    model_path_plate = hf_hub_download(repo_id=PLATE_MODEL_REPO, filename=PLATE_MODEL_FILE)
+    return YOLO(model_path_plate)
+
+def load_trocr_model():
+    """TrOCR pour la lecture de plaques : (processor, model)."""
+    processor_trocr = TrOCRProcessor.from_pretrained(TROCR_MODEL_ID)
+    trocr_model = VisionEncoderDecoderModel.from_pretrained(TROCR_MODEL_ID).to(device)
+    trocr_model.eval()
+    image_side = _image_side(processor_trocr.image_processor, 384)
+    return processor_trocr, optimize_trocr_model(trocr_model, INFERENCE_BACKEND, TROCR_MODEL_ID, image_side)
+
+def load_brand_model():
+    """Classification marque, modèle CarViT uniquement : (feature_extractor, model)."""
+    feature_extractor_brand = AutoFeatureExtractor.from_pretrained(BRAND_MODEL_ID)
+    model_brand = AutoModelForImageClassification.from_pretrained(BRAND_MODEL_ID).to(device)
+    model_brand.eval()
+    image_side = _image_side(feature_extractor_brand, 224)
+    return feature_extractor_brand, optimize_brand_model(model_brand, INFERENCE_BACKEND, BRAND_MODEL_ID, image_side)
+
+def create_registry():
+    """Registre des modèles du moteur courant (INFERENCE_BACKEND)."""
+    registry = ModelRegistry(idle_ttl=MODEL_IDLE_TTL or None)
+    registry.register("car", load_car_model)
+    registry.register("plate", load_plate_model)
+    registry.register("trocr", load_trocr_model)
+    registry.register("brand", load_brand_model)
+    return registry
+
+models = create_registry()
+
+# --- Regex multi‐pays pour plaques ---
+PLATE_REGEXES = {
+    "FR": r"[A-Z]{2}-\d{3}-[A-Z]{2}",
+    "DE": r"[A-Z]{1,3}-[A-Z]{1,2}\d{1,4}",
+    "US": r"[A-Z0-9]{1,7}"
+}
+
+def detect_country_from_text(text):
+    text = text.replace(" ", "").replace("-", "")
+    if len(text) == 7:
+        return "US"
+    elif len(text) == 6:
+        return "FR"
+    elif len(text) <= 8:
+        return "DE"
+    return "US"
+
+# --- Fonctions de détection et lecture ---
+def run_inference_cars(pil_images, score_threshold=0.5, cached=True):
+    """
+    Détection des voitures sur plusieurs images ; seules les images absentes du cache passent
+    au détecteur. ``cached=False`` pour les traitements de masse (pas de hachage ni d'éviction).
+    """
+    if not cached:
+        return _detect_cars(pil_images, score_threshold)
+    letterbox = cached_letterbox_mode()
+    return get_cache().cached_batch(
+        "car", cache_config("car", score_threshold=score_threshold), pil_images,
+        lambda imgs: _detect_cars(imgs, score_threshold, letterbox)
+    )
+
+def cached_letterbox_mode():
+    """Letterbox des détections mises en cache : résultat indépendant de la composition du lot."""
+    return "image" if DETECTOR_LETTERBOX == "batch" else DETECTOR_LETTERBOX
+
+def detector_scale(size):
+    """Facteur appliqué à une image de taille (largeur, hauteur) avant le détecteur."""
+    w, h = size
+    return min(DETECTOR_MIN_SIDE / min(w, h), DETECTOR_MAX_SIDE / max(w, h))
+
+def detector_size(size):
+    """Taille (largeur, hauteur) de l'image redimensionnée pour le détecteur."""
+    scale = detector_scale(size)
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+def _round_up(value, stride=LETTERBOX_STRIDE):
+    return -(-value // stride) * stride
+
+def letterbox_images(pil_images, mode=None):
+    """
+    Redimensionne chaque image selon la politique du détecteur puis la place en haut à
+    gauche d'un fond noir commun au lot. Retourne (tenseurs de même forme, facteurs).
+    ``mode`` : "batch" ou "square" (DETECTOR_LETTERBOX par défaut).
+    """
+    mode = mode or DETECTOR_LETTERBOX
+    resized, scales = [], []
+    for pil_image in pil_images:
+        w, h = pil_image.size
+        target = detector_size((w, h))
+        if target != (w, h):
+            # reducing_gap : réduction entière rapide avant le filtre pour les grandes photos
+            pil_image = pil_image.resize(target, Image.BILINEAR, reducing_gap=2.0)
+        # Facteurs exacts par axe (l'arrondi de la taille cible change légèrement le ratio)
+        scales.append((target[0] / w, target[1] / h))
+        resized.append(pil_image)
+    if mode == "square":
+        height = width = _round_up(DETECTOR_MAX_SIDE)
+    else:
+        height = _round_up(max(p.height for p in resized))
+        width = _round_up(max(p.width for p in resized))
+    batch = torch.zeros((len(resized), 3, height, width))
+    for i, pil_image in enumerate(resized):
+        tensor = transform(pil_image)
+        batch[i, :, :tensor.shape[1], :tensor.shape[2]] = tensor
+    return list(batch.to(device).unbind(0)), scales
+
+def _keep_size(image, target=None):
+    return image, target
+
+def _detect_cars(pil_images, score_threshold, letterbox=None):
+    """Détection des voitures sur plusieurs images en un seul appel au détecteur (par taille en mode "image")."""
+    if not pil_images:
+        return []
+    letterbox = letterbox or DETECTOR_LETTERBOX
+    if letterbox == "image":
+        # Lots de même fond : le remplissage de chaque image ne dépend que de sa propre taille
+        groups = {}
+        for i, pil_image in enumerate(pil_images):
+            w, h = detector_size(pil_image.size)
+            groups.setdefault((_round_up(w), _round_up(h)), []).append(i)
+        all_results = [None] * len(pil_images)
+        for indices in groups.values():
+            group = _detect_cars([pil_images[i] for i in indices], score_threshold, "batch")
+            for i, results in zip(indices, group):
+                all_results[i] = results
+        return all_results
+    model_car = models.get("car")
+    imgs, scales = letterbox_images(pil_images, letterbox)
+    with torch.no_grad():
+        all_preds = model_car(imgs)
+    all_results = []
+    for pil_image, (sx, sy), preds in zip(pil_images, scales, all_preds):
+        results = []
+        for box, label, score in zip(preds['boxes'].cpu(), preds['labels'].cpu(), preds['scores'].cpu()):
+            if score < score_threshold or int(label) not in CAR_CLASS_IDS:
+                continue
+            # Retour aux coordonnées de l'image originale (le letterbox ne décale pas l'origine)
+            x1, y1, x2, y2 = box.tolist()
+            box = [min(max(x1 / sx, 0.0), pil_image.width), min(max(y1 / sy, 0.0), pil_image.height),
+                   min(max(x2 / sx, 0.0), pil_image.width), min(max(y2 / sy, 0.0), pil_image.height)]
+            results.append({'box': box, 'label': COCO_CATEGORY_NAMES[int(label)], 'score': float(score)})
+        all_results.append(results)
+    return all_results
+
+def run_inference_car(pil_image, score_threshold=0.5):
+    return run_inference_cars([pil_image], score_threshold)[0]
+
+def deskew_plate(plate_pil):
+    plate_np = np.array(plate_pil.convert("L"))
+    coords = np.column_stack(np.where(plate_np > 0))
+    if coords.shape[0] == 0:
+        return plate_np
+    angle = cv2.minAreaRect(coords)[-1]
+    angle = -(90 + angle) if angle < -45 else -angle
+    (h, w) = plate_np.shape
+    center = (w // 2, h // 2)
+    M = cv2.getRotationMatrix2D(center, angle, 1.0)
+    return cv2.warpAffine(plate_np, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+
+def _validate_plate_text(raw_text):
+    plate_text = re.sub(r"[^A-Z0-9]", "", raw_text.upper())
+    country = detect_country_from_text(plate_text)
+    regex = PLATE_REGEXES.get(country, PLATE_REGEXES["US"])
+    return plate_text if re.match(regex, plate_text) else None
+
+def read_plates_trocr_batch(plate_pils):
+    """Lecture de plusieurs plaques en un seul appel à ``generate``."""
+    if not plate_pils:
+        return []
+    plate_pils = [p if p.mode == "RGB" else p.convert("RGB") for p in plate_pils]
+    processor_trocr, trocr_model = models.get("trocr")
+    pixel_values = processor_trocr(images=plate_pils, return_tensors="pt").pixel_values.to(device)
+    with torch.no_grad():
+        generated_ids = trocr_model.generate(pixel_values)
+    texts = processor_trocr.batch_decode(generated_ids, skip_special_tokens=True)
+    return [_validate_plate_text(t) for t in texts]
+
+def read_plate_trocr_adaptive(plate_pil):
+    return read_plates_trocr_batch([plate_pil])[0]
+
+def preprocess_plate(plate_crop):
+    """Niveaux de gris + CLAHE + seuillage d'Otsu avant OCR."""
+    gray = cv2.cvtColor(np.array(plate_crop), cv2.COLOR_RGB2GRAY)
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+    gray = clahe.apply(gray)
+    _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return Image.fromarray(thresh).convert("RGB")
+
+def detect_plates_yolo(car_pils):
+    """Plaques (boîte + texte) de plusieurs voitures, via le cache de résultats."""
+    return get_cache().cached_batch("plate", cache_config("plate"), car_pils, _detect_plates)
+
+def _detect_plates(car_pils):
+    """
+    Détection des plaques sur plusieurs voitures : un seul ``predict`` YOLO pour toutes
+    les voitures, puis une seule passe TrOCR pour toutes les plaques trouvées.
+    """
+    if not car_pils:
+        return []
+    model_plate = models.get("plate")
+    results = model_plate.predict(source=[np.array(c) for c in car_pils], verbose=False)
+    plate_infos = [None] * len(car_pils)
+    plate_images, owners = [], []
+    for i, (car_pil, res) in enumerate(zip(car_pils, results)):
+        if len(res.boxes) == 0:
+            continue
+        x1, y1, x2, y2 = map(int, res.boxes.xyxy[0].cpu().numpy())
+        plate_infos[i] = {'plate_box': [x1, y1, x2, y2], 'plate_text': None}
+        plate_images.append(preprocess_plate(car_pil.crop((x1, y1, x2, y2))))
+        owners.append(i)
+    for i, text in zip(owners, read_plates_trocr_batch(plate_images)):
+        plate_infos[i]['plate_text'] = text
+    return plate_infos
+
+def detect_plate_yolo(car_pil):
+    return detect_plates_yolo([car_pil])[0]
+
+def identify_car_brands(car_pils):
+    """Marques de plusieurs voitures, via le cache de résultats."""
+    return get_cache().cached_batch("brand", cache_config("brand"), car_pils, _classify_brands)
+
+def _classify_brands(car_pils):
+    """Classification de marque de plusieurs voitures en une seule passe CarViT."""
+    if not car_pils:
+        return []
+    car_pils = [c if c.mode == "RGB" else c.convert("RGB") for c in car_pils]
+    feature_extractor_brand, model_brand = models.get("brand")
+    inputs = feature_extractor_brand(images=car_pils, return_tensors="pt").to(device)
+    with torch.no_grad():
+        outputs = model_brand(**inputs)
+    probs = torch.nn.functional.softmax(outputs.logits, dim=-1).cpu()
+    confs, pred_ids = probs.max(dim=-1)
+    brand_infos = []
+    for conf, pred_id in zip(confs.tolist(), pred_ids.tolist()):
+        label = model_brand.config.id2label[pred_id]
+        brand = label.split()[0] if label else "Unknown"
+        brand_infos.append({"brand": brand, "confidence": conf, "source": "CarViT"})
+    return brand_infos
+
+def identify_car_brand(car_pil):
+    return identify_car_brands([car_pil])[0]
+
+def crop_detections(pil_image, detections):
+    """Découpe chaque voiture détectée (boîte bornée à l'image)."""
+    crops = []
+    for d in detections:
+        x1, y1, x2, y2 = map(int, d['box'])
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(pil_image.width, x2), min(pil_image.height, y2)
+        crops.append(pil_image.crop((x1, y1, x2, y2)))
+    return crops
+
+def analyze_cars(pil_image, detections):
+    """Plaques et marques de toutes les voitures détectées, traitées par lots."""
+    crops = crop_detections(pil_image, detections)
+    return detect_plates_yolo(crops), identify_car_brands(crops)
+
+def analyze_images(pil_images, score_threshold=0.6, multi_car=False):
+    """
+    Pipeline complet sur un lot d'images : détection en lot, puis plaques et marques
+    de toutes les voitures de toutes les images en lot.
+    Retourne pour chaque image {"detections", "plate_infos", "brand_infos", "image_size"}.
+    """
+    all_detections = run_inference_cars(pil_images, score_threshold)
+    crops, owners = [], []
+    for i, (pil_image, detections) in enumerate(zip(pil_images, all_detections)):
+        if detections and not multi_car:
+            detections = [max(detections, key=lambda d: d['score'])]
+            all_detections[i] = detections
+        crops.extend(crop_detections(pil_image, detections))
+        owners.extend([i] * len(detections))
+    plate_infos, brand_infos = detect_plates_yolo(crops), identify_car_brands(crops)
+
+    results = [{"detections": d, "plate_infos": [], "brand_infos": [], "image_size": list(p.size)}
+               for p, d in zip(pil_images, all_detections)]
+    for i, plate_info, brand_info in zip(owners, plate_infos, brand_infos):
+        results[i]["plate_infos"].append(plate_info)
+        results[i]["brand_infos"].append(brand_info)
+    return results
@@ -0,0 +1,174 @@
+import os
+import logging
+import hashlib
+from types import SimpleNamespace
+import numpy as np
+import torch
+
+# Moteurs d'exécution alternatifs pour le CPU, sélectionnés par TURVOI_INFERENCE_BACKEND :
+#   "torch"      : modèles PyTorch tels quels (défaut, seul moteur utilisant le GPU)
+#   "torch-int8" : quantification dynamique int8 des couches linéaires (PyTorch)
+#   "onnx"       : détecteur, CarViT et encodeur TrOCR exportés en ONNX (onnxruntime)
+#   "onnx-int8"  : idem, avec quantification dynamique int8 des graphes ONNX
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+ONNX_CACHE_DIR = os.environ.get("TURVOI_ONNX_DIR", os.path.join(".cache_models", "onnx"))
+# Threads onnxruntime par session (0 : choix automatique)
+ONNX_THREADS = int(os.environ.get("TURVOI_ONNX_THREADS", "0"))
+ONNX_OPSET = 17
+
+# Les replis de moteur sont des avertissements (visibles même sans configuration de logging)
+logger = logging.getLogger(__name__)
+
+def resolve_backend(name: str) -> str:
+    name = (name or "torch").lower()
+    if name not in BACKENDS:
+        logger.warning("Moteur d'inférence inconnu '%s', utilisation de 'torch'", name)
+        return "torch"
+    if name.startswith("onnx"):
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            logger.warning("Moteur '%s' demandé mais onnxruntime n'est pas installé : "
+                           "repli sur 'torch-int8' (pip install onnxruntime)", name)
+            return "torch-int8"
+    return name
+
+def is_int8(backend: str) -> bool:
+    return backend.endswith("-int8")
+
+def quantize_dynamic_int8(model):
+    """Quantification dynamique int8 des nn.Linear (poids int8, activations quantifiées à la volée)."""
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+# --- Export ONNX (une seule fois, réutilisé ensuite depuis ONNX_CACHE_DIR) ---
+def _onnx_path(name: str, model_id: str, int8: bool) -> str:
+    tag = hashlib.sha1(f"{model_id}|{torch.__version__}|{ONNX_OPSET}".encode()).hexdigest()[:10]
+    return os.path.join(ONNX_CACHE_DIR, f"{name}-{tag}{'-int8' if int8 else ''}.onnx")
+
+def export_onnx(module, example_args, name: str, model_id: str, input_names, output_names,
+                dynamic_axes, int8: bool = False) -> str:
+    """Exporte ``module`` en ONNX (et sa variante int8) si ce n'est pas déjà fait ; retourne le chemin."""
+    path = _onnx_path(name, model_id, False)
+    if not os.path.exists(path):
+        os.makedirs(ONNX_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with torch.no_grad():
+            torch.onnx.export(module, example_args, tmp_path, opset_version=ONNX_OPSET,
+                              input_names=input_names, output_names=output_names, dynamic_axes=dynamic_axes)
+        os.replace(tmp_path, path)
+        print(f"Modèle '{name}' exporté en ONNX : {path}")
+    if not int8:
+        return path
+
+    int8_path = _onnx_path(name, model_id, True)
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        tmp_path = f"{int8_path}.{os.getpid()}.tmp"
+        quantize_dynamic(path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, int8_path)
+        print(f"Modèle '{name}' quantifié en int8 : {int8_path}")
+    return int8_path
+
+def onnx_session(path: str):
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if ONNX_THREADS:
+        options.intra_op_num_threads = ONNX_THREADS
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+class _LogitsOnly(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model(pixel_values=pixel_values, return_dict=False)[0]
+
+class _EncoderOnly(torch.nn.Module):
+    def __init__(self, encoder):
+        super().__init__()
+        self.encoder = encoder
+
+    def forward(self, pixel_values):
+        return self.encoder(pixel_values=pixel_values, return_dict=False)[0]
+
+class OnnxCarDetector:
+    """Faster R-CNN exporté en ONNX ; même interface que le modèle torchvision (liste d'images)."""
+
+    def __init__(self, session):
+        self.session = session
+
+    def __call__(self, images):
+        outputs = []
+        for image in images:
+            boxes, labels, scores = self.session.run(None, {"image": image.cpu().numpy()})
+            outputs.append({"boxes": torch.from_numpy(boxes), "labels": torch.from_numpy(labels),
+                            "scores": torch.from_numpy(scores)})
+        return outputs
+
+class OnnxImageClassifier:
+    """Classifieur HF exporté en ONNX ; expose ``config`` et retourne un objet avec ``logits``."""
+
+    def __init__(self, session, config):
+        self.session = session
+        self.config = config
+
+    def __call__(self, pixel_values, **_):
+        (logits,) = self.session.run(None, {"pixel_values": pixel_values.cpu().numpy().astype(np.float32)})
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+class OnnxTrOCR:
+    """TrOCR : encodeur ViT en ONNX, décodeur autorégressif PyTorch."""
+
+    def __init__(self, session, model):
+        from transformers.modeling_outputs import BaseModelOutput
+        self._output_cls = BaseModelOutput
+        self.session = session
+        self.model = model
+
+    def eval(self):
+        return self
+
+    def generate(self, pixel_values, **kwargs):
+        (hidden,) = self.session.run(None, {"pixel_values": pixel_values.cpu().numpy().astype(np.float32)})
+        encoder_outputs = self._output_cls(last_hidden_state=torch.from_numpy(hidden))
+        return self.model.generate(encoder_outputs=encoder_outputs, **kwargs)
+
+# --- Application d'un moteur aux modèles chargés ---
+def optimize_car_model(model, backend: str, model_id: str):
+    if backend == "torch":
+        return model
+    if backend == "torch-int8":
+        # Seule la tête de boîtes (fc6/fc7) est linéaire ; le backbone convolutif reste en float
+        return quantize_dynamic_int8(model)
+    path = export_onnx(model, ([torch.rand(3, 800, 1088)],), "car", model_id,
+                       input_names=["image"], output_names=["boxes", "labels", "scores"],
+                       dynamic_axes={"image": {1: "height", 2: "width"}, "boxes": {0: "n"},
+                                     "labels": {0: "n"}, "scores": {0: "n"}},
+                       int8=is_int8(backend))
+    return OnnxCarDetector(onnx_session(path))
+
+def optimize_brand_model(model, backend: str, model_id: str, image_size: int = 224):
+    if backend == "torch":
+        return model
+    if backend == "torch-int8":
+        return quantize_dynamic_int8(model)
+    path = export_onnx(_LogitsOnly(model), (torch.rand(1, 3, image_size, image_size),), "brand", model_id,
+                       input_names=["pixel_values"], output_names=["logits"],
+                       dynamic_axes={"pixel_values": {0: "batch"}, "logits": {0: "batch"}},
+                       int8=is_int8(backend))
+    return OnnxImageClassifier(onnx_session(path), model.config)
+
+def optimize_trocr_model(model, backend: str, model_id: str, image_size: int = 384):
+    if backend == "torch":
+        return model
+    if backend == "torch-int8":
+        return quantize_dynamic_int8(model)
+    path = export_onnx(_EncoderOnly(model.encoder), (torch.rand(1, 3, image_size, image_size),), "trocr-encoder",
+                       model_id, input_names=["pixel_values"], output_names=["last_hidden_state"],
+                       dynamic_axes={"pixel_values": {0: "batch"}, "last_hidden_state": {0: "batch"}},
+                       int8=is_int8(backend))
+    # Le décodeur (génération pas à pas) reste en PyTorch, quantifié en int8 si demandé
+    decoder_model = quantize_dynamic_int8(model) if is_int8(backend) else model
+    return OnnxTrOCR(onnx_session(path), decoder_model)
@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional
+
+# Cache des résultats d'inférence, adressé par le contenu : une image déjà analysée
+# (même pixels, même modèle, même configuration) n'est pas recalculée.
+# Persisté dans SQLite pour survivre aux redémarrages et être partagé entre processus.
+INFERENCE_CACHE_PATH = os.environ.get("TURVOI_INFERENCE_CACHE", os.path.join(".cache_inference", "results.sqlite"))
+# Nombre maximal d'entrées (éviction LRU au-delà) ; 0 désactive le cache
+INFERENCE_CACHE_SIZE = int(os.environ.get("TURVOI_INFERENCE_CACHE_SIZE", "5000"))
+
+def image_digest(pil_image) -> str:
+    """
+    Empreinte des pixels décodés : la même image réencodée (JPEG/PNG, métadonnées
+    différentes) donne la même clé.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{pil_image.mode}|{pil_image.width}x{pil_image.height}|".encode())
+    h.update(pil_image.tobytes())
+    return h.hexdigest()
+
+class InferenceCache:
+    """Cache clé -> résultat JSON, borné en nombre d'entrées avec éviction LRU."""
+
+    def __init__(self, path: str = INFERENCE_CACHE_PATH, max_entries: int = INFERENCE_CACHE_SIZE):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Une connexion par thread et par processus (les workers d'inférence sont forkés/spawnés)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results(last_access)")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @staticmethod
+    def make_key(stage: str, config: str, digest: str) -> str:
+        return hashlib.sha1(f"{stage}|{config}|{digest}".encode()).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, object]:
+        """Résultats présents en cache ; leur date d'accès est rafraîchie (LRU)."""
+        if not self.enabled or not keys:
+            return {}
+        conn = self._connection()
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        for start in range(0, len(unique), 500):
+            chunk = unique[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for key, value in conn.execute(f"SELECT key, value FROM results WHERE key IN ({placeholders})", chunk):
+                found[key] = json.loads(value)
+        if found:
+            now = time.time()
+            conn.executemany("UPDATE results SET last_access = ? WHERE key = ?", [(now, k) for k in found])
+        self._hits += sum(1 for k in keys if k in found)
+        self._misses += sum(1 for k in keys if k not in found)
+        return found
+
+    def put_many(self, items: Dict[str, object]):
+        """Enregistre des résultats puis évince les entrées les moins récemment utilisées."""
+        if not self.enabled or not items:
+            return
+        conn = self._connection()
+        now = time.time()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT OR REPLACE INTO results (key, value, last_access) VALUES (?, ?, ?)",
+                [(k, json.dumps(v), now) for k, v in items.items()]
+            )
+            (count,) = conn.execute("SELECT COUNT(*) FROM results").fetchone()
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM results WHERE key IN "
+                    "(SELECT key FROM results ORDER BY last_access LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+
+    def clear(self):
+        if os.path.exists(self.path):
+            self._connection().execute("DELETE FROM results")
+
+    def stats(self) -> Dict[str, int]:
+        entries = 0
+        if self.enabled and os.path.exists(self.path):
+            (entries,) = self._connection().execute("SELECT COUNT(*) FROM results").fetchone()
+        return {"entries": entries, "max_entries": self.max_entries, "hits": self._hits, "misses": self._misses}
+
+    def cached_batch(self, stage: str, config: str, pil_images: List,
+                     compute: Callable[[List], List], digests: Optional[List[str]] = None) -> List:
+        """
+        Applique ``compute`` (fonction par lot) aux seules images absentes du cache ;
+        les images identiques d'un même lot ne sont calculées qu'une fois.
+        """
+        if not self.enabled or not pil_images:
+            return compute(pil_images)
+        digests = digests or [image_digest(p) for p in pil_images]
+        keys = [self.make_key(stage, config, d) for d in digests]
+        found = self.get_many(keys)
+
+        missing = {}
+        for key, pil_image in zip(keys, pil_images):
+            if key not in found and key not in missing:
+                missing[key] = pil_image
+        if missing:
+            computed = dict(zip(missing, compute(list(missing.values()))))
+            self.put_many(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> InferenceCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = InferenceCache()
+    return _cache
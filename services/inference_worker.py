@@ -0,0 +1,424 @@
+import io
+import os
+import json
+import time
+import uuid
+import queue
+import secrets
+import stat
+import threading
+import multiprocessing
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus, un pool par processus
+    fcntl = None
+
+# Processus d'inférence dédiés : les callbacks Dash déposent une requête dans une file
+# et récupèrent le résultat plus tard, sans bloquer un worker Flask pendant l'inférence.
+INFERENCE_WORKERS = int(os.environ.get("TURVOI_INFERENCE_WORKERS", "1"))
+# Taille maximale de la file : au-delà, les nouvelles requêtes sont refusées (back-pressure)
+INFERENCE_QUEUE_SIZE = int(os.environ.get("TURVOI_INFERENCE_QUEUE", "8"))
+# Fenêtre de regroupement : les requêtes arrivées dans cet intervalle sont traitées en lot
+INFERENCE_BATCH_WINDOW = float(os.environ.get("TURVOI_INFERENCE_BATCH_WINDOW", "0.05"))
+INFERENCE_MAX_BATCH = int(os.environ.get("TURVOI_INFERENCE_MAX_BATCH", "4"))
+# Délai au-delà duquel une requête est abandonnée (file d'attente + calcul)
+INFERENCE_TIMEOUT = float(os.environ.get("TURVOI_INFERENCE_TIMEOUT", "120"))
+# Résultats écrits sur disque : lisibles par n'importe quel worker gunicorn
+JOBS_DIR = os.environ.get("TURVOI_INFERENCE_JOBS_DIR", ".cache_jobs")
+JOBS_RETENTION = 3600
+# Les processus publient l'état de leurs modèles à cet intervalle (secondes)
+STATUS_INTERVAL = 5.0
+# Un seul pool par machine : verrou, socket et clé d'authentification de l'hôte du pool,
+# dans JOBS_DIR. Les requêtes sont désérialisées par pickle : socket et clé sont réservées
+# à l'utilisateur courant (0600), et toute connexion doit prouver qu'elle connaît la clé.
+POOL_LOCK_NAME = "_pool.lock"
+POOL_SOCKET_NAME = "_pool.sock"
+POOL_KEY_NAME = "_pool.key"
+# Intervalle du superviseur (redémarrage des processus morts, purge des jobs expirés)
+SUPERVISOR_INTERVAL = float(os.environ.get("TURVOI_INFERENCE_SUPERVISOR_INTERVAL", "5"))
+
+class InferenceBusyError(Exception):
+    """La file d'inférence est pleine ; le client doit réessayer plus tard."""
+
+def _job_path(job_id: str) -> str:
+    return os.path.join(JOBS_DIR, f"{job_id}.json")
+
+def _write_json(path: str, payload: Dict):
+    """Écriture atomique d'un fichier JSON."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, path)
+
+def _write_job(job_id: str, payload: Dict):
+    _write_json(_job_path(job_id), payload)
+
+def _socket_path() -> str:
+    return os.path.join(JOBS_DIR, POOL_SOCKET_NAME)
+
+def _key_path() -> str:
+    return os.path.join(JOBS_DIR, POOL_KEY_NAME)
+
+def _read_authkey() -> Optional[bytes]:
+    """Clé de la machine, ou None si elle est absente ou lisible par d'autres utilisateurs."""
+    try:
+        with open(_key_path(), "rb") as f:
+            if stat.S_IMODE(os.fstat(f.fileno()).st_mode) & 0o077:
+                return None
+            return f.read() or None
+    except FileNotFoundError:
+        return None
+
+def _ensure_authkey() -> bytes:
+    """Clé de la machine, créée (0600) par le premier hôte du pool."""
+    key = _read_authkey()
+    if key is None:
+        key = secrets.token_bytes(32)
+        tmp_path = f"{_key_path()}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(key)
+        os.replace(tmp_path, _key_path())
+    return key
+
+def _status_path(pid: int) -> str:
+    return os.path.join(JOBS_DIR, f"_models_{pid}.status")
+
+def _publish_status_loop(inference):
+    """Thread du processus fils : publie périodiquement l'état des modèles sur disque."""
+    while True:
+        try:
+            _write_json(_status_path(os.getpid()), inference.models.status())
+        except OSError:
+            pass
+        time.sleep(STATUS_INTERVAL)
+
+def _process_batch(inference, batch):
+    """Traite un lot de requêtes ; les paramètres identiques sont passés ensemble au pipeline."""
+    from PIL import Image, ImageOps
+
+    groups = {}
+    for request in batch:
+        key = (request["score_threshold"], request["multi_car"])
+        groups.setdefault(key, []).append(request)
+    for (score_threshold, multi_car), requests in groups.items():
+        valid, images = [], []
+        for request in requests:
+            if time.time() - request["submitted"] > INFERENCE_TIMEOUT:
+                _write_job(request["job_id"], {"status": "timeout"})
+                continue
+            try:
+                # Orientation EXIF appliquée, comme à l'affichage dans le navigateur
+                image = ImageOps.exif_transpose(Image.open(io.BytesIO(request["image_bytes"])))
+                images.append(image.convert("RGB"))
+                valid.append(request)
+            except Exception as e:
+                _write_job(request["job_id"], {"status": "error", "error": f"Image illisible: {e}"})
+        if not valid:
+            continue
+        try:
+            results = inference.analyze_images(images, score_threshold=score_threshold, multi_car=multi_car)
+        except Exception as e:
+            for request in valid:
+                _write_job(request["job_id"], {"status": "error", "error": str(e)})
+            continue
+        for request, result in zip(valid, results):
+            _write_job(request["job_id"], {"status": "done", "result": result})
+
+def _worker_main(request_queue, batch_window: float, max_batch: int):
+    """Boucle d'un processus d'inférence : regroupe les requêtes puis traite chaque lot."""
+    from services import inference  # pile ML importée dans le processus fils uniquement
+
+    threading.Thread(target=_publish_status_loop, args=(inference,), name="models-status", daemon=True).start()
+    while True:
+        request = request_queue.get()
+        if request is None:
+            return
+        if request.get("warmup"):
+            inference.models.warmup(background=False)
+            continue
+        batch = [request]
+        deadline = time.monotonic() + batch_window
+        while len(batch) < max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = request_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                _process_batch(inference, batch)
+                return
+            if request.get("warmup"):
+                inference.models.warmup(background=True)
+                continue
+            batch.append(request)
+        _process_batch(inference, batch)
+
+class InferenceService:
+    """Pool de processus d'inférence alimenté par une file multiprocessing bornée.
+
+    Un seul pool par machine : le processus (worker gunicorn) qui obtient le verrou
+    JOBS_DIR/_pool.lock héberge les processus d'inférence, la file, une socket Unix et un
+    thread superviseur. Les autres processus lui transmettent leurs requêtes par la socket ;
+    les résultats passent par JOBS_DIR dans tous les cas. Si l'hôte disparaît, le premier
+    processus qui ne peut plus le joindre reprend le verrou et le pool.
+    """
+
+    def __init__(self, num_workers: int = INFERENCE_WORKERS, max_queue: int = INFERENCE_QUEUE_SIZE,
+                 batch_window: float = INFERENCE_BATCH_WINDOW, max_batch: int = INFERENCE_MAX_BATCH):
+        self.num_workers = max(1, num_workers)
+        self.max_queue = max_queue
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._ctx = multiprocessing.get_context("spawn")
+        self._queue = None
+        self._processes = []
+        self._lock = threading.Lock()
+        self._owner = False
+        self._lock_file = None
+        self._listener = None
+        self._stopped = threading.Event()
+
+    # --- Hôte du pool ---
+    def _try_become_owner(self) -> bool:
+        """Prend le verrou de la machine et démarre le pool ; False si un autre processus l'a."""
+        with self._lock:
+            if self._owner:
+                return True
+            os.makedirs(JOBS_DIR, exist_ok=True)
+            if fcntl is not None:
+                lock_file = open(os.path.join(JOBS_DIR, POOL_LOCK_NAME), "a")
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    lock_file.close()
+                    return False
+                self._lock_file = lock_file
+            # Sans fcntl (Windows) : un pool par processus, sans socket
+            self._owner = True
+            self._stopped.clear()
+            self._queue = self._ctx.Queue(maxsize=self.max_queue)
+            self._respawn_workers()
+            if fcntl is not None:
+                self._start_listener()
+            threading.Thread(target=self._supervise, name="inference-supervisor", daemon=True).start()
+        print(f"Pool d'inférence démarré dans le processus {os.getpid()} ({self.num_workers} processus)")
+        return True
+
+    def _respawn_workers(self):
+        """(Re)démarre les processus absents ou morts (appelé sous self._lock)."""
+        alive = [p for p in self._processes if p.is_alive()]
+        if len(alive) < len(self._processes):
+            print(f"{len(self._processes) - len(alive)} processus d'inférence arrêtés, redémarrage")
+        self._processes = alive
+        while len(self._processes) < self.num_workers:
+            process = self._ctx.Process(
+                target=_worker_main,
+                args=(self._queue, self.batch_window, self.max_batch),
+                name="inference-worker",
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+
+    def _supervise(self):
+        """Thread de l'hôte : redémarre les processus morts et purge les jobs expirés."""
+        while not self._stopped.wait(SUPERVISOR_INTERVAL):
+            with self._lock:
+                if not self._owner:
+                    return
+                self._respawn_workers()
+            self._cleanup_old_jobs()
+
+    def _start_listener(self):
+        address = _socket_path()
+        if os.path.exists(address):
+            # Socket d'un hôte précédent (le verrou est libre, il n'existe plus)
+            os.remove(address)
+        authkey = _ensure_authkey()
+        # Socket créée directement en 0600 : pas de fenêtre avant un chmod
+        previous_umask = os.umask(0o077)
+        try:
+            self._listener = Listener(address, family="AF_UNIX", authkey=authkey)
+        finally:
+            os.umask(previous_umask)
+        threading.Thread(target=self._accept_loop, args=(self._listener,),
+                         name="inference-listener", daemon=True).start()
+
+    def _accept_loop(self, listener):
+        while not self._stopped.is_set():
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, EOFError):
+                continue  # client sans la clé, ou déconnecté pendant l'authentification
+            except OSError:
+                return
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def _serve_connection(self, conn):
+        with conn:
+            try:
+                message = conn.recv()
+                if message.get("warmup"):
+                    self._enqueue_warmup()
+                    conn.send("ok")
+                else:
+                    conn.send("ok" if self._enqueue(message) else "busy")
+            except (EOFError, OSError):
+                pass
+
+    def _enqueue(self, request: Dict) -> bool:
+        try:
+            self._queue.put_nowait(request)
+            return True
+        except queue.Full:
+            return False
+
+    def _enqueue_warmup(self):
+        for _ in self._processes:
+            if not self._enqueue({"warmup": True}):
+                break
+
+    # --- Clients ---
+    def _send_to_owner(self, message: Dict) -> Optional[str]:
+        """Transmet un message à l'hôte du pool ; None s'il est injoignable."""
+        authkey = _read_authkey()
+        if authkey is None:
+            return None
+        try:
+            with Client(_socket_path(), family="AF_UNIX", authkey=authkey) as conn:
+                conn.send(message)
+                return conn.recv()
+        except (OSError, EOFError, AuthenticationError):
+            return None
+
+    def _dispatch(self, message: Dict) -> bool:
+        """Dépose un message dans le pool de la machine ; False si la file est pleine."""
+        if not self._owner and fcntl is not None:
+            reply = self._send_to_owner(message)
+            if reply is not None:
+                return reply == "ok"
+        # Pas d'hôte joignable : reprise du pool (refusée si l'hôte démarre à peine)
+        if not self._try_become_owner():
+            raise InferenceBusyError("Pool d'inférence injoignable")
+        if message.get("warmup"):
+            self._enqueue_warmup()
+            return True
+        return self._enqueue(message)
+
+    def submit(self, image_bytes: bytes, score_threshold: float = 0.6, multi_car: bool = False) -> str:
+        """Dépose une requête ; lève InferenceBusyError si la file est pleine."""
+        job_id = uuid.uuid4().hex
+        request = {
+            "job_id": job_id,
+            "image_bytes": image_bytes,
+            "score_threshold": score_threshold,
+            "multi_car": multi_car,
+            "submitted": time.time(),
+        }
+        if not self._dispatch(request):
+            raise InferenceBusyError("File d'inférence pleine")
+        return job_id
+
+    def warmup(self):
+        """Demande aux processus de charger leurs modèles (ignoré si la file est pleine)."""
+        try:
+            self._dispatch({"warmup": True})
+        except InferenceBusyError:
+            pass
+
+    def shutdown(self):
+        self._stopped.set()
+        with self._lock:
+            if self._listener is not None:
+                self._listener.close()
+                self._listener = None
+            for _ in self._processes:
+                try:
+                    self._queue.put_nowait(None)
+                except queue.Full:
+                    pass
+            for process in self._processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+            self._processes = []
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+            self._owner = False
+
+    def _cleanup_old_jobs(self):
+        now = time.time()
+        try:
+            for name in os.listdir(JOBS_DIR):
+                if name in (POOL_LOCK_NAME, POOL_SOCKET_NAME, POOL_KEY_NAME):
+                    continue
+                path = os.path.join(JOBS_DIR, name)
+                retention = STATUS_INTERVAL * 3 if name.endswith(".status") else JOBS_RETENTION
+                if now - os.path.getmtime(path) > retention:
+                    os.remove(path)
+        except OSError:
+            pass
+
+def get_job_result(job_id: str, submitted: float = None) -> Optional[Dict]:
+    """
+    Résultat d'un job : {"status": "done", "result": ...}, {"status": "error", ...},
+    {"status": "timeout"} ou None s'il est encore en cours.
+    """
+    try:
+        with open(_job_path(job_id), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        if submitted is not None and time.time() - submitted > INFERENCE_TIMEOUT:
+            return {"status": "timeout"}
+        return None
+
+def get_models_status() -> Optional[Dict]:
+    """
+    État des modèles publié par les processus d'inférence (le plus récent),
+    ou None si aucun processus n'a publié récemment.
+    """
+    latest, latest_mtime = None, 0.0
+    try:
+        names = os.listdir(JOBS_DIR)
+    except FileNotFoundError:
+        return None
+    for name in names:
+        if not name.endswith(".status"):
+            continue
+        path = os.path.join(JOBS_DIR, name)
+        try:
+            mtime = os.path.getmtime(path)
+            if time.time() - mtime > STATUS_INTERVAL * 3 or mtime < latest_mtime:
+                continue
+            with open(path, encoding="utf-8") as f:
+                latest, latest_mtime = json.load(f), mtime
+        except (OSError, ValueError):
+            continue
+    return latest
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_service() -> InferenceService:
+    """Service d'inférence du processus courant (créé au premier usage) : hôte du pool ou client."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = InferenceService()
+    return _service
+
+def _forget_service():
+    # Un processus forké (gunicorn --preload) n'hérite pas du rôle d'hôte du parent
+    global _service, _service_lock
+    _service, _service_lock = None, threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_service)
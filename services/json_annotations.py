@@ -1,12 +1,43 @@
 import os
 import json
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+from services.image_catalog import get_image_catalog
+from services.datasets import DEFAULT, current_dataset
 
-# Configuration
-DATA_DIR = "data"
-IMAGES_DIR = os.path.join(DATA_DIR, "cars_detection")
-ANNOTATIONS_JSON = os.path.join(DATA_DIR, "annotations.json")
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus
+    fcntl = None
+
+# Configuration : chemins du jeu de données "default". Les fonctions du module travaillent
+# sur le jeu actif (services/datasets.py) : utiliser images_dir() / annotations_path().
+DATA_DIR = DEFAULT.data_dir
+IMAGES_DIR = DEFAULT.images_dir
+ANNOTATIONS_JSON = DEFAULT.annotations_json
+# Jeton de version partagé entre processus : compteur incrémenté à chaque écriture du store
+DATA_VERSION_NAME = "annotations.version"
+# Espace des coordonnées des rectangles : pixels de l'image originale. Les annotations
+# antérieures (sans "coord_space") étaient dans l'espace des canvas : 800 px de large pour
+# Annotate, 500 px pour les ajouts de Review. Conversion unique, à lancer une fois après
+# la mise à jour : python -m services.json_annotations [--dataset NOM]
+COORD_SPACE = "original"
+LEGACY_CANVAS_WIDTH = 800
+LEGACY_REVIEW_CANVAS_WIDTH = 500
+
+def images_dir() -> str:
+    """Dossier d'images du jeu de données actif."""
+    return current_dataset().images_dir
+
+def annotations_path() -> str:
+    """Fichier d'annotations du jeu de données actif."""
+    return current_dataset().annotations_json
+
+def _version_path() -> str:
+    return os.path.join(current_dataset().data_dir, DATA_VERSION_NAME)
 
 # Couleurs par annotateur (système de couleurs fixes)
 ANNOTATOR_COLORS = {
@@ -20,71 +51,292 @@ ANNOTATOR_COLORS = {
     "user2": "#FFFF00",    # Jaune
     "user3": "#FF00FF",    # Magenta
     "admin": "#000000",    # Noir
+    "model": "#808080",    # Gris (pré-annotations automatiques)
 }
 
+# Annotateur réservé aux propositions du détecteur (services/preannotate.py)
+MODEL_ANNOTATOR = "model"
+
+class VersionConflictError(Exception):
+    """L'annotation a été modifiée par quelqu'un d'autre depuis sa lecture."""
+
+    def __init__(self, annotation_id, expected_version: int, current_version: int):
+        self.annotation_id = annotation_id
+        self.expected_version = expected_version
+        self.current_version = current_version
+        super().__init__(
+            f"Annotation {annotation_id} : version attendue {expected_version}, "
+            f"version actuelle {current_version}"
+        )
+
+def get_version(annotation: Dict) -> int:
+    """Version d'une annotation (1 pour les annotations créées avant le versionnage)."""
+    return annotation.get("version", 1)
+
+def _check_version(annotation: Dict, expected_version: Optional[int]):
+    """Écriture conditionnelle : lève VersionConflictError si la version a changé."""
+    if expected_version is not None and get_version(annotation) != expected_version:
+        raise VersionConflictError(annotation["id"], expected_version, get_version(annotation))
+
+# Un verrou par jeu de données : les écritures de projets différents ne s'attendent pas
+_write_locks: Dict[str, threading.Lock] = {}
+
+@contextmanager
+def _store_transaction():
+    """
+    Section critique lecture-vérification-écriture du fichier d'annotations.
+    Le verrou n'est tenu que le temps de l'écriture (quelques ms), jamais pendant
+    l'édition : les conflits entre relecteurs sont détectés par les versions.
+    """
+    ensure_dirs()
+    write_lock = _write_locks.setdefault(current_dataset().name, threading.Lock())
+    with write_lock, open(annotations_path() + ".lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
 def ensure_dirs():
     """Crée les répertoires nécessaires."""
-    os.makedirs(IMAGES_DIR, exist_ok=True)
-    os.makedirs(DATA_DIR, exist_ok=True)
+    dataset = current_dataset()
+    os.makedirs(dataset.images_dir, exist_ok=True)
+    os.makedirs(dataset.data_dir, exist_ok=True)
 
 def get_annotator_color(annotator: str) -> str:
     """Retourne la couleur associée à un annotateur."""
     return ANNOTATOR_COLORS.get(annotator.lower(), ANNOTATOR_COLORS["default"])
 
 def list_images():
-    """Liste triée des fichiers image dans data/cars_detection/."""
+    """Liste triée des images du jeu actif (sous-dossiers compris), via le catalogue."""
+    return list(get_catalog().names())
+
+def get_catalog():
+    """Catalogue des images : position <-> nom en O(1), sans relister le dossier à chaque appel."""
     ensure_dirs()
-    imgs = [f for f in os.listdir(IMAGES_DIR) if f.lower().endswith((".jpg", ".jpeg", ".png"))]
-    imgs.sort()
-    return imgs
+    return get_image_catalog(images_dir())
+
+# --- Index en mémoire (lecture seule, reconstruit quand le fichier change) ---
+# Colonnes triables et leur clé de tri
+SORT_KEYS = {
+    "id": lambda ann: ann["id"],
+    "image": lambda ann: ann["image"],
+    "annotator": lambda ann: ann["annotator"],
+    "rect_count": lambda ann: len(ann["rectangles"]),
+    "timestamp": lambda ann: ann["timestamp"],
+}
+
+class AnnotationIndex:
+    """Index des annotations par id, image et annotateur.
+
+    Les dictionnaires retournés sont partagés entre les appels : ne pas les modifier.
+    """
+
+    def __init__(self, annotations: List[Dict]):
+        self.annotations = annotations
+        self.by_id = {}
+        self.by_image = {}
+        self.by_annotator = {}
+        for pos, ann in enumerate(annotations):
+            self.by_id[ann["id"]] = pos
+            self.by_image.setdefault(ann["image"], []).append(pos)
+            self.by_annotator.setdefault(ann["annotator"], []).append(pos)
+        # Valeurs distinctes triées (insensible à la casse) pour la recherche par préfixe
+        self._distinct = {}
+        for field, values in (("image", self.by_image), ("annotator", self.by_annotator)):
+            ordered = sorted(values, key=str.lower)
+            self._distinct[field] = ([v.lower() for v in ordered], ordered)
+        # Résultats de requêtes (filtres + tri) calculés à la demande
+        self._queries = {}
+        self._lock = threading.Lock()
+
+    def get(self, annotation_id) -> Optional[Dict]:
+        pos = self.by_id.get(annotation_id)
+        return self.annotations[pos] if pos is not None else None
+
+    def search_distinct(self, field: str, prefix: str = "", limit: int = 50) -> List[str]:
+        """Valeurs distinctes de ``field`` ("image" ou "annotator") commençant par ``prefix``."""
+        keys, values = self._distinct[field]
+        prefix = (prefix or "").lower()
+        result = []
+        for i in range(bisect_left(keys, prefix), len(keys)):
+            if len(result) >= limit or not keys[i].startswith(prefix):
+                break
+            result.append(values[i])
+        return result
+
+    def positions(self, annotator: str = None, image: str = None,
+                  sort_column: str = None, descending: bool = False) -> List[int]:
+        """Positions des annotations filtrées puis triées (résultat mis en cache)."""
+        key = (annotator, image, sort_column, descending)
+        with self._lock:
+            cached = self._queries.get(key)
+        if cached is not None:
+            return cached
+
+        if annotator and image:
+            by_annotator = self.by_annotator.get(annotator, [])
+            by_image = self.by_image.get(image, [])
+            # On parcourt la plus petite liste et on vérifie l'autre critère
+            if len(by_annotator) <= len(by_image):
+                result = [p for p in by_annotator if self.annotations[p]["image"] == image]
+            else:
+                result = [p for p in by_image if self.annotations[p]["annotator"] == annotator]
+        elif annotator:
+            result = self.by_annotator.get(annotator, [])
+        elif image:
+            result = self.by_image.get(image, [])
+        else:
+            result = range(len(self.annotations))
+
+        if sort_column in SORT_KEYS:
+            sort_key = SORT_KEYS[sort_column]
+            result = sorted(result, key=lambda p: sort_key(self.annotations[p]), reverse=descending)
+        elif not isinstance(result, list):
+            result = list(result)
+
+        with self._lock:
+            self._queries[key] = result
+        return result
+
+_index_lock = threading.Lock()
+# Jeu de données -> {"signature", "index"}
+_index_cache: Dict[str, Dict] = {}
+
+def _store_signature():
+    """Signature (mtime, taille) du fichier d'annotations."""
+    try:
+        st = os.stat(annotations_path())
+        return (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        return None
+
+def data_version() -> Optional[int]:
+    """Valeur courante du jeton de version (None si aucune écriture ne l'a encore créé)."""
+    try:
+        with open(_version_path(), "r", encoding="utf-8") as f:
+            return int(f.read())
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _bump_data_version() -> int:
+    """
+    Incrémente le jeton de version. Appelé sous _store_transaction, APRÈS le remplacement
+    du fichier d'annotations : un lecteur qui voit le nouveau jeton lit forcément les
+    nouvelles données (l'inverse, anciennes clé et données récentes, est sans danger).
+    """
+    version = (data_version() or 0) + 1
+    path = _version_path()
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(str(version))
+    os.replace(tmp_path, path)
+    return version
+
+def data_signature():
+    """
+    Jeton courant des données, à inclure dans la clé de tous les caches dérivés (index,
+    stats, exports, canvas). Partagé par les workers : une écriture dans un processus
+    invalide les caches de tous les autres. Avant la première écriture par l'application
+    (fichier produit à la main), retombe sur la signature (mtime, taille) du fichier ;
+    après une modification manuelle du JSON, supprimer annotations.version.
+    Le nom du jeu de données actif en fait partie : les caches sont séparés par projet.
+    """
+    version = data_version()
+    return (current_dataset().name, version if version is not None else _store_signature())
+
+def get_index() -> AnnotationIndex:
+    """Retourne l'index des annotations, reconstruit seulement si le jeton de version a changé."""
+    signature = data_signature()
+    dataset, version = signature
+    with _index_lock:
+        cached = _index_cache.get(dataset)
+        if version is not None and cached is not None and cached["signature"] == signature:
+            return cached["index"]
+    index = AnnotationIndex(load_annotations()["annotations"])
+    with _index_lock:
+        _index_cache[dataset] = {"signature": signature, "index": index}
+    return index
+
+def query_annotations(annotator: str = None, image: str = None, sort_column: str = None,
+                      descending: bool = False, offset: int = 0,
+                      limit: Optional[int] = None) -> Tuple[List[Dict], int]:
+    """
+    Requête paginée sur l'index des annotations.
+
+    Returns:
+        (annotations de la page demandée, nombre total d'annotations correspondant aux filtres)
+    """
+    index = get_index()
+    positions = index.positions(annotator, image, sort_column, descending)
+    offset = max(0, offset)
+    end = len(positions) if limit is None else offset + limit
+    return [index.annotations[p] for p in positions[offset:end]], len(positions)
+
+def search_distinct_values(field: str, prefix: str = "", limit: int = 50) -> List[str]:
+    """Recherche par préfixe parmi les images ou annotateurs présents dans les annotations."""
+    return get_index().search_distinct(field, prefix, limit)
 
 def get_annotations_for_image(image_name: str) -> List[Dict]:
     """Récupère toutes les annotations pour une image donnée."""
     annotations = get_all_annotations()
     return [ann for ann in annotations if ann["image"] == image_name]
 
-def update_annotation(annotation_id: str, new_rectangles: List[Dict], modifier_name: str = None, added_count: int = 0) -> bool:
-    """Met à jour une annotation existante en remplaçant ses rectangles et enregistre l'historique."""
+def update_annotation(annotation_id: str, new_rectangles: List[Dict], modifier_name: str = None, added_count: int = 0,
+                      expected_version: Optional[int] = None) -> bool:
+    """
+    Met à jour une annotation existante en remplaçant ses rectangles et enregistre l'historique.
+    
+    Si ``expected_version`` est fourni, l'écriture n'a lieu que si l'annotation est
+    toujours à cette version ; sinon VersionConflictError est levée.
+    """
     try:
-        data = load_annotations()
-        
-        # Trouver l'annotation à mettre à jour
-        annotation_found = False
-        for annotation in data.get("annotations", []):
-            if annotation["id"] == annotation_id:
-                old_count = len(annotation["rectangles"])
-                
-                # Remplacer les rectangles par les nouveaux (anciens + nouveaux)
-                annotation["rectangles"] = new_rectangles
-                annotation["last_updated"] = datetime.now().isoformat()
-                
-                # Ajouter l'entrée à l'historique si un modificateur est fourni
-                if modifier_name and added_count > 0:
-                    if "modification_history" not in annotation:
-                        annotation["modification_history"] = []
+        with _store_transaction():
+            data = load_annotations()
+            
+            # Trouver l'annotation à mettre à jour
+            annotation_found = False
+            for annotation in data.get("annotations", []):
+                if annotation["id"] == annotation_id:
+                    _check_version(annotation, expected_version)
+                    old_count = len(annotation["rectangles"])
                     
-                    history_entry = {
-                        "modifier_name": modifier_name,
-                        "timestamp": datetime.now().isoformat(),
-                        "rectangles_added": added_count,
-                        "total_rectangles_after": len(new_rectangles),
-                        "action": "ajout"
-                    }
-                    annotation["modification_history"].append(history_entry)
-                
-                annotation_found = True
-                break
-        
-        if not annotation_found:
-            print(f"Annotation avec ID {annotation_id} non trouvée")
-            return False
-        
-        # Sauvegarder les modifications
-        data["metadata"]["last_updated"] = datetime.now().isoformat()
-        save_annotations(data)
+                    # Remplacer les rectangles par les nouveaux (anciens + nouveaux)
+                    annotation["rectangles"] = new_rectangles
+                    annotation["last_updated"] = datetime.now().isoformat()
+                    annotation["version"] = get_version(annotation) + 1
+                    
+                    # Ajouter l'entrée à l'historique si un modificateur est fourni
+                    if modifier_name and added_count > 0:
+                        if "modification_history" not in annotation:
+                            annotation["modification_history"] = []
+                        
+                        history_entry = {
+                            "modifier_name": modifier_name,
+                            "timestamp": datetime.now().isoformat(),
+                            "rectangles_added": added_count,
+                            "total_rectangles_after": len(new_rectangles),
+                            "action": "ajout"
+                        }
+                        annotation["modification_history"].append(history_entry)
+                    
+                    annotation_found = True
+                    break
+            
+            if not annotation_found:
+                print(f"Annotation avec ID {annotation_id} non trouvée")
+                return False
+            
+            # Sauvegarder les modifications
+            data["metadata"]["last_updated"] = datetime.now().isoformat()
+            save_annotations(data)
         print(f"Annotation {annotation_id} mise à jour avec {len(new_rectangles)} rectangles")
         return True
         
+    except VersionConflictError:
+        raise
     except Exception as e:
         print(f"Erreur lors de la mise à jour de l'annotation: {e}")
         return False
@@ -92,7 +344,8 @@ def update_annotation(annotation_id: str, new_rectangles: List[Dict], modifier_n
 def load_annotations() -> Dict:
     """Charge le fichier d'annotations JSON."""
     ensure_dirs()
-    if not os.path.exists(ANNOTATIONS_JSON):
+    path = annotations_path()
+    if not os.path.exists(path):
         # Créer un fichier vide avec la structure initiale
         initial_data = {
             "metadata": {
@@ -103,25 +356,30 @@ def load_annotations() -> Dict:
             },
             "annotations": []
         }
-        with open(ANNOTATIONS_JSON, 'w', encoding='utf-8') as f:
+        with open(path, 'w', encoding='utf-8') as f:
             json.dump(initial_data, f, indent=2, ensure_ascii=False)
         return initial_data
     
-    with open(ANNOTATIONS_JSON, 'r', encoding='utf-8') as f:
+    with open(path, 'r', encoding='utf-8') as f:
         return json.load(f)
 
 def save_annotations(data: Dict):
-    """Sauvegarde le fichier d'annotations JSON."""
+    """Sauvegarde le fichier d'annotations JSON (écriture atomique via fichier temporaire)."""
     data["metadata"]["last_updated"] = datetime.now().isoformat()
-    with open(ANNOTATIONS_JSON, 'w', encoding='utf-8') as f:
+    path = annotations_path()
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
         json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    _bump_data_version()
 
 def get_next_id() -> int:
     """Obtient le prochain ID disponible."""
-    data = load_annotations()
-    current_id = data["metadata"]["next_id"]
-    data["metadata"]["next_id"] = current_id + 1
-    save_annotations(data)
+    with _store_transaction():
+        data = load_annotations()
+        current_id = data["metadata"]["next_id"]
+        data["metadata"]["next_id"] = current_id + 1
+        save_annotations(data)
     return current_id
 
 def add_annotation(image: str, annotator: str, rectangles: List[Dict]) -> int:
@@ -136,10 +394,6 @@ def add_annotation(image: str, annotator: str, rectangles: List[Dict]) -> int:
     Returns:
         int: ID de l'annotation créée
     """
-    data = load_annotations()
-    annotation_id = data["metadata"]["next_id"]
-    data["metadata"]["next_id"] = annotation_id + 1
-    
     # Ajouter la couleur de l'annotateur à chaque rectangle
     rectangles_with_color = []
     annotator_color = get_annotator_color(annotator)
@@ -149,28 +403,70 @@ def add_annotation(image: str, annotator: str, rectangles: List[Dict]) -> int:
         rect_with_color["color"] = annotator_color
         rectangles_with_color.append(rect_with_color)
     
-    new_annotation = {
-        "id": annotation_id,
-        "image": image,
-        "annotator": annotator,
-        "timestamp": datetime.now().isoformat(),
-        "rectangles": rectangles_with_color
-    }
-    
-    data["annotations"].append(new_annotation)
-    save_annotations(data)
+    with _store_transaction():
+        data = load_annotations()
+        annotation_id = data["metadata"]["next_id"]
+        data["metadata"]["next_id"] = annotation_id + 1
+        
+        new_annotation = {
+            "id": annotation_id,
+            "image": image,
+            "annotator": annotator,
+            "timestamp": datetime.now().isoformat(),
+            "version": 1,
+            "coord_space": COORD_SPACE,
+            "rectangles": rectangles_with_color
+        }
+        
+        data["annotations"].append(new_annotation)
+        save_annotations(data)
     return annotation_id
 
+def add_annotations_bulk(entries: List[Dict]) -> List[int]:
+    """
+    Ajoute plusieurs annotations en une seule transaction (une seule réécriture du fichier).
+
+    Args:
+        entries: [{"image": ..., "annotator": ..., "rectangles": [...]}, ...] ; les autres
+                 clés d'une entrée sont copiées telles quelles dans l'annotation.
+
+    Returns:
+        List[int]: IDs des annotations créées, dans l'ordre des entrées
+    """
+    if not entries:
+        return []
+    with _store_transaction():
+        data = load_annotations()
+        next_id = data["metadata"]["next_id"]
+        timestamp = datetime.now().isoformat()
+        ids = []
+        for entry in entries:
+            color = get_annotator_color(entry["annotator"])
+            annotation = {k: v for k, v in entry.items() if k not in ("image", "annotator", "rectangles")}
+            annotation.update({
+                "id": next_id,
+                "image": entry["image"],
+                "annotator": entry["annotator"],
+                "timestamp": timestamp,
+                "version": 1,
+                "coord_space": COORD_SPACE,
+                "rectangles": [dict(rect, color=color) for rect in entry["rectangles"]],
+            })
+            data["annotations"].append(annotation)
+            ids.append(next_id)
+            next_id += 1
+        data["metadata"]["next_id"] = next_id
+        save_annotations(data)
+    return ids
+
 def get_annotations_for_image(image: str) -> List[Dict]:
     """Récupère toutes les annotations pour une image donnée, incluant les modifications."""
-    data = load_annotations()
-    return [ann for ann in data["annotations"] if ann["image"] == image]
+    annotations, _ = query_annotations(image=image)
+    return annotations
 
 def get_original_annotations_for_image(image: str) -> List[Dict]:
     """Récupère seulement les annotations originales (non modifications) pour une image."""
-    data = load_annotations()
-    return [ann for ann in data["annotations"] 
-            if ann["image"] == image and not ann.get("is_modification", False)]
+    return [ann for ann in get_annotations_for_image(image) if not ann.get("is_modification", False)]
 
 def get_final_annotations_for_image(image: str) -> List[Dict]:
     """
@@ -201,38 +497,33 @@ def get_final_annotations_for_image(image: str) -> List[Dict]:
 
 def get_annotations_by_annotator(annotator: str) -> List[Dict]:
     """Récupère toutes les annotations d'un annotateur donné."""
-    data = load_annotations()
-    return [ann for ann in data["annotations"] if ann["annotator"] == annotator]
+    annotations, _ = query_annotations(annotator=annotator)
+    return annotations
 
 def get_all_annotations() -> List[Dict]:
-    """Récupère toutes les annotations."""
-    data = load_annotations()
-    return data["annotations"]
+    """Récupère toutes les annotations (index partagé : ne pas modifier les dictionnaires)."""
+    return list(get_index().annotations)
 
 def get_annotation_by_id(annotation_id: int) -> Optional[Dict]:
     """Récupère une annotation par son ID."""
-    data = load_annotations()
-    for ann in data["annotations"]:
-        if ann["id"] == annotation_id:
-            return ann
-    return None
+    return get_index().get(annotation_id)
 
 def delete_annotation(annotation_id: int) -> bool:
     """Supprime une annotation par son ID."""
-    data = load_annotations()
-    for i, ann in enumerate(data["annotations"]):
-        if ann["id"] == annotation_id:
-            del data["annotations"][i]
-            save_annotations(data)
-            return True
+    with _store_transaction():
+        data = load_annotations()
+        for i, ann in enumerate(data["annotations"]):
+            if ann["id"] == annotation_id:
+                del data["annotations"][i]
+                save_annotations(data)
+                return True
     return False
 
 def get_annotator_stats() -> Dict[str, Dict]:
     """Statistiques par annotateur."""
-    data = load_annotations()
     stats = {}
     
-    for ann in data["annotations"]:
+    for ann in get_index().annotations:
         annotator = ann["annotator"]
         if annotator not in stats:
             stats[annotator] = {
@@ -297,7 +588,8 @@ def create_sample_annotations():
     
     return created_count
 
-def modify_annotation(original_annotation_id: int, modifier_name: str, new_rectangles: List[Dict]) -> int:
+def modify_annotation(original_annotation_id: int, modifier_name: str, new_rectangles: List[Dict],
+                      expected_version: Optional[int] = None) -> int:
     """
     Modifie une annotation existante en créant une entrée de modification.
     
@@ -305,22 +597,11 @@ def modify_annotation(original_annotation_id: int, modifier_name: str, new_recta
         original_annotation_id: ID de l'annotation originale à modifier
         modifier_name: Nom de la personne qui fait la modification
         new_rectangles: Nouveaux rectangles (remplacent complètement les anciens)
+        expected_version: version lue par le modificateur ; VersionConflictError si elle a changé
     
     Returns:
         ID de la nouvelle entrée de modification
     """
-    data = load_annotations()
-    
-    # Trouver l'annotation originale
-    original_annotation = None
-    for ann in data["annotations"]:
-        if ann["id"] == original_annotation_id:
-            original_annotation = ann
-            break
-    
-    if not original_annotation:
-        raise ValueError(f"Annotation {original_annotation_id} non trouvée")
-    
     # Ajouter la couleur aux rectangles
     modifier_color = get_annotator_color(modifier_name)
     rectangles_with_color = []
@@ -329,26 +610,101 @@ def modify_annotation(original_annotation_id: int, modifier_name: str, new_recta
         rect_with_color["color"] = modifier_color
         rectangles_with_color.append(rect_with_color)
     
-    # Créer la nouvelle entrée de modification
-    new_id = data["metadata"]["next_id"]
-    modification_entry = {
-        "id": new_id,
-        "image": original_annotation["image"],
-        "annotator": modifier_name,
-        "timestamp": datetime.now().isoformat(),
-        "rectangles": rectangles_with_color,
-        "is_modification": True,
-        "modifies_annotation_id": original_annotation_id
-    }
-    
-    # Ajouter au fichier
-    data["annotations"].append(modification_entry)
-    data["metadata"]["next_id"] += 1
-    data["metadata"]["last_updated"] = datetime.now().isoformat()
-    
-    save_annotations(data)
+    with _store_transaction():
+        data = load_annotations()
+        
+        # Trouver l'annotation originale
+        original_annotation = None
+        for ann in data["annotations"]:
+            if ann["id"] == original_annotation_id:
+                original_annotation = ann
+                break
+        
+        if not original_annotation:
+            raise ValueError(f"Annotation {original_annotation_id} non trouvée")
+        _check_version(original_annotation, expected_version)
+        
+        # Créer la nouvelle entrée de modification
+        new_id = data["metadata"]["next_id"]
+        modification_entry = {
+            "id": new_id,
+            "image": original_annotation["image"],
+            "annotator": modifier_name,
+            "timestamp": datetime.now().isoformat(),
+            "version": 1,
+            "coord_space": COORD_SPACE,
+            "rectangles": rectangles_with_color,
+            "is_modification": True,
+            "modifies_annotation_id": original_annotation_id
+        }
+        
+        # L'originale change de version : une autre modification concurrente sera refusée
+        original_annotation["version"] = get_version(original_annotation) + 1
+        
+        # Ajouter au fichier
+        data["annotations"].append(modification_entry)
+        data["metadata"]["next_id"] += 1
+        data["metadata"]["last_updated"] = datetime.now().isoformat()
+        
+        save_annotations(data)
     return new_id
 
+def _legacy_review_count(annotation: Dict) -> int:
+    """Nombre de rectangles ajoutés depuis Review (toujours placés en fin de liste)."""
+    if annotation.get("is_modification"):
+        return len(annotation["rectangles"])
+    added = sum(entry.get("rectangles_added", 0) for entry in annotation.get("modification_history", []))
+    return min(added, len(annotation["rectangles"]))
+
+def migrate_canvas_coordinates() -> Dict[str, int]:
+    """
+    Migration unique du jeu actif : les rectangles des annotations sans "coord_space" sont
+    ramenés en pixels de l'image originale, puis l'annotation est marquée "coord_space": "original".
+
+    - rectangles dessinés dans Annotate : largeur originale / 800 ;
+    - rectangles ajoutés dans Review (les derniers de la liste, comptés par
+      modification_history) et entrées de modification : largeur originale / 500.
+
+    last_updated et la version de chaque annotation migrée changent : les rendus en cache
+    (navigateur et .previews) de l'ancienne géométrie ne sont plus servis, et une relecture
+    ouverte avant la migration est refusée comme toute modification concurrente.
+    Idempotente ; les annotations dont l'image est introuvable restent non marquées et
+    seront migrées à un prochain passage.
+
+    Returns:
+        {"migrated": n, "missing_image": n}
+    """
+    from services.previews import get_image_size
+    from utils.geometry import scale_rect
+
+    result = {"migrated": 0, "missing_image": 0}
+    with _store_transaction():
+        data = load_annotations()
+        now = datetime.now().isoformat()
+        for annotation in data["annotations"]:
+            if annotation.get("coord_space") == COORD_SPACE:
+                continue
+            try:
+                width, _ = get_image_size(os.path.join(images_dir(), annotation["image"]))
+            except OSError:
+                result["missing_image"] += 1
+                continue
+            rectangles = annotation["rectangles"]
+            split = len(rectangles) - _legacy_review_count(annotation)
+            annotate_factor = width / LEGACY_CANVAS_WIDTH
+            review_factor = width / LEGACY_REVIEW_CANVAS_WIDTH
+            annotation["rectangles"] = (
+                [scale_rect(rect, annotate_factor) for rect in rectangles[:split]]
+                + [scale_rect(rect, review_factor) for rect in rectangles[split:]]
+            )
+            annotation["coord_space"] = COORD_SPACE
+            annotation["last_updated"] = now
+            annotation["version"] = get_version(annotation) + 1
+            result["migrated"] += 1
+        if result["migrated"]:
+            save_annotations(data)
+    return result
+
 def get_annotation_with_modifications(annotation_id: int) -> Dict:
     """
     Récupère une annotation avec toutes ses modifications.
@@ -383,4 +739,15 @@ def get_annotation_with_modifications(annotation_id: int) -> Dict:
     return {
         "original": original,
         "modifications": modifications
-    }
\ No newline at end of file
+    }
+
+if __name__ == "__main__":
+    # python -m services.json_annotations [--dataset NOM] : migration des coordonnées
+    import argparse
+    from services.datasets import use_dataset, DEFAULT_DATASET
+
+    parser = argparse.ArgumentParser(description="Convertit les rectangles en espace canvas (800 px) en pixels de l'image originale")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="jeu de données (défaut : default)")
+    args = parser.parse_args()
+    with use_dataset(args.dataset):
+        print(f"Migration des coordonnées ({args.dataset}) : {migrate_canvas_coordinates()}")
\ No newline at end of file
@@ -0,0 +1,147 @@
+import gc
+import sys
+import time
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# États possibles d'un modèle dans le registre
+STATUS_UNLOADED = "non chargé"
+STATUS_LOADING = "chargement"
+STATUS_READY = "prêt"
+STATUS_ERROR = "erreur"
+
+class ModelRegistry:
+    """
+    Registre de modèles chargés à la demande.
+
+    Chaque modèle est déclaré avec une fonction de chargement ; il n'est chargé qu'au
+    premier ``get()``, peut être préchauffé dans un thread, et est déchargé s'il n'a
+    pas servi depuis ``idle_ttl`` secondes (``None`` : jamais).
+    """
+
+    def __init__(self, idle_ttl: Optional[float] = None, reap_interval: float = 60.0):
+        self.idle_ttl = idle_ttl
+        self.reap_interval = reap_interval
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._models: Dict[str, Any] = {}
+        self._last_used: Dict[str, float] = {}
+        self._status: Dict[str, str] = {}
+        self._errors: Dict[str, str] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    def register(self, name: str, loader: Callable[[], Any]):
+        """Déclare (ou remplace) le chargeur d'un modèle ; un modèle déjà chargé est déchargé."""
+        self.unload(name)
+        with self._lock:
+            self._loaders[name] = loader
+            self._locks.setdefault(name, threading.Lock())
+            self._status[name] = STATUS_UNLOADED
+            self._errors.pop(name, None)
+
+    def names(self):
+        return list(self._loaders)
+
+    def get(self, name: str) -> Any:
+        """Retourne le modèle, en le chargeant au premier appel."""
+        if name not in self._loaders:
+            raise KeyError(f"Modèle inconnu : {name}")
+        model = self._models.get(name)
+        if model is None:
+            with self._locks[name]:
+                model = self._models.get(name)
+                if model is None:
+                    model = self._load(name)
+        self._last_used[name] = time.monotonic()
+        self._ensure_reaper()
+        return model
+
+    def _load(self, name: str) -> Any:
+        self._status[name] = STATUS_LOADING
+        try:
+            model = self._loaders[name]()
+        except Exception as e:
+            self._status[name] = STATUS_ERROR
+            self._errors[name] = str(e)
+            raise
+        self._models[name] = model
+        self._status[name] = STATUS_READY
+        self._errors.pop(name, None)
+        print(f"Modèle '{name}' chargé")
+        return model
+
+    def warmup(self, names: Iterable[str] = None, background: bool = True) -> Optional[threading.Thread]:
+        """Charge les modèles (tous par défaut), dans un thread d'arrière-plan si demandé."""
+        names = list(names) if names is not None else self.names()
+
+        def _run():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"Préchauffage du modèle '{name}' impossible: {e}")
+
+        if not background:
+            _run()
+            return None
+        thread = threading.Thread(target=_run, name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def unload(self, name: str) -> bool:
+        """Décharge un modèle ; les appels en cours gardent leur référence jusqu'à la fin."""
+        if name not in self._locks:
+            return False
+        with self._locks[name]:
+            model = self._models.pop(name, None)
+            self._last_used.pop(name, None)
+            if model is None:
+                return False
+            self._status[name] = STATUS_UNLOADED
+        del model
+        gc.collect()
+        # Libérer aussi la mémoire GPU si torch est déjà importé
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        print(f"Modèle '{name}' déchargé")
+        return True
+
+    def evict_idle(self) -> list:
+        """Décharge les modèles inutilisés depuis plus de ``idle_ttl`` secondes."""
+        if self.idle_ttl is None:
+            return []
+        now = time.monotonic()
+        idle = [name for name, last in list(self._last_used.items()) if now - last > self.idle_ttl]
+        return [name for name in idle if self.unload(name)]
+
+    def _ensure_reaper(self):
+        if self.idle_ttl is None or self._reaper is not None:
+            return
+        with self._lock:
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap_loop, name="model-reaper", daemon=True)
+                self._reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(min(self.reap_interval, self.idle_ttl))
+            self.evict_idle()
+
+    def status(self) -> Dict[str, Dict]:
+        """État de chaque modèle : statut, secondes depuis la dernière utilisation, erreur éventuelle."""
+        now = time.monotonic()
+        result = {}
+        for name in self._loaders:
+            last = self._last_used.get(name)
+            result[name] = {
+                "status": self._status.get(name, STATUS_UNLOADED),
+                "idle_seconds": round(now - last) if last is not None else None,
+                "error": self._errors.get(name),
+            }
+        return result
+
+    def is_ready(self, names: Iterable[str] = None) -> bool:
+        names = list(names) if names is not None else self.names()
+        return all(self._status.get(name) == STATUS_READY for name in names)
@@ -0,0 +1,215 @@
+"""
+Pré-annotation automatique : le détecteur de voitures propose des rectangles pour toutes
+les images du jeu de données encore sans annotation. Les propositions sont enregistrées sous
+l'annotateur réservé "model" (score dans chaque rectangle) ; les annotateurs corrigent
+ensuite ces boîtes au lieu de les dessiner.
+
+    python -m services.preannotate --batch-size 8 --threshold 0.5
+    python -m services.preannotate --dataset parking-2025
+
+Le traitement reprend là où il s'était arrêté (fichier de reprise + images déjà annotées
+ignorées), il peut donc être interrompu et relancé sans doublons. Les images illisibles sont
+notées à part et ne sont retentées qu'avec --retry-failed.
+"""
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+from PIL import Image
+from services.json_annotations import (
+    MODEL_ANNOTATOR, images_dir, list_images, get_index, add_annotations_bulk
+)
+from services.datasets import DEFAULT_DATASET, current_dataset, use_dataset
+
+PREANNOTATE_BATCH_SIZE = 8
+PREANNOTATE_THRESHOLD = 0.5
+# Fichier de reprise, dans le dossier du jeu de données : une ligne JSON ajoutée par écriture
+# ({"processed": [...], "failed": [...]}), jamais réécrit en entier
+CHECKPOINT_NAME = "preannotate_checkpoint.json"
+# Les annotations et le point de reprise sont écrits tous les N lots ou toutes les T secondes
+# (chaque écriture réécrit annotations.json : une écriture par lot coûterait O(N²))
+FLUSH_EVERY_BATCHES = 25
+FLUSH_EVERY_SECONDS = 30.0
+# Décodage des images du lot suivant pendant l'inférence du lot courant
+DECODE_WORKERS = 4
+
+def default_checkpoint_path() -> str:
+    return os.path.join(current_dataset().data_dir, CHECKPOINT_NAME)
+
+def load_checkpoint(path: str = None) -> Tuple[Set[str], Set[str]]:
+    """(images traitées, avec ou sans voiture détectée ; images illisibles)."""
+    path = path or default_checkpoint_path()
+    processed, failed = set(), set()
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # dernière ligne tronquée par une interruption
+                processed.update(entry.get("processed", []))
+                failed.update(entry.get("failed", []))
+    except FileNotFoundError:
+        pass
+    return processed, failed - processed
+
+def append_checkpoint(processed: List[str], failed: List[str] = (), path: str = None):
+    """Ajoute une ligne au fichier de reprise (coût proportionnel aux nouvelles images seulement)."""
+    if not processed and not failed:
+        return
+    path = path or default_checkpoint_path()
+    entry = {"processed": processed, "failed": list(failed), "updated": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+
+def pending_images(processed: Set[str], failed: Set[str] = frozenset()) -> List[str]:
+    """Images sans aucune annotation, absentes du fichier de reprise et non marquées illisibles."""
+    annotated = get_index().by_image
+    return [name for name in list_images()
+            if name not in annotated and name not in processed and name not in failed]
+
+def decode_image(name: str, max_side: int, root: str = None) -> Tuple[str, Optional[Image.Image], Tuple[int, int]]:
+    """
+    Décode une image en laissant le décodeur JPEG réduire d'un facteur 2^n tant que
+    l'image reste plus grande que ce que le détecteur utilisera. Retourne (nom, image, taille originale).
+    """
+    try:
+        with Image.open(os.path.join(root or images_dir(), name)) as img:
+            original_size = img.size
+            img.draft("RGB", (max_side, max_side))
+            return name, img.convert("RGB"), original_size
+    except Exception as e:
+        print(f"Image illisible {name}: {e}")
+        return name, None, (0, 0)
+
+def detections_to_rectangles(detections: List[Dict], decoded_size, original_size) -> List[Dict]:
+    """Boîtes (x1, y1, x2, y2) de l'image décodée -> rectangles en pixels de l'image originale."""
+    fx = original_size[0] / decoded_size[0]
+    fy = original_size[1] / decoded_size[1]
+    rectangles = []
+    for d in detections:
+        x1, y1, x2, y2 = d["box"]
+        rectangles.append({
+            "x": round(x1 * fx),
+            "y": round(y1 * fy),
+            "width": round((x2 - x1) * fx),
+            "height": round((y2 - y1) * fy),
+            "label": d["label"],
+            "score": round(d["score"], 3),
+        })
+    return rectangles
+
+def run(batch_size: int = PREANNOTATE_BATCH_SIZE, threshold: float = PREANNOTATE_THRESHOLD,
+        limit: int = None, checkpoint_path: str = None, retry_failed: bool = False) -> Dict[str, int]:
+    """
+    Traite les images en attente par mini-lots. Les résultats sont écrits par groupes de lots
+    (FLUSH_EVERY_BATCHES / FLUSH_EVERY_SECONDS), et une dernière fois en cas d'interruption.
+    """
+    from services import inference  # pile ML, importée seulement pour le traitement
+
+    checkpoint_path = checkpoint_path or default_checkpoint_path()
+    processed, failed = load_checkpoint(checkpoint_path)
+    if failed and not retry_failed:
+        print(f"{len(failed)} image(s) illisible(s) lors d'un passage précédent ignorée(s) (--retry-failed)")
+    names = pending_images(processed, set() if retry_failed else failed)
+    if limit:
+        names = names[:limit]
+    total = len(names)
+    print(f"{total} image(s) à pré-annoter (annotateur '{MODEL_ANNOTATOR}', seuil {threshold})")
+    if not total:
+        return {"images": 0, "annotated": 0, "boxes": 0, "failed": 0}
+
+    model_id = f"{inference.CAR_MODEL_ID}/{inference.INFERENCE_BACKEND}"
+    batches = [names[i:i + batch_size] for i in range(0, total, batch_size)]
+    stats = {"images": 0, "annotated": 0, "boxes": 0, "failed": 0}
+    # Résultats pas encore écrits
+    entries, done, unreadable = [], [], []
+
+    def flush():
+        # Annotations puis point de reprise : une interruption entre les deux ne crée pas
+        # de doublon, les images annotées étant ignorées à la relance.
+        # Images annotées par quelqu'un pendant le traitement : proposition abandonnée.
+        annotated = get_index().by_image
+        stale = [e for e in entries if e["image"] in annotated]
+        if stale:
+            print(f"{len(stale)} image(s) annotée(s) entre-temps, proposition(s) abandonnée(s)")
+            stats["annotated"] -= len(stale)
+            stats["boxes"] -= sum(len(e["rectangles"]) for e in stale)
+        add_annotations_bulk([e for e in entries if e["image"] not in annotated])
+        append_checkpoint(done, unreadable, checkpoint_path)
+        entries.clear()
+        done.clear()
+        unreadable.clear()
+
+    start = last_flush = time.perf_counter()
+    root = images_dir()  # résolu ici : les threads de décodage n'héritent pas du jeu actif
+    with ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix="preannotate-decode") as pool:
+        def decode(batch):
+            return pool.map(lambda name: decode_image(name, inference.DETECTOR_MAX_SIDE, root), batch)
+
+        upcoming = decode(batches[0])
+        try:
+            for i in range(len(batches)):
+                results = list(upcoming)
+                if i + 1 < len(batches):
+                    upcoming = decode(batches[i + 1])
+                decoded = [r for r in results if r[1] is not None]
+
+                all_detections = inference.run_inference_cars([img for _, img, _ in decoded], threshold, cached=False)
+                annotated = 0
+                for (name, img, original_size), detections in zip(decoded, all_detections):
+                    if detections:
+                        rectangles = detections_to_rectangles(detections, img.size, original_size)
+                        entries.append({
+                            "image": name,
+                            "annotator": MODEL_ANNOTATOR,
+                            "rectangles": rectangles,
+                            "model": model_id,
+                            "score_threshold": threshold,
+                        })
+                        annotated += 1
+                        stats["boxes"] += len(rectangles)
+                    done.append(name)
+                # Images illisibles : notées à part, retentées avec --retry-failed
+                unreadable.extend(name for name, img, _ in results if img is None)
+
+                stats["images"] += len(batches[i])
+                stats["annotated"] += annotated
+                stats["failed"] += len(results) - len(decoded)
+                if (i + 1) % FLUSH_EVERY_BATCHES == 0 or time.perf_counter() - last_flush >= FLUSH_EVERY_SECONDS:
+                    flush()
+                    last_flush = time.perf_counter()
+
+                elapsed = time.perf_counter() - start
+                rate = stats["images"] / elapsed if elapsed else 0.0
+                eta = (total - stats["images"]) / rate if rate else 0.0
+                print(f"[{stats['images']}/{total}] {stats['annotated']} image(s) annotée(s), "
+                      f"{stats['boxes']} boîte(s), {stats['failed']} illisible(s) — "
+                      f"{rate:.2f} img/s, reste ~{eta / 60:.0f} min")
+        finally:
+            # Fin du traitement ou interruption : rien de ce qui a été calculé n'est perdu
+            flush()
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=PREANNOTATE_BATCH_SIZE)
+    parser.add_argument("--threshold", type=float, default=PREANNOTATE_THRESHOLD)
+    parser.add_argument("--limit", type=int, default=None, help="nombre maximal d'images à traiter")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="jeu de données (services/datasets.py)")
+    parser.add_argument("--checkpoint", help=f"fichier de reprise (défaut : <jeu>/{CHECKPOINT_NAME})")
+    parser.add_argument("--reset", action="store_true", help="ignore le fichier de reprise existant")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="retente les images illisibles lors des passages précédents")
+    args = parser.parse_args(argv)
+
+    with use_dataset(args.dataset):
+        checkpoint = args.checkpoint or default_checkpoint_path()
+        if args.reset and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        run(args.batch_size, args.threshold, args.limit, checkpoint, args.retry_failed)
+
+if __name__ == "__main__":
+    main()
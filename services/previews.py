@@ -0,0 +1,228 @@
+import io
+import os
+import base64
+import time
+import hashlib
+import threading
+from typing import Dict, List, Tuple
+from PIL import Image, ImageDraw, features
+
+# Cache disque des dérivés (miniatures) des images, clé = fichier source + mtime + taille cible
+PREVIEW_CACHE_DIR = os.environ.get("TURVOI_PREVIEW_DIR", ".previews")
+# "JPEG" par défaut, "WEBP" si Pillow le supporte
+PREVIEW_FORMAT = os.environ.get("TURVOI_PREVIEW_FORMAT", "JPEG").upper()
+PREVIEW_QUALITY = 85
+RENDER_JPEG_QUALITY = 85
+# Taille maximale du cache disque (dérivés + rendus, en Mo). Au-delà, les fichiers les moins
+# récemment utilisés sont supprimés jusqu'à PREVIEW_CACHE_LOW_WATER de la limite.
+PREVIEW_CACHE_MAX_BYTES = int(float(os.environ.get("TURVOI_PREVIEW_MAX_MB", "2048")) * 1024 * 1024)
+PREVIEW_CACHE_LOW_WATER = 0.8
+# LRU approché : le mtime d'un fichier relu depuis le cache est rafraîchi au plus une fois par heure
+PREVIEW_TOUCH_INTERVAL = 3600
+# La taille du cache est vérifiée (en tâche de fond) chaque fois que le processus a écrit 5 % de la limite
+PREVIEW_EVICT_CHECK_BYTES = max(1, PREVIEW_CACHE_MAX_BYTES // 20)
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+EXTENSIONS = {"JPEG": ".jpg", "WEBP": ".webp"}
+
+_size_lock = threading.Lock()
+_size_cache = {}
+_evict_lock = threading.Lock()
+_written_since_check = 0
+_evicting = False
+
+def _resolve_format(fmt: str = None) -> str:
+    fmt = (fmt or PREVIEW_FORMAT).upper()
+    if fmt == "WEBP" and not features.check("webp"):
+        return "JPEG"
+    return fmt if fmt in MIME_TYPES else "JPEG"
+
+def get_image_size(image_path: str) -> Tuple[int, int]:
+    """Taille (largeur, hauteur) de l'image originale, lue dans l'en-tête et mise en cache."""
+    st = os.stat(image_path)
+    key = (os.path.abspath(image_path), st.st_mtime_ns)
+    with _size_lock:
+        size = _size_cache.get(key)
+    if size is None:
+        with Image.open(image_path) as img:
+            size = img.size
+        with _size_lock:
+            _size_cache[key] = size
+    return size
+
+def _cache_hit(path: str) -> bool:
+    """True si ``path`` est en cache ; marque l'accès pour l'éviction LRU."""
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return False
+    if time.time() - mtime > PREVIEW_TOUCH_INTERVAL:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+    return True
+
+def _cache_stored(path: str):
+    """Comptabilise un fichier ajouté au cache et lance l'éviction quand le seuil est atteint."""
+    global _written_since_check, _evicting
+    with _evict_lock:
+        _written_since_check += os.path.getsize(path)
+        if _evicting or _written_since_check < PREVIEW_EVICT_CHECK_BYTES:
+            return
+        _written_since_check, _evicting = 0, True
+    threading.Thread(target=_evict_in_background, daemon=True).start()
+
+def _evict_in_background():
+    global _evicting
+    try:
+        removed = evict_preview_cache()
+        if removed:
+            print(f"Cache des dérivés : {removed} fichiers supprimés")
+    except Exception as e:
+        print(f"Erreur lors de l'éviction du cache des dérivés: {e}")
+    finally:
+        with _evict_lock:
+            _evicting = False
+
+def evict_preview_cache(max_bytes: int = None) -> int:
+    """
+    Ramène le cache disque sous ``max_bytes`` en supprimant les fichiers les moins
+    récemment utilisés (mtime). Retourne le nombre de fichiers supprimés.
+    """
+    max_bytes = PREVIEW_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries, total = [], 0
+    for dirpath, _, filenames in os.walk(PREVIEW_CACHE_DIR):
+        for name in filenames:
+            if name.endswith(".tmp"):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+    if total <= max_bytes:
+        return 0
+    entries.sort()
+    target, removed = max_bytes * PREVIEW_CACHE_LOW_WATER, 0
+    for _, size, path in entries:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        total -= size
+    return removed
+
+def preview_size(original_size: Tuple[int, int], box: Tuple[int, int], scale: int = 1) -> Tuple[int, int]:
+    """Taille du dérivé : l'image tient dans ``box * scale`` sans jamais être agrandie."""
+    ow, oh = original_size
+    bw, bh = box[0] * scale, box[1] * scale
+    ratio = min(bw / ow, bh / oh, 1.0)
+    return max(1, round(ow * ratio)), max(1, round(oh * ratio))
+
+def get_preview_path(image_path: str, box: Tuple[int, int], scale: int = 1, fmt: str = None) -> str:
+    """
+    Retourne le chemin du dérivé de ``image_path`` adapté au canvas ``box`` (x ``scale``).
+    Le dérivé est généré au premier accès puis réutilisé tant que la source n'a pas changé.
+    """
+    fmt = _resolve_format(fmt)
+    st = os.stat(image_path)
+    target = preview_size(get_image_size(image_path), box, scale)
+    key = hashlib.sha1(
+        f"{os.path.abspath(image_path)}|{st.st_mtime_ns}|{st.st_size}|{target[0]}x{target[1]}|{fmt}".encode()
+    ).hexdigest()
+    path = os.path.join(PREVIEW_CACHE_DIR, key[:2], key + EXTENSIONS[fmt])
+    if _cache_hit(path):
+        return path
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with Image.open(image_path) as img:
+        # draft() laisse le décodeur JPEG réduire l'image pendant la lecture
+        img.draft("RGB", target)
+        img = img.convert("RGB")
+        img.thumbnail(target, Image.LANCZOS)
+        # Écriture atomique : plusieurs workers peuvent générer le même dérivé
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        img.save(tmp_path, format=fmt, quality=PREVIEW_QUALITY)
+    os.replace(tmp_path, path)
+    _cache_stored(path)
+    return path
+
+def _hex_to_rgb(color):
+    """Convertit une couleur hex (#RRGGBB) en tuple RGB, rouge par défaut."""
+    if isinstance(color, str) and color.startswith('#') and len(color) >= 7:
+        try:
+            return tuple(int(color[i:i+2], 16) for i in (1, 3, 5))
+        except ValueError:
+            pass
+    return (255, 0, 0)
+
+def render_rectangles(image_path: str, rectangles: List[Dict], color: str,
+                      box: Tuple[int, int], scale: int = 1) -> bytes:
+    """Dessine tous les rectangles sur un seul calque puis compose une seule fois.
+
+    Le rendu se fait sur le dérivé à la taille du canvas ; les rectangles (en pixels
+    de l'image originale) sont ramenés à cette échelle.
+    """
+    img = Image.open(get_preview_path(image_path, box, scale)).convert("RGBA")
+    factor = img.size[0] / get_image_size(image_path)[0]
+    rgb_color = _hex_to_rgb(color)
+    boxes = [[r["x"] * factor, r["y"] * factor, (r["x"] + r["width"]) * factor, (r["y"] + r["height"]) * factor]
+             for r in rectangles]
+
+    # Un seul calque pour tous les remplissages semi-transparents
+    overlay = Image.new('RGBA', img.size, (0, 0, 0, 0))
+    overlay_draw = ImageDraw.Draw(overlay)
+    for b in boxes:
+        overlay_draw.rectangle(b, fill=rgb_color + (50,))
+    img = Image.alpha_composite(img, overlay).convert('RGB')
+
+    # Contours opaques dessinés directement sur le résultat
+    draw = ImageDraw.Draw(img)
+    for b in boxes:
+        draw.rectangle(b, outline=rgb_color, width=3)
+
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=RENDER_JPEG_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+def get_render_path(image_path: str, rectangles: List[Dict], color: str, box: Tuple[int, int],
+                    scale: int = 1, version: Tuple = ()) -> str:
+    """
+    Chemin du rendu composite (dérivé + rectangles) en cache disque.
+    ``version`` identifie l'état de l'annotation, ex. (id annotation, last_updated).
+    """
+    st = os.stat(image_path)
+    key = hashlib.sha1(
+        f"{os.path.abspath(image_path)}|{st.st_mtime_ns}|{box[0]}x{box[1]}@{scale}|{color}|{version!r}".encode()
+    ).hexdigest()
+    path = os.path.join(PREVIEW_CACHE_DIR, "renders", key[:2], key + ".jpg")
+    if _cache_hit(path):
+        return path
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(render_rectangles(image_path, rectangles, color, box, scale))
+    os.replace(tmp_path, path)
+    _cache_stored(path)
+    return path
+
+def preview_data_url(image_path: str, box: Tuple[int, int], scale: int = 1, fmt: str = None) -> str:
+    """Data URL base64 du dérivé adapté au canvas."""
+    fmt = _resolve_format(fmt)
+    with open(get_preview_path(image_path, box, scale, fmt), "rb") as f:
+        encoded = base64.b64encode(f.read()).decode("utf-8")
+    return f"data:{MIME_TYPES[fmt]};base64,{encoded}"
+
+def canvas_to_original_factor(image_path: str, canvas_width: int) -> float:
+    """
+    Facteur canvas -> pixels originaux. DashCanvas ajuste l'image de fond à la largeur
+    du canvas, quelle que soit la taille du dérivé affiché.
+    """
+    return get_image_size(image_path)[0] / float(canvas_width)
@@ -0,0 +1,204 @@
+"""
+Mode vidéo de "Le Futur" : le détecteur ne tourne que sur les images clés ; entre deux,
+les boîtes sont propagées par flux optique (Lucas-Kanade sur quelques points par boîte).
+Les détections sont associées en pistes par IoU ; plaque et marque ne sont calculées
+qu'une fois par piste, à sa création.
+
+    python -m services.video clip.mp4 --keyframe-interval 10 --output detections.jsonl
+
+Chaque image produit un dict au format de ``inference.analyze_images`` (detections,
+plate_infos, brand_infos, image_size) complété par frame, time, keyframe et track_id.
+"""
+import sys
+import json
+import argparse
+from typing import Dict, Iterator, List, Optional
+import numpy as np
+import cv2
+from PIL import Image
+from utils.geometry import iou
+
+KEYFRAME_INTERVAL = 10
+VIDEO_SCORE_THRESHOLD = 0.6
+# IoU minimale entre une piste propagée et une détection pour les associer
+TRACK_IOU_THRESHOLD = 0.3
+# Nombre d'images clés sans association avant de supprimer une piste
+TRACK_MAX_MISSES = 2
+# Le flux optique est calculé sur une version réduite de l'image
+FLOW_MAX_SIDE = 480
+FLOW_MAX_POINTS = 20
+
+class Track:
+    def __init__(self, track_id: int, detection: Dict):
+        self.track_id = track_id
+        self.box = list(detection["box"])
+        self.label = detection["label"]
+        self.score = detection["score"]
+        self.misses = 0
+        self.plate_info = None   # plaque relative à la boîte, en fractions (suit la boîte)
+        self.brand_info = None
+
+class IoUTracker:
+    """Association glouton par IoU décroissante entre pistes propagées et détections."""
+
+    def __init__(self, iou_threshold: float = TRACK_IOU_THRESHOLD, max_misses: int = TRACK_MAX_MISSES):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.tracks: List[Track] = []
+        self._next_id = 1
+
+    def update(self, detections: List[Dict]) -> List[Track]:
+        """Met à jour les pistes avec les détections d'une image clé ; retourne les nouvelles pistes."""
+        pairs = sorted(
+            ((iou(t.box, d["box"]), ti, di) for ti, t in enumerate(self.tracks) for di, d in enumerate(detections)),
+            reverse=True
+        )
+        used_tracks, used_dets = set(), set()
+        for value, ti, di in pairs:
+            if value < self.iou_threshold:
+                break
+            if ti in used_tracks or di in used_dets:
+                continue
+            track, det = self.tracks[ti], detections[di]
+            track.box, track.score, track.misses = list(det["box"]), det["score"], 0
+            used_tracks.add(ti)
+            used_dets.add(di)
+
+        for ti, track in enumerate(self.tracks):
+            if ti not in used_tracks:
+                track.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+        new_tracks = []
+        for di, det in enumerate(detections):
+            if di not in used_dets:
+                track = Track(self._next_id, det)
+                self._next_id += 1
+                self.tracks.append(track)
+                new_tracks.append(track)
+        return new_tracks
+
+def _flow_frame(frame_bgr, scale: float):
+    gray = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY)
+    if scale != 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return gray
+
+def propagate_boxes(tracks: List[Track], prev_gray, gray, scale: float, frame_size):
+    """Déplace chaque boîte du déplacement médian de ses points suivis (Lucas-Kanade)."""
+    width, height = frame_size
+    for track in tracks:
+        x1, y1, x2, y2 = (int(v * scale) for v in track.box)
+        x1, y1 = max(0, x1), max(0, y1)
+        roi = prev_gray[y1:y2, x1:x2]
+        if roi.size == 0:
+            continue
+        points = cv2.goodFeaturesToTrack(roi, maxCorners=FLOW_MAX_POINTS, qualityLevel=0.01, minDistance=5)
+        if points is None:
+            continue
+        points = points + np.array([x1, y1], dtype=np.float32)
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, points, None)
+        ok = status.ravel() == 1
+        if not ok.any():
+            continue
+        dx, dy = np.median((moved - points).reshape(-1, 2)[ok], axis=0) / scale
+        bx1, by1, bx2, by2 = track.box
+        track.box = [min(max(bx1 + dx, 0.0), width), min(max(by1 + dy, 0.0), height),
+                     min(max(bx2 + dx, 0.0), width), min(max(by2 + dy, 0.0), height)]
+
+def _relative_plate(plate_info: Optional[Dict], car_box) -> Optional[Dict]:
+    """Boîte de plaque (relative au découpage de la voiture) -> fractions de la boîte voiture."""
+    if not plate_info or not plate_info.get("plate_box"):
+        return plate_info
+    w = max(1.0, car_box[2] - car_box[0])
+    h = max(1.0, car_box[3] - car_box[1])
+    px1, py1, px2, py2 = plate_info["plate_box"]
+    return dict(plate_info, plate_box=[px1 / w, py1 / h, px2 / w, py2 / h])
+
+def _absolute_plate(plate_info: Optional[Dict], car_box) -> Optional[Dict]:
+    if not plate_info or not plate_info.get("plate_box"):
+        return plate_info
+    w, h = car_box[2] - car_box[0], car_box[3] - car_box[1]
+    fx1, fy1, fx2, fy2 = plate_info["plate_box"]
+    return dict(plate_info, plate_box=[round(fx1 * w), round(fy1 * h), round(fx2 * w), round(fy2 * h)])
+
+def analyze_video(path: str, keyframe_interval: int = KEYFRAME_INTERVAL,
+                  score_threshold: float = VIDEO_SCORE_THRESHOLD, max_frames: int = None) -> Iterator[Dict]:
+    """Générateur : une entrée par image de la vidéo, produite au fil de la lecture."""
+    if keyframe_interval < 1:
+        raise ValueError(f"keyframe_interval doit être >= 1 (reçu : {keyframe_interval})")
+    from services import inference  # pile ML, importée au premier usage
+
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Vidéo illisible : {path}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    tracker = IoUTracker()
+    prev_gray, scale = None, 1.0
+    frame_index = 0
+    try:
+        while max_frames is None or frame_index < max_frames:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            height, width = frame.shape[:2]
+            if prev_gray is None:
+                scale = min(1.0, FLOW_MAX_SIDE / max(width, height))
+            gray = _flow_frame(frame, scale)
+            keyframe = frame_index % keyframe_interval == 0
+
+            if prev_gray is not None and tracker.tracks:
+                propagate_boxes(tracker.tracks, prev_gray, gray, scale, (width, height))
+            if keyframe:
+                pil = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                detections = inference.run_inference_cars([pil], score_threshold, cached=False)[0]
+                new_tracks = tracker.update(detections)
+                if new_tracks:
+                    # Plaque et marque : une seule fois par piste, en lot pour les nouvelles pistes.
+                    # Sans le cache de résultats : ces recadrages ne reviendront pas et
+                    # évinceraient les entrées utiles de l'application.
+                    crops = inference.crop_detections(pil, [{"box": t.box} for t in new_tracks])
+                    plate_infos = inference._detect_plates(crops)
+                    brand_infos = inference._classify_brands(crops)
+                    for track, plate_info, brand_info in zip(new_tracks, plate_infos, brand_infos):
+                        track.plate_info = _relative_plate(plate_info, track.box)
+                        track.brand_info = brand_info
+            prev_gray = gray
+
+            # Pistes non associées sur la dernière image clé : propagées mais non affichées
+            visible = [t for t in tracker.tracks if t.misses == 0]
+            yield {
+                "frame": frame_index,
+                "time": frame_index / fps,
+                "keyframe": keyframe,
+                "image_size": [width, height],
+                "detections": [{"track_id": t.track_id, "box": [round(v, 1) for v in t.box],
+                                "label": t.label, "score": t.score} for t in visible],
+                "plate_infos": [_absolute_plate(t.plate_info, t.box) for t in visible],
+                "brand_infos": [t.brand_info for t in visible],
+            }
+            frame_index += 1
+    finally:
+        capture.release()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video")
+    parser.add_argument("--keyframe-interval", type=int, default=KEYFRAME_INTERVAL)
+    parser.add_argument("--threshold", type=float, default=VIDEO_SCORE_THRESHOLD)
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--output", help="fichier JSON lines (défaut : sortie standard)")
+    args = parser.parse_args(argv)
+    if args.keyframe_interval < 1:
+        parser.error("--keyframe-interval doit être >= 1")
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for frame_result in analyze_video(args.video, args.keyframe_interval, args.threshold, args.max_frames):
+            out.write(json.dumps(frame_result) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == "__main__":
+    main()
@@ -34,3 +34,11 @@ def greedy_match_iou(set_a: List[Tuple[float, float, float, float]],
             total += best
             matches += 1
     return (total / matches) if matches else 0.0
+
+def scale_rect(rect: dict, factor: float) -> dict:
+    """Multiplie x, y, width, height d'un rectangle par ``factor`` (autres clés conservées)."""
+    scaled = dict(rect)
+    for key in ("x", "y", "width", "height"):
+        if key in scaled:
+            scaled[key] = round(scaled[key] * factor)
+    return scaled